@@ -4,17 +4,32 @@ from aiosend.types import Invoice
 from aiosend.webhook import AiohttpManager
 import logging
 from keyboards.user_keyboards import back_kb
-from database.req import InvoiceRequests, UserRequests, ReferralLinkRequests
+from database.req import INVOICE_TTL, InvoiceRequests, UserRequests, ReferralLinkRequests
 from config.locale import Locale
 from config.dotenv import EnvConfig
 from decimal import Decimal
+from typing import Optional
+from services.analytics import referral_payout, topup
+from services.locale_loader import LocaleLoader
+from services.outbox import send_message
 
 logger = logging.getLogger("__name__")
 
 
 class CryptoBotWebhook:
-    def __init__(self, token: str, currency: str, bot):
+    def __init__(
+        self,
+        token: str,
+        currency: str,
+        bot,
+        network=TESTNET,
+        locale_loader: Optional[LocaleLoader] = None,
+        outbox=None,
+    ):
         self.app = Application()
+        # OutboxWorker, woken after a referral notice is queued
+        self.outbox = outbox
+        self.locale_loader = locale_loader or LocaleLoader()
         self.currency = currency
         self.env = EnvConfig()
         if self.currency == "RUB":
@@ -25,7 +40,7 @@ class CryptoBotWebhook:
         self.cp = CryptoPay(
             token,
             webhook_manager=AiohttpManager(self.app, self.env.get_cryptobot_secret()),
-            network=TESTNET,
+            network=network,
         )
         self._setup_handlers()
         logger.info("cryptobot setup ended")
@@ -43,15 +58,16 @@ class CryptoBotWebhook:
             f"Received {invoice.amount} {invoice.fiat} by user:{user_id},tgid={tg_id}"
         )
         amount = invoice.amount
-        user = await UserRequests().get_user_by_id(user_id)
-        lang = user.locale
+        balance = await self._update_data(user_id, invoice, amount)
+        lang = await self.locale_loader.load(tg_id)
         locale = Locale(lang)
-        await self.bot.send_message(
-            chat_id=tg_id,
-            text=f"{locale.get('success_message')}\n+{amount}{self.myfiat}",
-            reply_markup=back_kb(locale),
-        )
-        await self._update_data(user_id, invoice, amount)
+        # told only once the invoice was settled, a repeated or unmatched
+        # webhook must not look like a second credit
+        if balance is None:
+            text = locale.get("topup_not_applied")
+        else:
+            text = f"{locale.get('success_message')}\n+{amount}{self.myfiat}"
+        await self.bot.send_message(chat_id=tg_id, text=text, reply_markup=back_kb(locale))
 
     async def create_invoice(self, amount: float, locale, bot_username, user_id, tg_id):
         invoice = await self.cp.create_invoice(
@@ -61,7 +77,7 @@ class CryptoBotWebhook:
             paid_btn_name="callback",
             paid_btn_url=bot_username,
             accepted_assets=["USDT", "TON"],
-            expires_in=3600,
+            expires_in=int(INVOICE_TTL.total_seconds()),
             payload=f"{user_id}_{tg_id}",
         )
         logger.info(f"invoice link: {invoice.bot_invoice_url}")
@@ -70,44 +86,50 @@ class CryptoBotWebhook:
     async def run(self):
         await run_app(self.app)
 
-    async def _update_data(self, user_id, invoice, amount):
+    async def _update_data(self, user_id, invoice, amount) -> Optional[Decimal]:
         try:
-            invreq = InvoiceRequests()
             usrreq = UserRequests()
             refreq = ReferralLinkRequests()
             env = EnvConfig()
 
-            user = await usrreq.get_user_by_id(user_id=user_id)
-            balance = float(user.balance)
-
-            referral = await refreq.get_referral_link_by_user_id(user.id)
+            amount = Decimal(str(amount))
+            rollups = [topup("cryptobot", amount)]
+            referral = await refreq.get_referral_link_by_user_id(user_id)
+            owner, fee, outbox = None, None, []
             if referral:
-                ownref = await refreq.get_referral_link_by_user_id(user_id=user_id)
-                ownid = ownref.owner_id
                 percent = env.get_ref_percent()
-
-                usid = await usrreq.get_user_by_id(ownid)
-                ownref_tgid = usid.telegram_id
-                user_lang = usid.locale
-                locale = Locale(user_lang)
-
-                referre_fee = usid.balance + Decimal(str(percent / 100 * amount))
-                logger.info(f"{percent},{percent / 100},{percent / 100 * amount}")
-
-                await usrreq.update_user(
-                    user_id=ownid, balance=usid.balance + referre_fee
-                )
-                await self.bot.send_message(
-                    chat_id=ownref_tgid,
-                    text=f"{locale.get('percent_by_referral')}{percent}{self.myfiat}",
-                )
-                logger.info(
-                    f"referral bonus payed from {user.id},@{user.username} in {percent / 100 * amount} value"
+                owner = await usrreq.get_user_by_id(referral.owner_id)
+                fee = (Decimal(str(percent)) * amount / 100).quantize(Decimal("0.01"))
+                rollups.append(referral_payout(fee))
+            if owner:
+                locale = Locale(owner.locale)
+                outbox.append(
+                    send_message(
+                        owner.telegram_id,
+                        f"{locale.get('percent_by_referral')}{fee}{self.myfiat}",
+                    )
                 )
 
-            await invreq.update_invoice(invoice_id=invoice.invoice_id, status="payed")
-            await usrreq.update_user(user_id=user_id, balance=balance + amount)
+            balance = await InvoiceRequests.settle_topup(
+                user_id,
+                "cryptobot",
+                amount,
+                referral=(owner.id, fee) if owner else None,
+                rollups=rollups,
+                outbox=outbox,
+            )
+            if balance is None:
+                logger.error(
+                    f"topup of {amount} for user {user_id} not applied: "
+                    f"no pending invoice or no such user"
+                )
+                return None
+            logger.info(f"user ballance sucessfuly updated:{balance}")
+            if owner:
+                if self.outbox:
+                    self.outbox.wake()
+                logger.info(f"referral bonus payed from {user_id} in {fee} value")
+            return balance
         except Exception as e:
             logger.error(e)
-            pass
-        logger.info(f"user ballance sucessfuly updated:{balance + amount}")
+            return None
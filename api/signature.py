@@ -0,0 +1,92 @@
+import hashlib
+import hmac
+import logging
+from typing import Dict, Optional
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BODY_SIZE = 256 * 1024
+
+
+class HmacSignature:
+    def __init__(self, header: str, secret: Optional[str]):
+        self.header = header
+        self.configured = bool(secret)
+        self._mac = hmac.new(self._key(secret or ""), digestmod=hashlib.sha256)
+
+    @staticmethod
+    def _key(secret: str) -> bytes:
+        return secret.encode("utf-8")
+
+    def verify(self, body: bytes, headers) -> bool:
+        signature = headers.get(self.header)
+        if not self.configured or not signature:
+            return False
+        mac = self._mac.copy()
+        mac.update(body)
+        return hmac.compare_digest(mac.hexdigest(), signature)
+
+
+class CryptoPaySignature(HmacSignature):
+    # Crypto Pay keys the HMAC with sha256(api token) instead of the token itself
+    @staticmethod
+    def _key(secret: str) -> bytes:
+        return hashlib.sha256(secret.encode("utf-8")).digest()
+
+
+class SecretToken:
+    def __init__(self, header: str, secret: Optional[str]):
+        self.header = header
+        self.configured = bool(secret)
+        self._secret = (secret or "").encode("utf-8")
+
+    def verify(self, body: bytes, headers) -> bool:
+        token = headers.get(self.header)
+        if not self.configured or not token:
+            return False
+        return hmac.compare_digest(token.encode("utf-8"), self._secret)
+
+
+SCHEMES = {
+    "hmac-sha256": HmacSignature,
+    "cryptopay": CryptoPaySignature,
+    "secret-token": SecretToken,
+}
+
+
+def build_scheme(name: str, header: str, secret: Optional[str]):
+    return SCHEMES[name](header, secret)
+
+
+def _reject(status: int, reason: str) -> web.Response:
+    return web.json_response({"status": "error", "reason": reason}, status=status)
+
+
+def signature_middleware(routes: Dict[str, object], max_body_size: int = DEFAULT_MAX_BODY_SIZE):
+    for path, scheme in routes.items():
+        if not scheme.configured:
+            logger.warning(f"no secret configured for {path}, all requests will be rejected")
+
+    @web.middleware
+    async def middleware(request: web.Request, handler):
+        scheme = routes.get(request.path)
+        if scheme is None:
+            return await handler(request)
+
+        if request.content_length is not None and request.content_length > max_body_size:
+            return _reject(413, "body_too_large")
+        try:
+            # cached by aiohttp, so handlers get the same bytes from request.read()
+            body = await request.read()
+        except web.HTTPRequestEntityTooLarge:
+            return _reject(413, "body_too_large")
+
+        if not scheme.verify(body, request.headers):
+            logger.warning(f"invalid signature on {request.path} from {request.remote}")
+            return _reject(401, "invalid_signature")
+
+        return await handler(request)
+
+    return middleware
@@ -1,46 +1,22 @@
 import json
-import hmac
-import hashlib
 import logging
-from typing import Optional, Dict, Any
+from typing import Dict, Any, Optional
 from aiohttp import web
 from aiogram import Bot
 from config.locale import Locale
-from database.req import UserRequests
+from config.templates import templates
+from services.locale_loader import LocaleLoader
 
 logger = logging.getLogger(__name__)
 
 
 class TributeWebhookHandler:
-    def __init__(self, bot: Bot, remnawave_sdk, secret_key: Optional[str] = None):
+    def __init__(
+        self, bot: Bot, remnawave_sdk, locale_loader: Optional[LocaleLoader] = None
+    ):
         self.bot = bot
         self.remnawave = remnawave_sdk
-        self.secret_key = secret_key
-
-    def verify_signature(self, payload: bytes, signature: str) -> bool:
-        if not self.secret_key:
-            logger.warning("Tribute secret key не настроен")
-            return False
-
-        if not signature:
-            logger.warning("Отсутствует заголовок trbt-signature")
-            return False
-
-        try:
-            expected_sig = hmac.new(
-                self.secret_key.encode("utf-8"), payload, hashlib.sha256
-            ).hexdigest()
-
-            is_valid = hmac.compare_digest(expected_sig, signature)
-
-            if not is_valid:
-                logger.warning("Неверная подпись webhook")
-
-            return is_valid
-
-        except Exception as e:
-            logger.error(f"Ошибка при верификации подписи: {e}")
-            return False
+        self.locale_loader = locale_loader or LocaleLoader()
 
     async def handle_donation(self, payload_data: Dict[str, Any]) -> Dict[str, Any]:
         try:
@@ -57,9 +33,7 @@ class TributeWebhookHandler:
                 return {"status": "error", "reason": "missing_required_fields"}
 
             try:
-                user = UserRequests()
-                us = await user.get_user_by_telegram_id(telegram_user_id)
-                user_lang = us.locale if us else "ru"
+                user_lang = await self.locale_loader.load(telegram_user_id)
                 locale = Locale(user_lang)
             except Exception as e:
                 logger.error(f"Ошибка получения пользователя {telegram_user_id}: {e}")
@@ -110,15 +84,20 @@ class TributeWebhookHandler:
         donation_name: str,
         locale: Locale,
     ) -> str:
-        msg = "💰 <b>Новый донат</b>\n\n"
-        msg += f"🎯 {donation_name}\n" if donation_name else ""
-        msg += f"👤 От: <b>{donor_name}</b>\n"
-        msg += f"💵 Сумма: <b>{amount} {currency}</b>\n"
-
-        if message.strip():
-            msg += f"💬 Сообщение: <i>{message}</i>\n"
-
-        return msg
+        lang = locale.lang
+        return templates.render(
+            "tribute_donation",
+            lang,
+            title=templates.render("tribute_donation_title", lang, name=donation_name)
+            if donation_name
+            else "",
+            donor=donor_name,
+            amount=amount,
+            currency=currency,
+            comment=templates.render("tribute_donation_comment", lang, message=message)
+            if message.strip()
+            else "",
+        )
 
     async def _process_donation_rewards(self, user_id: int, amount: float):
         try:
@@ -132,14 +111,6 @@ class TributeWebhookHandler:
         try:
             raw_body = await request.read()
 
-            signature = request.headers.get("trbt-signature", "")
-
-            if not self.verify_signature(raw_body, signature):
-                logger.warning("Неверная подпись Tribute webhook")
-                return web.json_response(
-                    {"status": "error", "reason": "invalid_signature"}, status=401
-                )
-
             try:
                 payload = json.loads(raw_body.decode("utf-8"))
             except json.JSONDecodeError as e:
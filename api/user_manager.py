@@ -1,19 +1,16 @@
 from datetime import datetime, timedelta
-from remnawave.models import (
-    UpdateUserRequestDto,
-    CreateUserRequestDto,
-    TelegramUserResponseDto,
-    UserResponseDto,
-)
 import uuid
 import logging
 import base64
 import json
-import hmac
-import hashlib
+from typing import TYPE_CHECKING, Optional
 from aiohttp import web
 
-from config.locale import Locale
+from services.locale_loader import LocaleLoader
+from services.reminders import expiry_message
+
+if TYPE_CHECKING:
+    from remnawave.models import TelegramUserResponseDto, UserResponseDto
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -23,13 +20,17 @@ class UserManager:
     def __init__(self, remnawave_client):
         self.client = remnawave_client
 
-    def generate_username(self):
+    @staticmethod
+    def generate_username():
         u = uuid.uuid4()
         b64 = base64.urlsafe_b64encode(u.bytes).rstrip(b"=").decode("ascii")
         return b64
 
-    async def create_user(self, telegram_id, months, limit_bytes):
-        username = self.generate_username()
+    async def create_user(self, telegram_id, months, limit_bytes, username=None):
+        # the sdk models take ~0.4s to import, keep them off the startup path
+        from remnawave.models import CreateUserRequestDto
+
+        username = username or self.generate_username()
 
         user_data = CreateUserRequestDto(
             username=username,
@@ -40,13 +41,15 @@ class UserManager:
             traffic_limit_strategy="MONTH",
         )
 
-        created_user: UserResponseDto = await self.client.users.create_user(
+        created_user: "UserResponseDto" = await self.client.users.create_user(
             body=user_data
         )
         logger.info(f"user created:{created_user}")
         return created_user
 
     async def renew_subscription(self, tg_id: int, days: int):
+        from remnawave.models import UpdateUserRequestDto
+
         user = await self.create_or_get_user(tg_id)
         new_expires = datetime.utcnow() + timedelta(days=days)
         update_data = UpdateUserRequestDto(
@@ -61,11 +64,11 @@ class UserManager:
 
     async def get_subscription(self, telegram_id: str):
         try:
-            logger.info(f"trying to get user by telgram id:{telegram_id}")
-            response: TelegramUserResponseDto = (
+            logger.debug(f"trying to get user by telgram id:{telegram_id}")
+            response: "TelegramUserResponseDto" = (
                 await self.client.users.get_users_by_telegram_id(telegram_id)
             )
-            logger.info(response)
+            logger.debug(response)
             return response
         except Exception as e:
             logger.error(f"error while getting user:{e}")
@@ -75,36 +78,22 @@ logger = logging.getLogger(__name__)
 
 
 class PanelWebhookHandler:
-    def __init__(self, bot, user_manager, webhook_secret):
+    def __init__(
+        self,
+        bot,
+        user_manager,
+        notify_expiring: bool = True,
+        locale_loader: Optional[LocaleLoader] = None,
+    ):
         self.bot = bot
         self.user_manager = user_manager
-        self.webhook_secret = webhook_secret
-        self.default_lang = "ru"
+        self.locale_loader = locale_loader or LocaleLoader()
+        # off when the local expiry scheduler sends the reminders instead
+        self.notify_expiring = notify_expiring
         logger.info("Remnawave webhook initialize")
 
-    def _verify_signature(self, body: bytes, signature: str) -> bool:
-        if not self.webhook_secret:
-            return True
-
-        if isinstance(body, bytes):
-            original_body = body.decode("utf-8")
-        else:
-            original_body = str(body)
-
-        computed_signature = hmac.new(
-            self.webhook_secret.encode("utf-8"),
-            original_body.encode("utf-8"),
-            hashlib.sha256,
-        ).hexdigest()
-
-        logger.info(f"Received: {signature}")
-        logger.info(f"Computed: {computed_signature}")
-
-        return hmac.compare_digest(computed_signature, signature)
-
-    def _get_user_locale(self, tg_id: int) -> str:
-        # default locale while WIP
-        return self.default_lang
+    async def _get_user_locale(self, tg_id: int) -> str:
+        return await self.locale_loader.load(tg_id)
 
     async def _send_notification(self, tg_id: int, message: str):
         try:
@@ -114,10 +103,6 @@ class PanelWebhookHandler:
 
     async def handle_webhook(self, request):
         body = await request.read()
-        signature = request.headers.get("X-Remnawave-Signature", "")
-
-        if not self._verify_signature(body, signature):
-            return web.Response(status=403, text="Invalid signature")
 
         try:
             data = json.loads(body.decode())
@@ -139,7 +124,7 @@ class PanelWebhookHandler:
 
         if event == "user.expired":
             await self._handle_expired(tg_id, user_data)
-        elif event in [
+        elif self.notify_expiring and event in [
             "user.expires_in_72_hours",
             "user.expires_in_48_hours",
             "user.expires_in_24_hours",
@@ -150,23 +135,17 @@ class PanelWebhookHandler:
         return web.Response(status=200, text="OK")
 
     async def _handle_expired(self, tg_id: int, user_data: dict):
-        lang = self._get_user_locale(tg_id)
-        locale = Locale(lang)
+        lang = await self._get_user_locale(tg_id)
 
         expire_date = (
             user_data.get("expireAt", "")[:10] if user_data.get("expireAt") else ""
         )
 
-        message = (
-            f"⚠️ <b>{locale.get('sub_expired')}</b>\n\n"
-            f"{locale.get('expiry_date')}{expire_date}\n"
-            f"{locale.get('renew_subscription')}"
-        )
+        message = expiry_message(lang, 0, expire_date)
         await self._send_notification(tg_id, message)
 
     async def _handle_expiring(self, tg_id: int, user_data: dict, event: str):
-        lang = self._get_user_locale(tg_id)
-        locale = Locale(lang)
+        lang = await self._get_user_locale(tg_id)
 
         hours = {
             "user.expires_in_72_hours": 72,
@@ -178,10 +157,5 @@ class PanelWebhookHandler:
             user_data.get("expireAt", "")[:10] if user_data.get("expireAt") else ""
         )
 
-        message = (
-            f"⏰ <b>{locale.get('sub_expires_soon')}</b>\n\n"
-            f"{locale.get('hours before')}{hours}\n"
-            f"{locale.get('expire_date')}{expire_date}\n"
-            f"{locale.get('dont_forget_renew')}"
-        )
+        message = expiry_message(lang, hours, expire_date)
         await self._send_notification(tg_id, message)
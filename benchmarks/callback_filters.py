@@ -0,0 +1,124 @@
+import argparse
+import asyncio
+import logging
+import time
+
+from benchmarks.harness import FIRST_USER_ID, UpdateFactory
+from benchmarks.report import build_report, write_report
+from handlers.user_handlers import user_router
+from keyboards.callbacks import (
+    REGISTRY,
+    PayRate,
+    SelectMonths,
+    SelectRate,
+    SubInfo,
+    SubStatus,
+    parse,
+)
+
+logger = logging.getLogger(__name__)
+
+# one callback per registered handler, in no particular order
+SAMPLES = {
+    "back_to_main": "back_to_main",
+    "buy_sub": "buy_sub",
+    "select_rate": SelectRate(rate=1).pack(),
+    "select_months": SelectMonths(rate=1, months=12).pack(),
+    "show_sub": "show_sub",
+    "sub_info": SubInfo(
+        sublink_id=123456,
+        status=SubStatus.ACTIVE,
+        used_bytes=37 * 1024**3,
+        limit_bytes=100 * 1024**3,
+    ).pack(),
+    "show_balance": "show_balance",
+    "topup_balance": "topup_balance",
+    "pay_rate": PayRate(rate=1, months=12).pack(),
+    "pay_crypto": "pay_crypto",
+    "show_refferals": "show_refferals",
+}
+
+MODES = ("dispatch", "per_filter")
+
+
+async def resolve(handlers, query, mode):
+    data = {}
+    if mode == "dispatch":
+        # what CallbackDataMiddleware does once per update
+        packed = parse(query.data)
+        if packed is not None:
+            data["packed_callback"] = packed
+    for checked, handler in enumerate(handlers, 1):
+        matched, _ = await handler.check(query, **data)
+        if matched:
+            return handler, checked
+    return None, len(handlers)
+
+
+async def measure(handlers, query, mode, iterations):
+    handler, checked = await resolve(handlers, query, mode)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await resolve(handlers, query, mode)
+    elapsed = time.perf_counter() - started
+    return {
+        "handler": handler.callback.__name__ if handler else None,
+        "filters_checked": checked,
+        "us_per_match": round(elapsed / iterations * 1e6, 3),
+        "callback_bytes": len(query.data.encode()),
+    }
+
+
+async def run(args) -> dict:
+    handlers = user_router.callback_query.handlers
+    factory = UpdateFactory(bot_id=1)
+    results = {}
+    for mode in args.modes:
+        for name, data in SAMPLES.items():
+            query = factory.callback(FIRST_USER_ID, data).callback_query
+            results[f"{mode}:{name}"] = await measure(handlers, query, mode, args.iterations)
+    return results
+
+
+def print_results(results: dict):
+    header = f"{'mode:callback':<30}{'handler':<26}{'filters':>8}{'bytes':>7}{'us/match':>10}"
+    print(header)
+    print("-" * len(header))
+    for name, row in results.items():
+        print(
+            f"{name:<30}{row['handler'] or '-':<26}{row['filters_checked']:>8}"
+            f"{row['callback_bytes']:>7}{row['us_per_match']:>10.2f}"
+        )
+    for mode in MODES:
+        rows = [row for key, row in results.items() if key.startswith(f"{mode}:")]
+        if rows:
+            total = sum(row["us_per_match"] for row in rows)
+            print(f"{mode}: {total / len(rows):.2f} us/match on average")
+    print(
+        "packed callbacks: "
+        + ", ".join(f"{p}={cls.__name__} (max {cls.__max_length__}B)" for p, cls in REGISTRY.items())
+    )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Cost of matching callback queries against every registered handler filter"
+    )
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--modes", nargs="*", choices=MODES, default=list(MODES),
+                        help="dispatch: decode once by prefix; per_filter: every filter decodes")
+    parser.add_argument("--output", help="write JSON report to this path")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.WARNING)
+    args = parse_args(argv)
+    results = asyncio.run(run(args))
+    print_results(results)
+    params = {k: v for k, v in vars(args).items() if k != "output"}
+    write_report(build_report("callback_filters", params, results), args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import time
+
+from benchmarks.harness import (
+    FIRST_USER_ID,
+    UpdateFactory,
+    build_dispatcher,
+    prepare_database,
+    start_panel,
+)
+from benchmarks.fakes import StubCryptoBot, fake_bot
+from benchmarks.report import build_report, load_report, print_table, summarize, write_report
+from database.db import engine
+from database.profiler import QueryProfiler
+from keyboards.callbacks import PayRate, SelectMonths
+from services.known_users import KnownUsers
+
+logger = logging.getLogger(__name__)
+
+FLOWS = {
+    "start": [("message", "/start")],
+    "buy_sub": [("callback", "buy_sub")],
+    "select_months": [("callback", SelectMonths(rate=1, months=3).pack())],
+    "show_sub": [("callback", "show_sub")],
+    "pay_rate": [("callback", PayRate(rate=1, months=1).pack())],
+    "crypto_amount_fsm": [("callback", "pay_crypto"), ("message", "150")],
+}
+
+
+async def run_flow(dp, bot, factory, name, steps, iterations, concurrency, users, profiler):
+    latencies = []
+    errors = 0
+    queries = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    user_ids = itertools.cycle(range(FIRST_USER_ID, FIRST_USER_ID + users))
+    calls_before = bot.session.calls.copy()
+
+    async def one(telegram_id):
+        nonlocal errors, queries
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                for kind, payload in steps:
+                    with profiler.track(name) as stats:
+                        await dp.feed_update(bot, factory.build(kind, telegram_id, payload))
+                    queries += stats.count
+            except Exception as e:
+                errors += 1
+                logger.debug(f"{name} failed: {e!r}")
+                return
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(next(user_ids)) for _ in range(iterations)))
+    elapsed = time.perf_counter() - started
+
+    result = summarize(latencies, errors, elapsed)
+    result["updates_per_s"] = round(iterations * len(steps) / elapsed, 2)
+    result["queries_per_flow"] = round(queries / iterations, 2) if iterations else 0.0
+    result["api_calls"] = dict(bot.session.calls - calls_before)
+    return result
+
+
+async def run(args) -> dict:
+    bot = fake_bot(args.telegram_latency)
+    panel, remnawave, panel_runner = await start_panel(
+        args.panel, args.panel_latency, args.panel_jitter, args.panel_error_rate
+    )
+    cryptobot = StubCryptoBot(args.panel_latency)
+    profiler = QueryProfiler(max_queries=10**6, max_repeats=10**6, max_time_ms=10**9)
+    profiler.install(engine)
+
+    await prepare_database(args.users, panel)
+    known_users = None
+    if not args.no_known_users:
+        known_users = KnownUsers()
+        await known_users.load()
+    dp = build_dispatcher(bot, remnawave, cryptobot, profiler, known_users)
+    factory = UpdateFactory(bot.id)
+
+    flows = args.flows or list(FLOWS)
+    results = {}
+    for name in flows:
+        steps = FLOWS[name]
+        if args.warmup:
+            await run_flow(dp, bot, factory, name, steps, args.warmup, args.concurrency, args.users, profiler)
+        results[name] = await run_flow(
+            dp, bot, factory, name, steps, args.iterations, args.concurrency, args.users, profiler
+        )
+    if known_users is not None:
+        print(f"known users: {known_users.stats()}")
+    if panel_runner:
+        await panel_runner.cleanup()
+    await engine.dispose()
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline Dispatcher throughput benchmark")
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--flows", nargs="*", choices=list(FLOWS))
+    parser.add_argument("--panel", choices=("stub", "fake"), default="stub",
+                        help="in-process stub client or the fake panel over HTTP")
+    parser.add_argument("--panel-latency", type=float, default=0.0, help="seconds")
+    parser.add_argument("--panel-jitter", type=float, default=0.0, help="seconds")
+    parser.add_argument("--panel-error-rate", type=float, default=0.0)
+    parser.add_argument("--telegram-latency", type=float, default=0.0, help="seconds")
+    parser.add_argument("--no-known-users", action="store_true",
+                        help="check user registration in the database on every /start")
+    parser.add_argument("--output", help="write JSON report to this path")
+    parser.add_argument("--compare", help="baseline JSON report to compare against")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.WARNING)
+    logging.disable(logging.INFO)
+    args = parse_args(argv)
+    results = asyncio.run(run(args))
+    params = {k: v for k, v in vars(args).items() if k not in ("output", "compare")}
+    params["database_url"] = os.environ["DATABASE_URL"].split("@")[-1]
+    report = build_report("dispatcher", params, results)
+    print_table(results, load_report(args.compare))
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
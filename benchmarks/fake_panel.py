@@ -0,0 +1,365 @@
+import argparse
+import asyncio
+import json
+import logging
+import random
+import secrets
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from aiohttp import ClientSession, ClientTimeout, web
+
+from benchmarks.payloads import sign_hex
+
+logger = logging.getLogger(__name__)
+
+EXPIRY_EVENTS = {
+    72: "user.expires_in_72_hours",
+    48: "user.expires_in_48_hours",
+    24: "user.expires_in_24_hours",
+}
+
+
+def _iso(value: datetime) -> str:
+    return value.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def _parse_dt(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+class FailureProfile:
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        timeout_rate: float = 0.0,
+        timeout_delay: float = 30.0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.timeout_delay = timeout_delay
+
+    def update(self, **values):
+        for key, value in values.items():
+            if hasattr(self, key):
+                setattr(self, key, float(value))
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+
+class FakePanel:
+    def __init__(
+        self,
+        profile: Optional[FailureProfile] = None,
+        token: Optional[str] = None,
+        public_url: str = "https://panel.local",
+        webhook_url: Optional[str] = None,
+        webhook_secret: Optional[str] = None,
+        traffic_step: int = 0,
+    ):
+        self.profile = profile or FailureProfile()
+        self.token = token
+        self.public_url = public_url.rstrip("/")
+        self.webhook_url = webhook_url
+        self.webhook_secret = webhook_secret
+        self.traffic_step = traffic_step
+        self.users: Dict[str, dict] = {}
+        self.by_telegram_id: Dict[int, List[str]] = {}
+        self.requests = 0
+        self.sent_events: set = set()
+        self.app = self._build_app()
+
+    def _build_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._failure_middleware])
+        app.router.add_post("/api/users", self.create_user)
+        app.router.add_patch("/api/users", self.update_user)
+        app.router.add_get("/api/users", self.list_users)
+        app.router.add_get("/api/users/by-telegram-id/{telegram_id}", self.get_by_telegram_id)
+        app.router.add_get("/_fake/profile", self.get_profile)
+        app.router.add_post("/_fake/profile", self.set_profile)
+        app.router.add_post("/_fake/emit", self.emit_route)
+        return app
+
+    @web.middleware
+    async def _failure_middleware(self, request: web.Request, handler):
+        if request.path.startswith("/_fake/"):
+            return await handler(request)
+        self.requests += 1
+        if self.token and request.headers.get("Authorization") != f"Bearer {self.token}":
+            return self._error(401, "Unauthorized", "A001")
+        profile = self.profile
+        delay = profile.latency + random.uniform(0, profile.jitter)
+        if profile.timeout_rate and random.random() < profile.timeout_rate:
+            delay = profile.timeout_delay
+        if delay:
+            await asyncio.sleep(delay)
+        if profile.error_rate and random.random() < profile.error_rate:
+            return self._error(500, "Injected failure", "A000")
+        return await handler(request)
+
+    @staticmethod
+    def _error(status: int, message: str, code: str) -> web.Response:
+        return web.json_response(
+            {
+                "timestamp": _iso(datetime.now(timezone.utc)),
+                "path": "/api/users",
+                "message": message,
+                "errorCode": code,
+            },
+            status=status,
+        )
+
+    def seed(
+        self,
+        telegram_id: int,
+        subscription_url: Optional[str] = None,
+        expire_at: Optional[datetime] = None,
+        traffic_limit_bytes: int = 50 * 1024**3,
+        used_traffic_bytes: int = 0,
+        status: str = "ACTIVE",
+    ) -> dict:
+        now = datetime.now(timezone.utc)
+        short_uuid = secrets.token_urlsafe(12)
+        user = {
+            "uuid": str(uuid.uuid4()),
+            "subscriptionUuid": str(uuid.uuid4()),
+            "shortUuid": short_uuid,
+            "username": secrets.token_urlsafe(16),
+            "status": status,
+            "usedTrafficBytes": used_traffic_bytes,
+            "lifetimeUsedTrafficBytes": used_traffic_bytes,
+            "trafficLimitBytes": traffic_limit_bytes,
+            "trafficLimitStrategy": "MONTH",
+            "expireAt": _iso(expire_at or now + timedelta(days=30)),
+            "trojanPassword": secrets.token_hex(8),
+            "vlessUuid": str(uuid.uuid4()),
+            "ssPassword": secrets.token_hex(8),
+            "description": None,
+            "telegramId": int(telegram_id) if telegram_id is not None else None,
+            "email": None,
+            "activeInternalSquads": [],
+            "subscriptionUrl": subscription_url or f"{self.public_url}/api/sub/{short_uuid}",
+            "createdAt": _iso(now),
+            "updatedAt": _iso(now),
+        }
+        self._store(user)
+        return user
+
+    def _store(self, user: dict):
+        self.users[user["uuid"]] = user
+        telegram_id = user.get("telegramId")
+        if telegram_id is not None:
+            uuids = self.by_telegram_id.setdefault(int(telegram_id), [])
+            if user["uuid"] not in uuids:
+                uuids.append(user["uuid"])
+
+    def _tick_traffic(self, user: dict):
+        if not self.traffic_step or user["status"] != "ACTIVE":
+            return
+        step = random.randint(0, self.traffic_step)
+        user["usedTrafficBytes"] += step
+        user["lifetimeUsedTrafficBytes"] += step
+        limit = user.get("trafficLimitBytes") or 0
+        if limit and user["usedTrafficBytes"] >= limit:
+            user["status"] = "LIMITED"
+
+    async def create_user(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        if not body.get("username") or not body.get("expireAt"):
+            return self._error(400, "Validation failed", "A002")
+        user = self.seed(
+            telegram_id=body.get("telegramId"),
+            expire_at=_parse_dt(body["expireAt"]),
+            traffic_limit_bytes=body.get("trafficLimitBytes") or 0,
+            status=body.get("status") or "ACTIVE",
+        )
+        user["username"] = body["username"]
+        return web.json_response({"response": user}, status=201)
+
+    async def update_user(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        user = self.users.get(str(body.get("uuid")))
+        if not user:
+            return self._error(404, "User not found", "A063")
+        old_telegram_id = user.get("telegramId")
+        for key, value in body.items():
+            if key != "uuid" and value is not None:
+                user[key] = value
+        user["updatedAt"] = _iso(datetime.now(timezone.utc))
+        if old_telegram_id != user.get("telegramId") and old_telegram_id is not None:
+            self.by_telegram_id.get(int(old_telegram_id), []).remove(user["uuid"])
+        self._store(user)
+        return web.json_response({"response": user})
+
+    async def list_users(self, request: web.Request) -> web.Response:
+        start = int(request.query.get("start", 0))
+        size = int(request.query.get("size", 25))
+        users = list(self.users.values())[start : start + size]
+        for user in users:
+            self._tick_traffic(user)
+        return web.json_response(
+            {"response": {"users": users, "total": len(self.users)}}
+        )
+
+    async def get_by_telegram_id(self, request: web.Request) -> web.Response:
+        try:
+            telegram_id = int(request.match_info["telegram_id"])
+        except ValueError:
+            return self._error(400, "Validation failed", "A002")
+        uuids = self.by_telegram_id.get(telegram_id)
+        if not uuids:
+            return self._error(404, "Users not found", "A062")
+        users = [self.users[u] for u in uuids]
+        for user in users:
+            self._tick_traffic(user)
+        return web.json_response({"response": users})
+
+    async def get_profile(self, request: web.Request) -> web.Response:
+        return web.json_response(self.profile.as_dict())
+
+    async def set_profile(self, request: web.Request) -> web.Response:
+        self.profile.update(**await request.json())
+        return web.json_response(self.profile.as_dict())
+
+    async def emit_route(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        uuids = self.by_telegram_id.get(int(body.get("telegram_id", 0)), [])
+        if not uuids:
+            return web.json_response({"error": "unknown telegram_id"}, status=404)
+        status = await self.emit(body.get("event", "user.expires_in_24_hours"), uuids[-1])
+        return web.json_response({"status": status})
+
+    def webhook_payload(self, event: str, user: dict):
+        body = json.dumps(
+            {"event": event, "data": user, "timestamp": _iso(datetime.now(timezone.utc))},
+            separators=(",", ":"),
+        ).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        if self.webhook_secret:
+            headers["X-Remnawave-Signature"] = sign_hex(body, self.webhook_secret)
+        return body, headers
+
+    async def emit(self, event: str, user_uuid: str, session: Optional[ClientSession] = None) -> int:
+        if not self.webhook_url:
+            raise RuntimeError("webhook_url is not configured")
+        body, headers = self.webhook_payload(event, self.users[user_uuid])
+        if session is None:
+            async with ClientSession(timeout=ClientTimeout(total=10)) as own:
+                async with own.post(self.webhook_url, data=body, headers=headers) as resp:
+                    return resp.status
+        async with session.post(self.webhook_url, data=body, headers=headers) as resp:
+            return resp.status
+
+    def due_events(self, now: Optional[datetime] = None) -> List[tuple]:
+        now = now or datetime.now(timezone.utc)
+        due = []
+        for user in self.users.values():
+            expire_at = _parse_dt(user["expireAt"])
+            left = expire_at - now
+            if left <= timedelta(0):
+                event = "user.expired"
+            else:
+                hours = next((h for h in sorted(EXPIRY_EVENTS) if left <= timedelta(hours=h)), None)
+                if hours is None:
+                    continue
+                event = EXPIRY_EVENTS[hours]
+            key = (user["uuid"], event)
+            if key not in self.sent_events:
+                due.append(key)
+        return due
+
+    async def emit_due(self, concurrency: int = 50) -> int:
+        due = self.due_events()
+        semaphore = asyncio.Semaphore(concurrency)
+        async with ClientSession(timeout=ClientTimeout(total=10)) as session:
+
+            async def send(user_uuid, event):
+                async with semaphore:
+                    try:
+                        await self.emit(event, user_uuid, session)
+                        self.sent_events.add((user_uuid, event))
+                    except Exception as e:
+                        logger.warning(f"webhook {event} for {user_uuid} failed: {e}")
+
+            await asyncio.gather(*(send(u, e) for u, e in due))
+        return len(due)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> web.AppRunner:
+        runner = web.AppRunner(self.app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        self.runner = runner
+        return runner
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.runner.addresses[0][:2]
+        return f"http://{host}:{port}"
+
+    def client(self, token: str = "fake-panel-token"):
+        from remnawave import RemnawaveSDK
+
+        self.token = token
+        return RemnawaveSDK(base_url=self.base_url, token=token)
+
+
+async def serve(args):
+    panel = FakePanel(
+        FailureProfile(args.latency, args.jitter, args.error_rate, args.timeout_rate, args.timeout_delay),
+        token=args.token,
+        webhook_url=args.webhook_url,
+        webhook_secret=args.webhook_secret,
+        traffic_step=args.traffic_step,
+    )
+    for i in range(args.seed_users):
+        panel.seed(
+            args.seed_first_id + i,
+            expire_at=datetime.now(timezone.utc) + timedelta(hours=random.randint(1, 24 * 30)),
+        )
+    await panel.start(args.host, args.port)
+    logger.warning(f"fake panel listening on {panel.base_url} ({len(panel.users)} users)")
+    while True:
+        await asyncio.sleep(args.emit_interval or 3600)
+        if args.emit_interval and args.webhook_url:
+            sent = await panel.emit_due()
+            if sent:
+                logger.warning(f"emitted {sent} panel webhooks")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="In-memory Remnawave panel stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3010)
+    parser.add_argument("--token", help="require this bearer token")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-delay", type=float, default=30.0, help="seconds")
+    parser.add_argument("--traffic-step", type=int, default=0, help="max bytes added per read")
+    parser.add_argument("--webhook-url", help="bot panel webhook url to emit events to")
+    parser.add_argument("--webhook-secret", help="REMNAWAVE_WEBHOOK_SECRET_HEADER of the bot")
+    parser.add_argument("--emit-interval", type=float, default=0.0, help="seconds between expiry scans")
+    parser.add_argument("--seed-users", type=int, default=0)
+    parser.add_argument("--seed-first-id", type=int, default=10_000_000)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.WARNING)
+    try:
+        asyncio.run(serve(parse_args(argv)))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
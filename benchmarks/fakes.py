@@ -0,0 +1,199 @@
+import asyncio
+import json
+import random
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Dict, List
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import GetMe, TelegramMethod
+from aiogram.types import Chat, Message, User
+from aiosend.client import Network
+
+BOT_TOKEN = "123456:BENCHMARK-TOKEN"
+BOT_USERNAME = "bench_shop_bot"
+
+
+class FakeSession(BaseSession):
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self._message_id = 0
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout=None):
+        self.calls[type(method).__name__] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if isinstance(method, GetMe):
+            return User(
+                id=bot.id, is_bot=True, first_name="bench", username=BOT_USERNAME
+            )
+        if method.__returning__ is bool:
+            return True
+        if method.__returning__ is Message or "Message" in str(method.__returning__):
+            self._message_id += 1
+            chat_id = getattr(method, "chat_id", None) or 1
+            return Message(
+                message_id=self._message_id,
+                date=datetime.now(timezone.utc),
+                chat=Chat(id=chat_id, type="private"),
+                text=getattr(method, "text", None),
+            )
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+def fake_bot(latency: float = 0.0) -> Bot:
+    return Bot(token=BOT_TOKEN, session=FakeSession(latency))
+
+
+def subscription_url(telegram_id: int, index: int) -> str:
+    return f"https://panel.local/api/sub/{telegram_id}-{index}"
+
+
+class _StubUsers:
+    def __init__(self, owner: "StubRemnawave"):
+        self.owner = owner
+
+    async def _delay(self):
+        owner = self.owner
+        if owner.latency or owner.jitter:
+            await asyncio.sleep(owner.latency + random.uniform(0, owner.jitter))
+        if owner.error_rate and random.random() < owner.error_rate:
+            raise RuntimeError("stub panel error")
+
+    def _user(self, telegram_id, index, expire_at=None, limit_bytes=50 * 1024**3):
+        return SimpleNamespace(
+            uuid=f"{telegram_id}-{index}",
+            username=f"u{telegram_id}x{index}",
+            telegram_id=int(telegram_id),
+            subscription_url=subscription_url(telegram_id, index),
+            used_traffic_bytes=random.randint(0, limit_bytes),
+            traffic_limit_bytes=limit_bytes,
+            status=SimpleNamespace(value="ACTIVE"),
+            expire_at=expire_at or datetime.now(timezone.utc) + timedelta(days=30),
+        )
+
+    async def get_users_by_telegram_id(self, telegram_id):
+        await self._delay()
+        count = self.owner.subscriptions.get(int(telegram_id), 0)
+        return SimpleNamespace(
+            root=[self._user(telegram_id, i) for i in range(count)]
+        )
+
+    async def create_user(self, body):
+        await self._delay()
+        telegram_id = int(body.telegram_id)
+        index = self.owner.subscriptions.get(telegram_id, 0)
+        self.owner.subscriptions[telegram_id] = index + 1
+        return self._user(
+            telegram_id, index, expire_at=body.expire_at, limit_bytes=body.traffic_limit_bytes
+        )
+
+    async def update_user(self, *args, **kwargs):
+        await self._delay()
+        return SimpleNamespace()
+
+
+class StubRemnawave:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.subscriptions: Dict[int, int] = {}
+        self.users = _StubUsers(self)
+
+    def seed(self, telegram_id: int, subscription_url=None, expire_at=None):
+        self.subscriptions[telegram_id] = self.subscriptions.get(telegram_id, 0) + 1
+
+
+class StubCryptoBot:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.invoices: List[dict] = []
+
+    async def create_invoice(self, amount, locale, bot_username, user_id, tg_id):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        invoice_id = len(self.invoices) + 1
+        self.invoices.append({"amount": amount, "user_id": user_id, "tg_id": tg_id})
+        return SimpleNamespace(
+            invoice_id=invoice_id,
+            bot_invoice_url=f"https://t.me/CryptoTestnetBot?start={invoice_id}",
+        )
+
+
+class _CryptoPayHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        method = self.path.rsplit("/", 1)[-1]
+        if method == "getMe":
+            result = {
+                "app_id": 1,
+                "name": "bench",
+                "payment_processing_bot_username": "CryptoTestnetBot",
+            }
+        elif method == "createInvoice":
+            invoice_id = self.server.next_invoice_id()
+            result = {
+                "invoice_id": invoice_id,
+                "hash": f"IV{invoice_id}",
+                "currency_type": request.get("currency_type", "fiat"),
+                "fiat": request.get("fiat"),
+                "amount": str(request.get("amount")),
+                "bot_invoice_url": f"https://t.me/CryptoTestnetBot?start={invoice_id}",
+                "mini_app_invoice_url": f"https://t.me/CryptoTestnetBot/app?startapp={invoice_id}",
+                "web_app_invoice_url": f"https://testnet-app.send.tg/invoices/{invoice_id}",
+                "status": "active",
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "allow_comments": True,
+                "allow_anonymous": True,
+                "payload": request.get("payload"),
+            }
+        else:
+            result = True
+        body = json.dumps({"ok": True, "result": result}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeCryptoPayApi:
+    # aiosend validates the token with a blocking request while CryptoPay is
+    # constructed, so the fake has to live outside the event loop thread.
+    def __init__(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _CryptoPayHandler)
+        invoice_ids = iter(range(1, 2**31))
+        self.server.next_invoice_id = lambda: next(invoice_ids)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def network(self) -> Network:
+        host, port = self.server.server_address[:2]
+        return Network(name="BENCH", base=f"http://{host}:{port}/api/{{method}}")
+
+    def start(self) -> "FakeCryptoPayApi":
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
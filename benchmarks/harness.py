@@ -0,0 +1,171 @@
+import itertools
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+_DB_FILE = os.path.join(tempfile.gettempdir(), "shop_bench.sqlite3")
+BENCH_ENV = {
+    "DATABASE_URL": f"sqlite+aiosqlite:///{_DB_FILE}",
+    "RATE": "100",
+    "RATE_LIMIT": "50",
+    "RATE_DESC": "benchmark plan",
+    "RATE_CURRENCY": "RUB",
+    "REF_PERCENT": "10",
+    "MINIMAL_AMOUNT": "100",
+    "BOT_TOKEN": "123456:BENCHMARK-TOKEN",
+    "CRYPTOBOT_TOKEN": "1234:BENCHMARK",
+    "CRYPTOBOT_SECRET_PATH": "/paid",
+    "CRYPTOBOT_WEBHOOK_PATH": "/crypto",
+    "REMNAWAVE_WEBHOOK_PATH": "/panel",
+    "REMNAWAVE_WEBHOOK_SECRET_HEADER": "bench-panel-secret",
+    "TRIBUTE_API_KEY": "bench-tribute-secret",
+    "TRIBUTE_WEBHOOK_PATH": "/tribute",
+    "WEBHOOK_PATH": "/webhook",
+    "WEBHOOK_SECRET": "bench-telegram-secret",
+}
+for _key, _value in BENCH_ENV.items():
+    os.environ.setdefault(_key, _value)
+
+from aiogram import Dispatcher  # noqa: E402
+from aiogram.types import CallbackQuery, Chat, Message, Update, User  # noqa: E402
+
+from benchmarks.fake_panel import FailureProfile, FakePanel  # noqa: E402
+from benchmarks.fakes import StubRemnawave, subscription_url  # noqa: E402
+from database.db import Base, Invoice, User as DbUser, Sublink, engine, get_session  # noqa: E402
+from handlers.user_handlers import user_router  # noqa: E402
+from middleware import (  # noqa: E402
+    CallbackDataMiddleware,
+    InFlightMiddleware,
+    LocaleMiddleware,
+    QueryProfilerMiddleware,
+    SerializeMiddleware,
+)
+from services.inflight import InFlight  # noqa: E402
+from services.user_locks import UserLocks  # noqa: E402
+
+FIRST_USER_ID = 10_000_000
+SUBS_PER_USER = 2
+# open crypto top-ups per user, a paid webhook only credits a matching pending invoice
+PENDING_INVOICES_PER_USER = 50
+
+
+class UpdateFactory:
+    def __init__(self, bot_id: int):
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self.bot_user = User(id=bot_id, is_bot=True, first_name="bench")
+
+    @staticmethod
+    def user(telegram_id: int) -> User:
+        return User(
+            id=telegram_id,
+            is_bot=False,
+            first_name="Bench",
+            last_name=str(telegram_id),
+            username=f"bench{telegram_id}",
+            language_code="en",
+        )
+
+    def message(self, telegram_id: int, text: str) -> Update:
+        return Update(
+            update_id=next(self._update_ids),
+            message=Message(
+                message_id=next(self._message_ids),
+                date=datetime.now(timezone.utc),
+                chat=Chat(id=telegram_id, type="private"),
+                from_user=self.user(telegram_id),
+                text=text,
+            ),
+        )
+
+    def callback(self, telegram_id: int, data: str) -> Update:
+        update_id = next(self._update_ids)
+        return Update(
+            update_id=update_id,
+            callback_query=CallbackQuery(
+                id=str(update_id),
+                from_user=self.user(telegram_id),
+                chat_instance=str(telegram_id),
+                data=data,
+                message=Message(
+                    message_id=next(self._message_ids),
+                    date=datetime.now(timezone.utc),
+                    chat=Chat(id=telegram_id, type="private"),
+                    from_user=self.bot_user,
+                    text="menu",
+                ),
+            ),
+        )
+
+    def build(self, kind: str, telegram_id: int, payload: str) -> Update:
+        if kind == "message":
+            return self.message(telegram_id, payload)
+        return self.callback(telegram_id, payload)
+
+
+async def prepare_database(users: int, panel):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    expires_at = datetime.now(timezone.utc) + timedelta(days=30)
+    user_ids = {}
+    async with get_session() as session:
+        for i in range(users):
+            telegram_id = FIRST_USER_ID + i
+            user = DbUser(
+                username=f"bench{telegram_id}",
+                telegram_id=telegram_id,
+                name=f"Bench {telegram_id}",
+                locale="en",
+                balance=Decimal("1000000.00"),
+            )
+            session.add(user)
+            await session.flush()
+            user_ids[telegram_id] = user.id
+            for index in range(SUBS_PER_USER):
+                panel.seed(telegram_id, subscription_url(telegram_id, index), expires_at)
+                session.add(
+                    Sublink(
+                        link=subscription_url(telegram_id, index),
+                        expires_at=expires_at,
+                        username=f"u{telegram_id}x{index}",
+                        user_id=user.id,
+                        limit_gb=Decimal("50.00"),
+                        status="ACTIVE",
+                    )
+                )
+            session.add_all(
+                Invoice(status="pending", user_id=user.id, platform="cryptobot", amount=150.0)
+                for _ in range(PENDING_INVOICES_PER_USER)
+            )
+        await session.commit()
+    return user_ids
+
+
+async def start_panel(kind: str, latency=0.0, jitter=0.0, error_rate=0.0):
+    if kind == "stub":
+        stub = StubRemnawave(latency, jitter, error_rate)
+        return stub, stub, None
+    panel = FakePanel(FailureProfile(latency, jitter, error_rate))
+    runner = await panel.start()
+    return panel, panel.client(), runner
+
+
+def build_dispatcher(bot, remnawave, cryptobot, profiler=None, known_users=None) -> Dispatcher:
+    dp = Dispatcher()
+    dp.workflow_data.update(bot=bot, remnawave=remnawave, cryptobot=cryptobot)
+    if known_users is not None:
+        dp.workflow_data["known_users"] = known_users
+    dp.include_router(user_router)
+    inflight = InFlight()
+    dp.workflow_data["inflight"] = inflight
+    dp.update.outer_middleware(InFlightMiddleware(inflight))
+    dp.update.outer_middleware(SerializeMiddleware(UserLocks()))
+    if profiler:
+        dp.workflow_data["query_profiler"] = profiler
+        dp.update.outer_middleware(QueryProfilerMiddleware(profiler))
+    dp.update.outer_middleware(LocaleMiddleware())
+    dp.callback_query.outer_middleware(CallbackDataMiddleware())
+    return dp
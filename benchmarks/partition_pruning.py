@@ -0,0 +1,115 @@
+import argparse
+import asyncio
+import json
+import sys
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+
+from benchmarks.report import build_report, write_report
+from database.db import Invoice, engine, get_session, init_db
+from database.partitions import ensure_monthly, list_monthly, month_start, partition_name
+from database.req import INVOICE_TTL, InvoiceRequests, StatsRequests
+
+# EXPLAINs the invoice queries that are meant to prune partitions and checks
+# which monthly partitions the plan still reads. Needs a postgres DATABASE_URL;
+# missing partitions for the last --months months are created (empty).
+
+
+def _relations(plan) -> set:
+    found = set()
+    if isinstance(plan, dict):
+        if "Relation Name" in plan:
+            found.add(plan["Relation Name"])
+        for value in plan.values():
+            found |= _relations(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            found |= _relations(value)
+    return found
+
+
+def _months_until(partitions, last: datetime) -> set:
+    return {name for name, month in partitions if month <= month_start(last)}
+
+
+async def run(args) -> dict:
+    now = datetime.now(timezone.utc)
+    async with engine.begin() as conn:
+        months = [now]
+        for _ in range(args.months):
+            months.append(month_start(months[-1]) - timedelta(days=1))
+        await ensure_monthly(conn, Invoice.__tablename__, months)
+        partitions = await list_monthly(conn, Invoice.__tablename__)
+
+    archive_before = now - timedelta(hours=24)
+    until = now.replace(minute=0, second=0, microsecond=0)
+    async with get_session(readonly=True) as session:
+        checks = {
+            # settle_topup, matching a payment to its invoice
+            "settle_topup": (
+                InvoiceRequests.pending_match(1, "cryptobot", 100, now),
+                {
+                    partition_name("invoices", now - 2 * INVOICE_TTL),
+                    partition_name("invoices", now),
+                },
+            ),
+            "archive_expired": (
+                InvoiceRequests.expired_pending(archive_before, 5000),
+                _months_until(partitions, archive_before),
+            ),
+            "analytics_topups": (
+                StatsRequests.topups_stmt(session, until),
+                _months_until(partitions, until),
+            ),
+        }
+
+    results = {}
+    async with engine.connect() as conn:
+        for name, (stmt, expected) in checks.items():
+            sql = str(stmt.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+            plan = (await conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"))).scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            scanned = {r for r in _relations(plan) if r.startswith("invoices_")}
+            results[name] = {
+                "scanned": sorted(scanned),
+                "partitions": len(partitions),
+                "ok": scanned <= expected,
+            }
+    return results
+
+
+def print_results(results: dict):
+    header = f"{'query':<20}{'scanned':>9}{'of':>5}  result"
+    print(header)
+    print("-" * len(header))
+    for name, row in results.items():
+        verdict = "pruned" if row["ok"] else "NOT PRUNED " + ", ".join(row["scanned"])
+        print(f"{name:<20}{len(row['scanned']):>9}{row['partitions']:>5}  {verdict}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Check partition pruning of invoice queries")
+    parser.add_argument("--months", type=int, default=12, help="past months to partition")
+    parser.add_argument("--output", help="write JSON report to this path")
+    return parser.parse_args(argv)
+
+
+async def _main(args) -> bool:
+    try:
+        if engine.dialect.name != "postgresql":
+            print("partition pruning needs a postgres DATABASE_URL", file=sys.stderr)
+            return False
+        await init_db()
+        results = await run(args)
+    finally:
+        await engine.dispose()
+    print_results(results)
+    params = {k: v for k, v in vars(args).items() if k != "output"}
+    write_report(build_report("partition_pruning", params, results), args.output)
+    return all(row["ok"] for row in results.values())
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(_main(parse_args())) else 1)
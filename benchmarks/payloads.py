@@ -0,0 +1,114 @@
+import hashlib
+import hmac
+import itertools
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+PANEL_EXPIRY_EVENTS = (
+    "user.expires_in_72_hours",
+    "user.expires_in_48_hours",
+    "user.expires_in_24_hours",
+    "user.expired",
+)
+
+_ids = itertools.count(int(time.time()))
+
+
+def _dumps(data: dict) -> bytes:
+    return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+
+def sign_hex(body: bytes, secret: str) -> str:
+    return hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+
+def sign_cryptobot(body: bytes, token: str) -> str:
+    key = hashlib.sha256(token.encode("utf-8")).digest()
+    return hmac.new(key, body, hashlib.sha256).hexdigest()
+
+
+def panel_event(telegram_id: int, event: str, secret: str, expire_at=None):
+    expire_at = expire_at or datetime.now(timezone.utc) + timedelta(hours=24)
+    body = _dumps(
+        {
+            "name": event,
+            "payload": {
+                "uuid": f"{telegram_id}-0",
+                "username": f"u{telegram_id}x0",
+                "telegramId": telegram_id,
+                "expireAt": expire_at.isoformat(),
+                "status": "EXPIRED" if event == "user.expired" else "ACTIVE",
+            },
+        }
+    )
+    return body, {
+        "Content-Type": "application/json",
+        "X-Remnawave-Signature": sign_hex(body, secret),
+    }
+
+
+def tribute_donation(telegram_id: int, secret: str, amount_cents: int = 50000):
+    body = _dumps(
+        {
+            "name": "new_donation",
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "payload": {
+                "donation_request_id": next(_ids),
+                "donation_name": "VPN",
+                "message": "",
+                "period": "once",
+                "amount": amount_cents,
+                "currency": "rub",
+                "anonymously": False,
+                "telegram_user_id": telegram_id,
+            },
+        }
+    )
+    return body, {
+        "Content-Type": "application/json",
+        "trbt-signature": sign_hex(body, secret),
+    }
+
+
+def cryptobot_invoice_paid(user_id: int, telegram_id: int, token: str, amount: float = 150.0):
+    invoice_id = next(_ids)
+    now = datetime.now(timezone.utc).isoformat()
+    body = _dumps(
+        {
+            "update_id": invoice_id,
+            "update_type": "invoice_paid",
+            "request_date": now,
+            "payload": {
+                "invoice_id": invoice_id,
+                "hash": f"IV{invoice_id}",
+                "currency_type": "fiat",
+                "fiat": "RUB",
+                "amount": str(amount),
+                "paid_asset": "USDT",
+                "paid_amount": "1.5",
+                "accepted_assets": ["USDT", "TON"],
+                "bot_invoice_url": f"https://t.me/CryptoTestnetBot?start={invoice_id}",
+                "mini_app_invoice_url": f"https://t.me/CryptoTestnetBot/app?startapp={invoice_id}",
+                "web_app_invoice_url": f"https://testnet-app.send.tg/invoices/{invoice_id}",
+                "status": "paid",
+                "created_at": now,
+                "paid_at": now,
+                "allow_comments": True,
+                "allow_anonymous": True,
+                "payload": f"{user_id}_{telegram_id}",
+            },
+        }
+    )
+    return body, {
+        "Content-Type": "application/json",
+        "crypto-pay-api-signature": sign_cryptobot(body, token),
+    }
+
+
+def telegram_update(update, secret_token: str):
+    body = update.model_dump_json(exclude_none=True).encode("utf-8")
+    return body, {
+        "Content-Type": "application/json",
+        "X-Telegram-Bot-Api-Secret-Token": secret_token,
+    }
@@ -0,0 +1,145 @@
+import argparse
+import time
+from datetime import datetime, timezone
+
+from benchmarks.report import build_report, write_report
+from config.locale import Locale
+from config.templates import TEMPLATES, TemplateRegistry, templates
+
+EXPIRES = datetime(2026, 1, 1, 12, 30, tzinfo=timezone.utc)
+
+# the values each screen is rendered with, user supplied fields included
+SCREENS = {
+    "subscription_info": lambda lang: dict(
+        status=templates.render("status_ACTIVE", lang),
+        used_gb="12.34",
+        limit_gb="100.00",
+        expire_date=EXPIRES.strftime("%d.%m.%Y %H:%M"),
+        link="https://panel.example/api/sub/abcdef0123456789",
+    ),
+    "confirm_purchase": lambda lang: dict(limit="100", price=300, desc="3 devices", months=3),
+    "not_enough_money": lambda lang: dict(balance="42.00"),
+    "referrals": lambda lang: dict(reflink="https://t.me/shop_bot?start=3yQ", percent=10),
+    "sub_expiring": lambda lang: dict(hours=24, expire_date="2026-01-01"),
+    "tribute_donation": lambda lang: dict(
+        title=templates.render("tribute_donation_title", lang, name="<VPN> & friends"),
+        donor="Анна <script>",
+        amount=5.0,
+        currency="USD",
+        comment=templates.render("tribute_donation_comment", lang, message="спасибо <3"),
+    ),
+}
+
+
+# what the handlers did before the registry, for comparison
+def _inline_subscription_info(lang, v):
+    locale = Locale(lang)
+    return f"""📊 <b>{locale.get('subscription')}</b>
+🚦 <b>{locale.get('status')}:</b> {v['status']}
+📈 <b>{locale.get('traffic_used')}:</b> {v['used_gb']} GB
+📊 <b>{locale.get('traffic_limit')}:</b> {v['limit_gb']} GB
+📅 <b>{locale.get('expires')}:</b> {v['expire_date']}
+🔗 <b>{locale.get('sub_url')}:</b>
+<code>{v['link']}</code>"""
+
+
+def _inline_confirm_purchase(lang, v):
+    locale = Locale(lang)
+    return (
+        f"{locale.get('confirm_purchase')}\n\n{locale.get('buy_rate')}{v['limit']}\n"
+        f"{locale.get('rate_value')}{v['price']}\n{locale.get('rate_description')}{v['desc']}\n"
+        f"{locale.get('rate_period')}{v['months']}"
+    )
+
+
+def _inline_not_enough_money(lang, v):
+    return f'{Locale(lang).get("not_enough_money")}:{v["balance"]}'
+
+
+def _inline_referrals(lang, v):
+    locale = Locale(lang)
+    return (
+        f"{locale.get('refheader')}\n\n{locale.get('your_reflink')} {v['reflink']}\n"
+        f"{locale.get('ref_percent')} {v['percent']}%\n"
+    )
+
+
+def _inline_sub_expiring(lang, v):
+    locale = Locale(lang)
+    return (
+        f"⏰ <b>{locale.get('sub_expires_soon')}</b>\n\n"
+        f"{locale.get('hours before')}{v['hours']}\n"
+        f"{locale.get('expire_date')}{v['expire_date']}\n"
+        f"{locale.get('dont_forget_renew')}"
+    )
+
+
+def _inline_tribute_donation(lang, v):
+    return (
+        f"💰 <b>Новый донат</b>\n\n{v['title']}👤 От: <b>{v['donor']}</b>\n"
+        f"💵 Сумма: <b>{v['amount']} {v['currency']}</b>\n{v['comment']}"
+    )
+
+
+INLINE = {
+    "subscription_info": _inline_subscription_info,
+    "confirm_purchase": _inline_confirm_purchase,
+    "not_enough_money": _inline_not_enough_money,
+    "referrals": _inline_referrals,
+    "sub_expiring": _inline_sub_expiring,
+    "tribute_donation": _inline_tribute_donation,
+}
+
+
+def timed(fn, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def run(args) -> dict:
+    results = {}
+    for lang in args.langs:
+        for name, values in SCREENS.items():
+            v = values(lang)
+            results[f"{lang}:{name}"] = {
+                "template_us": round(timed(lambda: templates.render(name, lang, **v), args.iterations), 3),
+                "inline_us": round(timed(lambda: INLINE[name](lang, v), args.iterations), 3),
+                "chars": len(templates.render(name, lang, **v)),
+            }
+    started = time.perf_counter()
+    TemplateRegistry(TEMPLATES, args.langs)
+    results["compile"] = {"ms": round((time.perf_counter() - started) * 1000, 3)}
+    return results
+
+
+def print_results(results: dict):
+    header = f"{'lang:screen':<28}{'template us':>12}{'inline us':>12}{'chars':>8}"
+    print(header)
+    print("-" * len(header))
+    for name, row in results.items():
+        if name == "compile":
+            continue
+        print(f"{name:<28}{row['template_us']:>12.2f}{row['inline_us']:>12.2f}{row['chars']:>8}")
+    print(f"compiling {len(TEMPLATES)} templates: {results['compile']['ms']:.2f} ms")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Message render cost per screen")
+    parser.add_argument("--iterations", type=int, default=50000)
+    parser.add_argument("--langs", nargs="*", default=["en", "ru"])
+    parser.add_argument("--output", help="write JSON report to this path")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args)
+    print_results(results)
+    params = {k: v for k, v in vars(args).items() if k != "output"}
+    write_report(build_report("render", params, results), args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import json
+import platform
+import sys
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, float]:
+    total = len(latencies) + errors
+    return {
+        "count": total,
+        "errors": errors,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "throughput_per_s": round(total / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(max(latencies) * 1000, 3) if latencies else 0.0,
+    }
+
+
+def build_report(kind: str, params: dict, results: Dict[str, dict]) -> dict:
+    return {
+        "kind": kind,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "params": params,
+        "results": results,
+    }
+
+
+def print_table(results: Dict[str, dict], baseline: Optional[dict] = None):
+    header = f"{'name':<24}{'count':>8}{'err':>6}{'rate/s':>10}{'p50':>10}{'p95':>10}{'p99':>10}"
+    print(header)
+    print("-" * len(header))
+    base = (baseline or {}).get("results", {})
+    for name, row in results.items():
+        line = (
+            f"{name:<24}{row['count']:>8}{row['errors']:>6}"
+            f"{row['throughput_per_s']:>10.1f}{row['p50_ms']:>10.2f}"
+            f"{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}"
+        )
+        old = base.get(name)
+        if old and old.get("throughput_per_s"):
+            delta = row["throughput_per_s"] / old["throughput_per_s"] - 1
+            line += f"  ({delta:+.1%} rate/s vs baseline)"
+        print(line)
+
+
+def write_report(report: dict, path: Optional[str]):
+    if not path:
+        return
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def load_report(path: Optional[str]) -> Optional[dict]:
+    if not path:
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
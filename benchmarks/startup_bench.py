@@ -0,0 +1,132 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# kept light on purpose: the child process must pay for its own imports
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def offline_cryptopay(latency: float):
+    # CryptoPay validates its token over HTTPS in the constructor, keep the cost without the network
+    from types import SimpleNamespace
+
+    import aiosend.client.client as cryptopay_client
+
+    def token_validate(client, network):
+        time.sleep(latency)
+        return SimpleNamespace(name="bench", app_id=1)
+
+    cryptopay_client.token_validate = token_validate
+
+
+async def child(args):
+    offline_cryptopay(args.cryptopay_latency)
+    import main
+    from database.db import engine
+
+    try:
+        bot, _ = await main.setup_bot()
+        await bot.session.close()
+    finally:
+        await engine.dispose()
+    print(json.dumps(main.timer.summary()))
+
+
+def spawn(env: dict, workdir: str, args) -> dict:
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.startup_bench",
+            "--child",
+            "--cryptopay-latency",
+            str(args.cryptopay_latency),
+        ],
+        env=env,
+        cwd=workdir,
+        capture_output=True,
+        text=True,
+    )
+    wall = time.perf_counter() - started
+    if proc.returncode:
+        raise RuntimeError(f"startup failed:\n{proc.stderr[-2000:]}")
+    phases = json.loads(proc.stdout.strip().splitlines()[-1])
+    phases["wall"] = round(wall * 1000, 1)
+    return phases
+
+
+def run(args) -> dict:
+    from benchmarks.harness import BENCH_ENV, _DB_FILE
+
+    env = {
+        **os.environ,
+        **BENCH_ENV,
+        "PANEL_URL": "http://127.0.0.1:9",
+        "REMNAWAVE_TOKEN": "bench",
+        "PYTHONPATH": ROOT,
+        "LOG_LEVEL": "WARNING",
+    }
+    if os.path.exists(_DB_FILE):
+        os.remove(_DB_FILE)
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        # the first boot creates the schema, the rest only probe its version
+        results["first_boot"] = spawn(env, workdir, args)
+        runs = [spawn(env, workdir, args) for _ in range(args.runs)]
+    for key in runs[0]:
+        results.setdefault("restart_median", {})[key] = round(
+            statistics.median(r[key] for r in runs), 1
+        )
+        results.setdefault("restart_max", {})[key] = max(r[key] for r in runs)
+    return results
+
+
+def print_results(results: dict):
+    phases = list(results["first_boot"])
+    header = f"{'':<16}" + "".join(f"{p:>13}" for p in phases)
+    print(header)
+    print("-" * len(header))
+    for name, row in results.items():
+        print(f"{name:<16}" + "".join(f"{row.get(p, 0):>13.1f}" for p in phases))
+    print("(ms; wall includes interpreter start)")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Boot time up to a ready Dispatcher, with a budget")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=float(os.getenv("STARTUP_BUDGET_MS", "6000")),
+                        help="fail when the median restart wall time exceeds this many ms")
+    parser.add_argument("--cryptopay-latency", type=float, default=0.3,
+                        help="seconds spent in the simulated CryptoPay token check")
+    parser.add_argument("--output", help="write JSON report to this path")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.child:
+        asyncio.run(child(args))
+        return
+    from benchmarks.report import build_report, write_report
+
+    results = run(args)
+    print_results(results)
+    params = {k: v for k, v in vars(args).items() if k not in ("output", "child")}
+    write_report(build_report("startup", params, results), args.output)
+    wall = results["restart_median"]["wall"]
+    if wall > args.budget:
+        print(f"FAIL: median restart {wall:.0f} ms is over the {args.budget:.0f} ms budget")
+        sys.exit(1)
+    print(f"OK: median restart {wall:.0f} ms, budget {args.budget:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
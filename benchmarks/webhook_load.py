@@ -0,0 +1,228 @@
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import random
+import time
+from collections import Counter, defaultdict
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector, web
+
+from benchmarks.harness import (
+    FIRST_USER_ID,
+    UpdateFactory,
+    build_dispatcher,
+    prepare_database,
+    start_panel,
+)
+from benchmarks.fakes import FakeCryptoPayApi, fake_bot
+from benchmarks.payloads import (
+    PANEL_EXPIRY_EVENTS,
+    cryptobot_invoice_paid,
+    panel_event,
+    telegram_update,
+    tribute_donation,
+)
+from benchmarks.report import build_report, load_report, print_table, summarize, write_report
+from config.dotenv import EnvConfig
+from database.db import engine
+from keyboards.callbacks import SelectMonths
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIX = "telegram=70,panel=10,tribute=10,cryptobot=10"
+TELEGRAM_CALLBACKS = (
+    "buy_sub",
+    SelectMonths(rate=1, months=3).pack(),
+    "show_sub",
+    "show_balance",
+)
+
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ("telegram", "panel", "tribute", "cryptobot"):
+            raise argparse.ArgumentTypeError(f"unknown route: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class RequestFactory:
+    def __init__(self, config: EnvConfig, bot_id: int, user_ids: dict):
+        webpath, crypto, panel = config.get_webhook_path()
+        self.paths = {
+            "telegram": webpath,
+            "panel": f"{webpath}{panel}",
+            "tribute": f"{webpath}{config.get_tribute_webhook_path()}",
+            "cryptobot": f"{webpath}{crypto}{config.get_cryptobot_secret()}",
+        }
+        self.config = config
+        self.updates = UpdateFactory(bot_id)
+        self.user_ids = user_ids
+        self.telegram_ids = list(user_ids)
+
+    def build(self, route: str):
+        telegram_id = random.choice(self.telegram_ids)
+        if route == "telegram":
+            if random.random() < 0.2:
+                update = self.updates.message(telegram_id, "/start")
+            else:
+                update = self.updates.callback(telegram_id, random.choice(TELEGRAM_CALLBACKS))
+            body, headers = telegram_update(update, self.config.get_webhook_secret())
+        elif route == "panel":
+            body, headers = panel_event(
+                telegram_id, random.choice(PANEL_EXPIRY_EVENTS), self.config.get_remna_secret()
+            )
+        elif route == "tribute":
+            body, headers = tribute_donation(telegram_id, self.config.get_tribute_secret())
+        else:
+            token, _ = self.config.get_cryptobot_data()
+            body, headers = cryptobot_invoice_paid(
+                self.user_ids[telegram_id], telegram_id, token
+            )
+        return self.paths[route], body, headers
+
+
+async def start_local_server(args, config: EnvConfig):
+    from api.cryptobot import CryptoBotWebhook
+    from main import build_webhook_app
+
+    bot = fake_bot(args.telegram_latency)
+    panel, remnawave, panel_runner = await start_panel(
+        args.panel, args.panel_latency, args.panel_jitter, args.panel_error_rate
+    )
+    user_ids = await prepare_database(args.users, panel)
+    cryptopay = FakeCryptoPayApi().start()
+    token, currency = config.get_cryptobot_data()
+    cryptobot = CryptoBotWebhook(token, currency, bot, network=cryptopay.network)
+    dp = build_dispatcher(bot, remnawave, cryptobot)
+    app = build_webhook_app(dp, bot, config)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", args.port)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, (cryptopay, panel_runner), bot, f"http://127.0.0.1:{port}", user_ids
+
+
+async def generate_load(args, base_url, factory: RequestFactory):
+    routes, weights = zip(*args.mix.items())
+    latencies = defaultdict(list)
+    errors = Counter()
+    statuses = defaultdict(Counter)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    timeout = ClientTimeout(total=args.timeout)
+
+    async with ClientSession(
+        connector=TCPConnector(limit=args.concurrency), timeout=timeout
+    ) as session:
+
+        async def fire(route, scheduled):
+            path, body, headers = factory.build(route)
+            async with semaphore:
+                sent = time.perf_counter()
+                started = scheduled if scheduled is not None else sent
+                try:
+                    async with session.post(base_url + path, data=body, headers=headers) as resp:
+                        await resp.read()
+                        statuses[route][resp.status] += 1
+                        if resp.status >= 400:
+                            errors[route] += 1
+                            return
+                except Exception as e:
+                    statuses[route][type(e).__name__] += 1
+                    errors[route] += 1
+                    return
+                latencies[route].append(time.perf_counter() - started)
+
+        tasks = []
+        started = time.perf_counter()
+        for i in range(args.requests):
+            route = random.choices(routes, weights)[0]
+            scheduled = None
+            if args.rate:
+                scheduled = started + i / args.rate
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(fire(route, scheduled)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+    results = {}
+    for route in routes:
+        row = summarize(latencies[route], errors[route], elapsed)
+        row["statuses"] = {str(k): v for k, v in statuses[route].items()}
+        results[route] = row
+    total = summarize(list(itertools.chain(*latencies.values())), sum(errors.values()), elapsed)
+    results["total"] = total
+    return results
+
+
+async def run(args) -> dict:
+    config = EnvConfig()
+    runner = upstreams = None
+    if args.url:
+        user_ids = {FIRST_USER_ID + i: i + 1 for i in range(args.users)}
+        base_url = args.url.rstrip("/")
+        bot_id = 0
+    else:
+        runner, upstreams, bot, base_url, user_ids = await start_local_server(args, config)
+        bot_id = bot.id
+    try:
+        factory = RequestFactory(config, bot_id, user_ids)
+        if args.warmup:
+            warmup = argparse.Namespace(**{**vars(args), "requests": args.warmup, "rate": 0})
+            await generate_load(warmup, base_url, factory)
+        return await generate_load(args, base_url, factory)
+    finally:
+        if runner:
+            await asyncio.sleep(args.drain)
+            await runner.cleanup()
+            cryptopay, panel_runner = upstreams
+            cryptopay.stop()
+            if panel_runner:
+                await panel_runner.cleanup()
+            await engine.dispose()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP load generator for the webhook server")
+    parser.add_argument("--url", help="target base url; starts a local stubbed server if omitted")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rate", type=float, default=0, help="requests/s, 0 = as fast as possible")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX))
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--drain", type=float, default=1.0, help="seconds to let background updates finish")
+    parser.add_argument("--panel", choices=("stub", "fake"), default="stub",
+                        help="in-process stub client or the fake panel over HTTP")
+    parser.add_argument("--panel-latency", type=float, default=0.0, help="seconds")
+    parser.add_argument("--panel-jitter", type=float, default=0.0, help="seconds")
+    parser.add_argument("--panel-error-rate", type=float, default=0.0)
+    parser.add_argument("--telegram-latency", type=float, default=0.0, help="seconds")
+    parser.add_argument("--output", help="write JSON report to this path")
+    parser.add_argument("--compare", help="baseline JSON report to compare against")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.WARNING)
+    logging.disable(logging.INFO)
+    args = parse_args(argv)
+    results = asyncio.run(run(args))
+    params = {k: v for k, v in vars(args).items() if k not in ("output", "compare")}
+    params["database_url"] = os.environ["DATABASE_URL"].split("@")[-1]
+    print_table(results, load_report(args.compare))
+    write_report(build_report("webhook", params, results), args.output)
+
+
+if __name__ == "__main__":
+    main()
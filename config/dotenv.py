@@ -5,6 +5,8 @@ import secrets
 import string
 import logging
 
+from config.log import parse_logger_map
+
 logger = logging.getLogger(__name__)
 
 
@@ -72,6 +74,72 @@ class EnvConfig:
     def get_tribute_webhook_path(self) -> str:
         return os.getenv("TRIBUTE_WEBHOOK_PATH", "/tribute")
 
+    def get_webhook_max_body(self) -> int:
+        return int(os.getenv("WEBHOOK_MAX_BODY_BYTES", str(256 * 1024)))
+
+    def get_db_profile(self) -> bool:
+        return os.getenv("DB_PROFILE", "false").lower() in ("1", "true", "yes")
+
+    def get_db_query_budget(self):
+        max_queries = int(os.getenv("DB_QUERY_BUDGET", "15"))
+        max_repeats = int(os.getenv("DB_QUERY_MAX_REPEATS", "3"))
+        max_time_ms = float(os.getenv("DB_QUERY_MAX_TIME_MS", "250"))
+        return max_queries, max_repeats, max_time_ms
+
+    def get_expiry_reminders(self):
+        enabled = os.getenv("EXPIRY_REMINDERS", "false").lower() in ("1", "true", "yes")
+        hours = [int(h) for h in os.getenv("EXPIRY_REMINDER_HOURS", "72,24,1").split(",") if h]
+        reload_interval = float(os.getenv("EXPIRY_REMINDER_RELOAD", "300"))
+        return enabled, hours, reload_interval
+
+    def get_traffic_sync(self):
+        enabled = os.getenv("TRAFFIC_SYNC", "false").lower() in ("1", "true", "yes")
+        interval = float(os.getenv("TRAFFIC_SYNC_INTERVAL", "900"))
+        # raw samples are kept this many days, then one per hour until the month is dropped
+        raw_days = int(os.getenv("TRAFFIC_RAW_DAYS", "7"))
+        retention_months = int(os.getenv("TRAFFIC_RETENTION_MONTHS", "13"))
+        return enabled, interval, raw_days, retention_months
+
+    def get_invoice_retention(self):
+        enabled = os.getenv("INVOICE_RETENTION", "true").lower() in ("1", "true", "yes")
+        archive_after = float(os.getenv("INVOICE_ARCHIVE_AFTER_HOURS", "24"))
+        return enabled, archive_after
+
+    def get_log_level(self) -> str:
+        return os.getenv("LOG_LEVEL", "INFO").upper()
+
+    def get_log_format(self) -> str:
+        return os.getenv("LOG_FORMAT", "text").lower()
+
+    def get_log_rotation(self):
+        max_bytes = int(os.getenv("LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+        backup_count = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+        return max_bytes, backup_count
+
+    def get_log_sampling(self):
+        # "logger=value" pairs, e.g. LOG_SAMPLE_RATES="__main__=0.1,api.user_manager=0.5"
+        sample_rates = parse_logger_map(os.getenv("LOG_SAMPLE_RATES"))
+        rate_limits = parse_logger_map(os.getenv("LOG_RATE_LIMITS"))
+        return sample_rates, rate_limits
+
+    def get_throttle(self):
+        # THROTTLE_COSTS="show_sub=3,si=2" overrides the per-prefix costs
+        enabled = os.getenv("THROTTLE", "true").lower() in ("1", "true", "yes")
+        rate = float(os.getenv("THROTTLE_RATE", "1"))
+        burst = float(os.getenv("THROTTLE_BURST", "8"))
+        costs = parse_logger_map(os.getenv("THROTTLE_COSTS"))
+        return enabled, rate, burst, costs
+
+    def get_admin_ids(self) -> set:
+        return {int(i) for i in os.getenv("ADMIN_IDS", "").split(",") if i.strip()}
+
+    def get_shutdown_timeouts(self):
+        # seconds for in-flight updates and payments, then for the outbox queue;
+        # keep the sum under the orchestrator's grace period (docker: 10s by default)
+        drain = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "6"))
+        outbox = float(os.getenv("SHUTDOWN_OUTBOX_TIMEOUT", "3"))
+        return drain, outbox
+
 class GetDatabase:
     @staticmethod
     def generate_password(length: int = 24) -> str:
@@ -109,8 +177,6 @@ class RateConfig:
         rate_1_limit = os.getenv("RATE_LIMIT")
         rate_1_desc = os.getenv("RATE_DESC")
 
-        logger.info(type(rate_1_value))
-
         if rate_1_value is None:
             raise ValueError("RATE is not set in environment")
 
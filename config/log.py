@@ -0,0 +1,176 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Optional
+
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional["NonBlockingQueueHandler"] = None
+
+
+def parse_logger_map(value: Optional[str]) -> Dict[str, float]:
+    result = {}
+    for part in (value or "").split(","):
+        name, _, number = part.strip().partition("=")
+        if name and number:
+            result[name] = float(number)
+    return result
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith("_"):
+                data[key] = value
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    # Only DEBUG/INFO are sampled or rate limited, warnings and errors always pass.
+    def __init__(self, sample_rates: Dict[str, float], rate_limits: Dict[str, float]):
+        super().__init__()
+        self.sample_rates = sample_rates
+        self.rate_limits = rate_limits
+        self._windows: Dict[str, list] = {}
+        # filter() runs on every logging thread, outside the handler lock
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def _lookup(self, table: Dict[str, float], name: str) -> Optional[float]:
+        while name:
+            if name in table:
+                return table[name]
+            name = name.rpartition(".")[0]
+        return table.get("root")
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+
+        rate = self._lookup(self.sample_rates, record.name)
+        if rate is not None and random.random() >= rate:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+        limit = self._lookup(self.rate_limits, record.name)
+        if limit is None:
+            return True
+        now = int(time.monotonic())
+        with self._lock:
+            window = self._windows.setdefault(record.name, [now, 0, 0])
+            if window[0] != now:
+                if window[2]:
+                    record.suppressed = window[2]
+                window[:] = [now, 0, 0]
+            if window[1] >= limit:
+                window[2] += 1
+                self.dropped += 1
+                return False
+            window[1] += 1
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # the queue is in-process, so the record (with exc_info) is passed as is
+        # and formatting happens on the listener thread
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        # called under the handler lock
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(
+    level: str = "INFO",
+    fmt: str = "text",
+    path: str = "logs/app.log",
+    max_bytes: int = 50 * 1024 * 1024,
+    backup_count: int = 5,
+    queue_size: int = 10000,
+    sample_rates: Optional[Dict[str, float]] = None,
+    rate_limits: Optional[Dict[str, float]] = None,
+) -> QueueListener:
+    global _listener, _queue_handler
+    if _listener is not None:
+        return _listener
+
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    if fmt == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(
+            "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+        )
+    file_handler = RotatingFileHandler(
+        path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+    )
+    stream_handler = logging.StreamHandler()
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(formatter)
+
+    queue_handler = NonBlockingQueueHandler(queue.Queue(maxsize=queue_size))
+    queue_handler.addFilter(SamplingFilter(sample_rates or {}, rate_limits or {}))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    _queue_handler = queue_handler
+
+    _listener = QueueListener(
+        queue_handler.queue, file_handler, stream_handler, respect_handler_level=True
+    )
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def log_stats() -> Optional[Dict[str, int]]:
+    if _queue_handler is None:
+        return None
+    filtered = sum(getattr(f, "dropped", 0) for f in _queue_handler.filters)
+    return {"queue_full_dropped": _queue_handler.dropped, "sampled_or_limited": filtered}
+
+
+def stop_logging():
+    global _listener, _queue_handler
+    if _listener is not None:
+        stats = log_stats()
+        if stats and any(stats.values()):
+            logging.getLogger(__name__).warning(f"log records dropped: {stats}")
+        # stop() drains the queue before returning, close() flushes the files
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = _queue_handler = None
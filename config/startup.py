@@ -0,0 +1,35 @@
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    def __init__(self, started: Optional[float] = None):
+        self.started = started if started is not None else time.perf_counter()
+        self.phases: Dict[str, float] = {}
+
+    def record(self, name: str, since: float) -> float:
+        elapsed = time.perf_counter() - since
+        self.phases[name] = elapsed
+        logger.info(f"startup: {name} took {elapsed * 1000:.1f} ms")
+        return elapsed
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, started)
+
+    @property
+    def total(self) -> float:
+        return time.perf_counter() - self.started
+
+    def summary(self) -> Dict[str, float]:
+        summary = {name: round(elapsed * 1000, 1) for name, elapsed in self.phases.items()}
+        summary["total"] = round(self.total * 1000, 1)
+        return summary
@@ -0,0 +1,133 @@
+import re
+from html import escape
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from config.locale import Locale
+
+# [key] is a locale string, resolved once per language when the registry is built.
+# {name} is a value passed to render() and HTML-escaped, {name!raw} is inserted as
+# is and is meant for fragments that were rendered from templates themselves.
+TEMPLATES = {
+    "status_ACTIVE": "🟢 [active]",
+    "status_EXPIRED": "🟡 [expired]",
+    "status_LIMITED": "🟡 [limited]",
+    "status_DISABLED": "🔴 [disabled]",
+    "subscription_info": (
+        "📊 <b>[subscription]</b>\n"
+        "🚦 <b>[status]:</b> {status!raw}\n"
+        "📈 <b>[traffic_used]:</b> {used_gb} GB\n"
+        "📊 <b>[traffic_limit]:</b> {limit_gb} GB\n"
+        "📅 <b>[expires]:</b> {expire_date}\n"
+        "🔗 <b>[sub_url]:</b>\n"
+        "<code>{link}</code>"
+    ),
+    "usage_chart": "📈 <b>[usage_chart]</b>\n<pre>{chart}</pre>\n[usage_total] {total_gb} GB",
+    "usage_chart_empty": "📈 [usage_chart_empty]",
+    "confirm_purchase": (
+        "[confirm_purchase]\n\n"
+        "[buy_rate]{limit}\n"
+        "[rate_value]{price}\n"
+        "[rate_description]{desc}\n"
+        "[rate_period]{months}"
+    ),
+    "rate_not_found": "[rate_not_found]",
+    "not_enough_money": "[not_enough_money]:{balance}",
+    "sub_bought": "[sub_bought]\n[new_balance]{balance}\n[sub_already_in_subs]",
+    "referrals": "[refheader]\n\n[your_reflink] {reflink}\n[ref_percent] {percent}%\n",
+    "referral_item": "• {name}\n",
+    "sub_expiring": (
+        "⏰ <b>[sub_expires_soon]</b>\n\n"
+        "[hours before]{hours}\n"
+        "[expire_date]{expire_date}\n"
+        "[dont_forget_renew]"
+    ),
+    "sub_expired": (
+        "⚠️ <b>[sub_expired]</b>\n\n"
+        "[expiry_date]{expire_date}\n"
+        "[renew_subscription]"
+    ),
+    "tribute_donation": (
+        "💰 <b>[donation_new]</b>\n\n"
+        "{title!raw}"
+        "👤 [donation_from]: <b>{donor}</b>\n"
+        "💵 [donation_amount]: <b>{amount} {currency}</b>\n"
+        "{comment!raw}"
+    ),
+    "tribute_donation_title": "🎯 {name}\n",
+    "tribute_donation_comment": "💬 [donation_message]: <i>{message}</i>\n",
+}
+
+_PLACEHOLDER = re.compile(r"\{(\w+)(!raw)?\}")
+_LOCALE_KEY = re.compile(r"\[([\w ]+)\]")
+
+
+def _escape(value) -> str:
+    text = str(value)
+    if "<" in text or ">" in text or "&" in text:
+        return escape(text, quote=False)
+    return text
+
+
+class Template:
+    # Compiled to a function returning a single f-string: locale strings are baked in
+    # as literals and escaped values go through _escape inline, so rendering is one
+    # call instead of an escape loop plus str.format_map.
+    def __init__(self, name: str, chunks: List[Union[str, Tuple[str, bool]]]):
+        self.name = name
+        fields = [c for c in chunks if isinstance(c, tuple)]
+        self.escaped = tuple(dict.fromkeys(key for key, raw in fields if not raw))
+        self.raw = tuple(dict.fromkeys(key for key, raw in fields if raw))
+        parts = []
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                parts.append(repr(chunk))
+            else:
+                key, raw = chunk
+                parts.append(f"f'{{{key}}}'" if raw else f"f'{{_escape({key})}}'")
+        keys = self.escaped + self.raw
+        params = ", ".join(("*",) + keys + ("**_",)) if keys else "**_"
+        self.source = f"def render({params}):\n    return {' '.join(parts) or repr('')}\n"
+        namespace = {"_escape": _escape}
+        exec(compile(self.source, f"<template {name}>", "exec"), namespace)
+        self.render = namespace["render"]
+
+
+def compile_template(name: str, source: str, locale: Locale) -> Template:
+    chunks, pos = [], 0
+
+    def literal(text: str):
+        text = _LOCALE_KEY.sub(lambda m: locale.get(m.group(1)), text)
+        if text:
+            chunks.append(text)
+
+    for match in _PLACEHOLDER.finditer(source):
+        literal(source[pos : match.start()])
+        chunks.append((match.group(1), bool(match.group(2))))
+        pos = match.end()
+    literal(source[pos:])
+    return Template(name, chunks)
+
+
+class TemplateRegistry:
+    def __init__(self, sources: Dict[str, str] = TEMPLATES, languages: Iterable[str] = None):
+        self.sources = sources
+        self._compiled: Dict[str, Dict[str, Template]] = {}
+        for lang in languages or Locale.translations:
+            self.compile(lang)
+
+    def compile(self, lang: str) -> Dict[str, Template]:
+        locale = Locale(lang)
+        compiled = {name: compile_template(name, source, locale) for name, source in self.sources.items()}
+        self._compiled[lang] = compiled
+        return compiled
+
+    def get(self, template: str, lang: Optional[str]) -> Template:
+        compiled = self._compiled.get(lang) or self._compiled["en"]
+        return compiled[template]
+
+    def render(self, template: str, lang: Optional[str], /, **values) -> str:
+        compiled = self._compiled.get(lang) or self._compiled["en"]
+        return compiled[template].render(**values)
+
+
+templates = TemplateRegistry()
@@ -0,0 +1,173 @@
+import logging
+import re
+from datetime import datetime, timezone
+from typing import Iterable, List, Set, Tuple
+
+from sqlalchemy import Table, event, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+logger = logging.getLogger(__name__)
+
+# Monthly RANGE partitions on postgres, named <table>_YYYY_MM. Other dialects get
+# a plain table and every helper here is a no-op for them.
+
+_SUFFIX = re.compile(r"_(\d{4})_(\d{2})$")
+# partitions this process has already seen, creating one takes a lock on the parent;
+# names are only added once the transaction that saw or created them commits
+_known: Set[str] = set()
+_PENDING = "pending_partitions"
+
+
+def _on_commit(conn: Connection):
+    _known.update(conn.info.pop(_PENDING, ()))
+
+
+def _on_rollback(conn: Connection):
+    # conn.info outlives the checkout, a rolled back CREATE must not be remembered
+    conn.info.pop(_PENDING, None)
+
+
+def _track(conn: AsyncConnection, name: str):
+    engine: Engine = conn.sync_engine
+    if not event.contains(engine, "commit", _on_commit):
+        event.listen(engine, "commit", _on_commit)
+        event.listen(engine, "rollback", _on_rollback)
+    conn.sync_connection.info.setdefault(_PENDING, set()).add(name)
+
+
+def month_start(at: datetime) -> datetime:
+    at = at.astimezone(timezone.utc) if at.tzinfo else at.replace(tzinfo=timezone.utc)
+    return at.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(at: datetime) -> datetime:
+    at = month_start(at)
+    return at.replace(year=at.year + 1, month=1) if at.month == 12 else at.replace(month=at.month + 1)
+
+
+def partition_name(table: str, month: datetime) -> str:
+    return f"{table}_{month_start(month):%Y_%m}"
+
+
+async def ensure_monthly(conn: AsyncConnection, table: str, months: Iterable[datetime]) -> List[str]:
+    if conn.dialect.name != "postgresql":
+        return []
+    created = []
+    for month in sorted({month_start(m) for m in months}):
+        name = partition_name(table, month)
+        if name in _known:
+            continue
+        exists = (await conn.execute(text("SELECT to_regclass(:name)"), {"name": name})).scalar()
+        if exists is None:
+            await conn.execute(
+                text(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+                    f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month(month).isoformat()}')"
+                )
+            )
+            created.append(name)
+            logger.info(f"created partition {name}")
+        _track(conn, name)
+    return created
+
+
+async def list_monthly(conn: AsyncConnection, table: str) -> List[Tuple[str, datetime]]:
+    if conn.dialect.name != "postgresql":
+        return []
+    result = await conn.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :table"
+        ),
+        {"table": table},
+    )
+    partitions = []
+    for (name,) in result:
+        match = _SUFFIX.search(name)
+        if match:
+            month = datetime(int(match[1]), int(match[2]), 1, tzinfo=timezone.utc)
+            partitions.append((name, month))
+    return sorted(partitions, key=lambda p: p[1])
+
+
+async def drop_monthly_before(conn: AsyncConnection, table: str, before: datetime) -> List[str]:
+    # whole months only, a partition still holding rows at or after `before` stays
+    dropped = []
+    for name, month in await list_monthly(conn, table):
+        if next_month(month) <= before:
+            await conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+            _known.discard(name)
+            dropped.append(name)
+            logger.info(f"dropped partition {name}")
+    return dropped
+
+
+async def partition_by_month(conn: AsyncConnection, table: Table, column: str) -> bool:
+    # Turns a plain table into one partitioned by month on `column`, keeping its
+    # rows, sequence, foreign keys and indexes. Meant for init_db, whose
+    # transaction covers the whole swap; tables already partitioned are left alone.
+    if conn.dialect.name != "postgresql":
+        return False
+    name, old = table.name, f"{table.name}_unpartitioned"
+    kind = (
+        await conn.execute(
+            text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:name)"), {"name": name}
+        )
+    ).scalar()
+    if kind != "r":
+        return False
+
+    await conn.execute(text(f"ALTER TABLE {name} RENAME TO {old}"))
+    # index names are per schema, free them for the new table
+    await conn.execute(text(f"ALTER INDEX IF EXISTS {name}_pkey RENAME TO {old}_pkey"))
+    for index in table.indexes:
+        await conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+    # the partition key has to be part of the primary key
+    primary_key = [c.name for c in table.primary_key.columns if c.name != column] + [column]
+    await conn.execute(
+        text(
+            f"CREATE TABLE {name} (LIKE {old} INCLUDING DEFAULTS, "
+            f"PRIMARY KEY ({', '.join(primary_key)})) PARTITION BY RANGE ({column})"
+        )
+    )
+    for fk in table.foreign_key_constraints:
+        await conn.execute(
+            text(
+                f"ALTER TABLE {name} ADD FOREIGN KEY ({', '.join(fk.column_keys)}) "
+                f"REFERENCES {fk.referred_table.name} "
+                f"({', '.join(e.column.name for e in fk.elements)})"
+            )
+        )
+    for col in table.columns:
+        sequence = (
+            await conn.execute(
+                text("SELECT pg_get_serial_sequence(:table, :column)"),
+                {"table": old, "column": col.name},
+            )
+        ).scalar()
+        if sequence:
+            # otherwise dropping the old table takes the id sequence with it
+            await conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {name}.{col.name}"))
+
+    first, last = (
+        await conn.execute(text(f"SELECT min({column}), max({column}) FROM {old}"))
+    ).one()
+    now = datetime.now(timezone.utc)
+    month, end = month_start(first or now), next_month(max(last or now, now))
+    months = []
+    while month <= end:
+        months.append(month)
+        month = next_month(month)
+    await ensure_monthly(conn, name, months)
+
+    moved = (await conn.execute(text(f"INSERT INTO {name} SELECT * FROM {old}"))).rowcount
+    await conn.execute(text(f"DROP TABLE {old}"))
+    for index in table.indexes:
+        await conn.run_sync(index.create)
+    logger.info(
+        f"{name} partitioned by month on {column}, {moved} rows in {len(months)} partitions"
+    )
+    return True
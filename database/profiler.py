@@ -0,0 +1,165 @@
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+
+from aiohttp import web
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+_current_stats: ContextVar[Optional["QueryStats"]] = ContextVar(
+    "query_stats", default=None
+)
+
+_WHITESPACE = re.compile(r"\s+")
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\((?:\s*(?:\?|\$\d+|%\(\w+\)s)\s*,?)+\)")
+
+
+def statement_shape(statement: str) -> str:
+    shape = _WHITESPACE.sub(" ", statement).strip()
+    shape = _STRING_LITERAL.sub("?", shape)
+    shape = _NUMBER_LITERAL.sub("?", shape)
+    return _PLACEHOLDER_LIST.sub("(?)", shape)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryStats:
+    def __init__(self, label: str):
+        self.label = label
+        self.count = 0
+        self.total_time = 0.0
+        self.shapes: Counter = Counter()
+
+    def record(self, statement: str, elapsed: float):
+        self.count += 1
+        self.total_time += elapsed
+        self.shapes[statement_shape(statement)] += 1
+
+    def merge(self, other: "QueryStats"):
+        self.count += other.count
+        self.total_time += other.total_time
+        self.shapes.update(other.shapes)
+
+    def repeated(self, min_count: int = 2) -> Dict[str, int]:
+        return {shape: n for shape, n in self.shapes.items() if n >= min_count}
+
+    def summary(self) -> str:
+        return f"{self.label}: {self.count} queries in {self.total_time * 1000:.1f}ms"
+
+
+def current_stats() -> Optional[QueryStats]:
+    return _current_stats.get()
+
+
+class QueryProfiler:
+    def __init__(
+        self,
+        max_queries: int = 15,
+        max_repeats: int = 3,
+        max_time_ms: float = 250.0,
+    ):
+        self.max_queries = max_queries
+        self.max_repeats = max_repeats
+        self.max_time_ms = max_time_ms
+        self._engines = []
+
+    def install(self, engine):
+        sync_engine = getattr(engine, "sync_engine", engine)
+        if sync_engine in self._engines:
+            return
+        event.listen(sync_engine, "before_cursor_execute", self._before_execute)
+        event.listen(sync_engine, "after_cursor_execute", self._after_execute)
+        self._engines.append(sync_engine)
+        logger.info("query profiler installed")
+
+    def uninstall(self):
+        for sync_engine in self._engines:
+            event.remove(sync_engine, "before_cursor_execute", self._before_execute)
+            event.remove(sync_engine, "after_cursor_execute", self._after_execute)
+        self._engines.clear()
+
+    @staticmethod
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        if _current_stats.get() is not None:
+            conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @staticmethod
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        stats = _current_stats.get()
+        if stats is None:
+            return
+        starts = conn.info.get("query_start")
+        elapsed = time.perf_counter() - starts.pop() if starts else 0.0
+        stats.record(statement, elapsed)
+
+    @contextmanager
+    def track(self, label: str) -> Iterator[QueryStats]:
+        parent = _current_stats.get()
+        stats = QueryStats(label)
+        token = _current_stats.set(stats)
+        try:
+            yield stats
+        finally:
+            _current_stats.reset(token)
+            if parent is not None:
+                parent.merge(stats)
+            self.report(stats)
+
+    def violations(self, stats: QueryStats) -> list:
+        problems = []
+        if stats.count > self.max_queries:
+            problems.append(f"{stats.count} queries > budget {self.max_queries}")
+        if stats.total_time * 1000 > self.max_time_ms:
+            problems.append(
+                f"{stats.total_time * 1000:.1f}ms db time > budget {self.max_time_ms}ms"
+            )
+        for shape, n in stats.repeated(self.max_repeats + 1).items():
+            problems.append(f"possible N+1, {n}x: {shape}")
+        return problems
+
+    def report(self, stats: QueryStats):
+        problems = self.violations(stats)
+        if problems:
+            logger.warning(f"{stats.summary()}; " + "; ".join(problems))
+        elif stats.count:
+            logger.debug(stats.summary())
+
+    @contextmanager
+    def budget(
+        self,
+        max_queries: int,
+        max_repeats: Optional[int] = None,
+        label: str = "budget",
+    ) -> Iterator[QueryStats]:
+        parent = _current_stats.get()
+        stats = QueryStats(label)
+        token = _current_stats.set(stats)
+        try:
+            yield stats
+        finally:
+            _current_stats.reset(token)
+            if parent is not None:
+                parent.merge(stats)
+        if stats.count > max_queries:
+            raise QueryBudgetExceeded(
+                f"{stats.summary()}, expected at most {max_queries}: "
+                f"{dict(stats.shapes)}"
+            )
+        if max_repeats is not None and stats.repeated(max_repeats + 1):
+            raise QueryBudgetExceeded(
+                f"{label}: repeated statements {stats.repeated(max_repeats + 1)}"
+            )
+
+    @web.middleware
+    async def aiohttp_middleware(self, request: web.Request, handler):
+        with self.track(f"{request.method} {request.path}"):
+            return await handler(request)
@@ -0,0 +1,76 @@
+import asyncio
+import itertools
+import logging
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+logger = logging.getLogger(__name__)
+
+LAG_QUERY = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+class ReplicaSet:
+    def __init__(self, urls: List[str], max_lag: float = 5.0, check_interval: float = 2.0):
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.engines: Dict[str, AsyncEngine] = {
+            url: create_async_engine(url, echo=False, pool_pre_ping=True) for url in urls
+        }
+        self.sessions = {
+            url: sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+            for url, engine in self.engines.items()
+        }
+        # replicas serve reads before the first lag check, the monitor demotes them if needed
+        self.healthy = list(self.engines)
+        self.lag: Dict[str, Optional[float]] = {url: None for url in self.engines}
+        self._cycle = itertools.cycle(self.healthy)
+        self._task: Optional[asyncio.Task] = None
+
+    def __bool__(self) -> bool:
+        return bool(self.engines)
+
+    def pick(self) -> Optional[sessionmaker]:
+        if not self.healthy:
+            return None
+        return self.sessions[next(self._cycle)]
+
+    async def check(self):
+        healthy = []
+        for url, engine in self.engines.items():
+            try:
+                async with engine.connect() as conn:
+                    lag = float((await conn.execute(LAG_QUERY)).scalar() or 0)
+            except Exception as e:
+                lag = None
+                logger.warning(f"replica {engine.url.host} unavailable: {e}")
+            self.lag[url] = lag
+            if lag is not None and lag <= self.max_lag:
+                healthy.append(url)
+            elif lag is not None:
+                logger.warning(f"replica {engine.url.host} lags {lag:.1f}s, reading from primary")
+        if healthy != self.healthy:
+            self.healthy = healthy
+            self._cycle = itertools.cycle(healthy)
+
+    async def monitor(self):
+        while True:
+            await self.check()
+            await asyncio.sleep(self.check_interval)
+
+    def start(self):
+        if self.engines and self._task is None:
+            self._task = asyncio.create_task(self.monitor())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for engine in self.engines.values():
+            await engine.dispose()
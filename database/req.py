@@ -1,20 +1,49 @@
-from sqlalchemy import select, update
-from datetime import datetime
-from typing import Optional, List
-from database.db import User, Sublink, Invoice, ReferralLink, get_session
+from sqlalchemy import (
+    select,
+    update,
+    insert,
+    delete,
+    func,
+    or_,
+    any_,
+    bindparam,
+    literal_column,
+    BigInteger,
+    text,
+    tuple_,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Optional, List, Dict, Sequence, Tuple
+from database.db import (
+    User,
+    Sublink,
+    Invoice,
+    InvoiceArchive,
+    ReferralLink,
+    ExpiryReminder,
+    OutboxMessage,
+    TrafficDaily,
+    TrafficSample,
+    get_session,
+)
+from database.partitions import drop_monthly_before, ensure_monthly, next_month
+from database.rollups import ROLLUP_TABLES, Rollup, SIGNUPS, apply_rollups, bucket_start
 
 
 class BaseReqests:
     @staticmethod
     async def get_user_by_id(user_id: int) -> Optional[User]:
-        async with get_session() as session:
+        async with get_session(readonly=True) as session:
             stmt = select(User).where(User.id == user_id)
             result = await session.execute(stmt)
             return result.scalars().first()
 
     @staticmethod
     async def get_user_by_telegram_id(telegram_id: int) -> Optional[User]:
-        async with get_session() as session:
+        async with get_session(readonly=True) as session:
             stmt = select(User).where(User.telegram_id == telegram_id)
             result = await session.execute(stmt)
             return result.scalars().first()
@@ -34,10 +63,106 @@ class UserRequests(BaseReqests):
                 username=username, telegram_id=telegram_id, name=name, locale=locale
             )
             session.add(user)
+            await apply_rollups(session, [Rollup(SIGNUPS)])
             await session.commit()
             await session.refresh(user)
             return user
 
+    @staticmethod
+    async def upsert_user(
+        telegram_id: int, username: str, name: str, locale: str, fetch: bool = True
+    ) -> Tuple[bool, Optional[User]]:
+        values = dict(
+            telegram_id=telegram_id, username=username, name=name, locale=locale or "ru"
+        )
+        async with get_session() as session:
+            if session.bind.dialect.name == "postgresql":
+                stmt = pg_insert(User).values(**values)
+                changed = or_(
+                    User.username.is_distinct_from(stmt.excluded.username),
+                    User.name.is_distinct_from(stmt.excluded.name),
+                    User.locale.is_distinct_from(stmt.excluded.locale),
+                )
+                # xmax is 0 only for a freshly inserted row version
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[User.telegram_id],
+                    set_={
+                        "username": stmt.excluded.username,
+                        "name": stmt.excluded.name,
+                        "locale": stmt.excluded.locale,
+                        "modified_at": func.now(),
+                    },
+                    where=changed,
+                ).returning(User, literal_column("xmax = 0").label("created"))
+                row = (await session.execute(stmt)).first()
+            else:
+                stmt = (
+                    sqlite_insert(User)
+                    .values(**values)
+                    .on_conflict_do_nothing(index_elements=[User.telegram_id])
+                    .returning(User)
+                )
+                user = (await session.execute(stmt)).scalars().first()
+                row = (user, True) if user else None
+                if row is None:
+                    stmt = (
+                        update(User)
+                        .where(
+                            User.telegram_id == telegram_id,
+                            or_(
+                                User.username.is_distinct_from(username),
+                                User.name.is_distinct_from(name),
+                                User.locale.is_distinct_from(values["locale"]),
+                            ),
+                        )
+                        .values(username=username, name=name, locale=values["locale"])
+                        .returning(User)
+                    )
+                    user = (await session.execute(stmt)).scalars().first()
+                    row = (user, False) if user else None
+            if row is not None and row[1]:
+                await apply_rollups(session, [Rollup(SIGNUPS)])
+            await session.commit()
+            if row is not None:
+                return bool(row[1]), row[0]
+            # known user with nothing to refresh, the upsert touched no row
+            if not fetch:
+                return False, None
+            stmt = select(User).where(User.telegram_id == telegram_id)
+            return False, (await session.execute(stmt)).scalars().first()
+
+    @staticmethod
+    async def get_locales_by_telegram_ids(telegram_ids: List[int]) -> Dict[int, str]:
+        async with get_session(readonly=True) as session:
+            if session.bind.dialect.name == "postgresql":
+                # one array parameter keeps a single prepared statement for any batch size
+                ids = bindparam("ids", telegram_ids, type_=ARRAY(BigInteger))
+                condition = User.telegram_id == any_(ids)
+            else:
+                condition = User.telegram_id.in_(telegram_ids)
+            stmt = select(User.telegram_id, User.locale).where(condition)
+            result = await session.execute(stmt)
+            return dict(result.all())
+
+    @staticmethod
+    async def debit_balance(
+        user_id: int, amount: Decimal, outbox: Sequence[OutboxMessage] = ()
+    ) -> Optional[Decimal]:
+        async with get_session() as session:
+            stmt = (
+                update(User)
+                .where(User.id == user_id, User.balance >= amount)
+                .values(balance=User.balance - amount)
+                .returning(User.balance)
+            )
+            balance = (await session.execute(stmt)).scalar()
+            if balance is None:
+                await session.rollback()
+                return None
+            session.add_all(outbox)
+            await session.commit()
+            return balance
+
     @staticmethod
     async def update_user(user_id: int, **kwargs) -> Optional[User]:
         async with get_session() as session:
@@ -50,7 +175,14 @@ class UserRequests(BaseReqests):
 class SublinkRequests(BaseReqests):
     @staticmethod
     async def create_sublink(
-        link: str, expires_at: datetime, username: str, user_id: int, limit_gb, status
+        link: str,
+        expires_at: datetime,
+        username: str,
+        user_id: int,
+        limit_gb,
+        status,
+        outbox: Sequence[OutboxMessage] = (),
+        rollups: Sequence[Rollup] = (),
     ) -> Sublink:
         async with get_session() as session:
             sublink = Sublink(
@@ -62,20 +194,37 @@ class SublinkRequests(BaseReqests):
                 status=status,
             )
             session.add(sublink)
+            session.add_all(outbox)
+            await apply_rollups(session, rollups)
             await session.commit()
             await session.refresh(sublink)
             return sublink
 
     @staticmethod
     async def get_sublink_by_id(sublink_id: int) -> Optional[Sublink]:
-        async with get_session() as session:
+        async with get_session(readonly=True) as session:
             stmt = select(Sublink).where(Sublink.id == sublink_id)
             result = await session.execute(stmt)
             return result.scalars().first()
 
+    @staticmethod
+    async def get_owned_sublink(
+        sublink_id: int, telegram_id: int
+    ) -> Optional[Tuple[Sublink, User]]:
+        # the owner check is part of the join, someone else's id reads as missing
+        async with get_session(readonly=True) as session:
+            stmt = (
+                select(Sublink, User)
+                .join(User, User.id == Sublink.user_id)
+                .where(Sublink.id == sublink_id, User.telegram_id == telegram_id)
+            )
+            result = await session.execute(stmt)
+            row = result.first()
+            return tuple(row) if row else None
+
     @staticmethod
     async def get_sublink_by_user_id(user_id: int) -> List[Sublink]:
-        async with get_session() as session:
+        async with get_session(readonly=True) as session:
             stmt = select(Sublink).where(Sublink.user_id == user_id)
             result = await session.execute(stmt)
             return result.scalars().all()
@@ -90,18 +239,26 @@ class SublinkRequests(BaseReqests):
 
     @staticmethod
     async def get_sublink_by_link(link: int) -> Optional[Sublink]:
-        async with get_session() as session:
+        async with get_session(readonly=True) as session:
             stmt = select(Sublink).where(Sublink.link == link)
             result = await session.execute(stmt)
             return result.scalars().first()
 
 
+# cryptobot invoices can't be paid after this
+INVOICE_TTL = timedelta(hours=1)
+
+
 class InvoiceRequests(BaseReqests):
     @staticmethod
     async def create_invoice(
         status: str, user_id: int, platform: str, amount
     ) -> Invoice:
         async with get_session() as session:
+            now = datetime.now(timezone.utc)
+            await ensure_monthly(
+                await session.connection(), Invoice.__tablename__, [now, next_month(now)]
+            )
             invoice = Invoice(
                 status=status, user_id=user_id, platform=platform, amount=amount
             )
@@ -112,14 +269,14 @@ class InvoiceRequests(BaseReqests):
 
     @staticmethod
     async def get_invoice_by_id(invoice_id: int) -> Optional[Invoice]:
-        async with get_session() as session:
+        async with get_session(readonly=True) as session:
             stmt = select(Invoice).where(Invoice.id == invoice_id)
             result = await session.execute(stmt)
             return result.scalars().first()
 
     @staticmethod
     async def get_invoices_by_user_id(user_id: int) -> List[Invoice]:
-        async with get_session() as session:
+        async with get_session(readonly=True) as session:
             stmt = select(Invoice).where(Invoice.user_id == user_id)
             result = await session.execute(stmt)
             return result.scalars().all()
@@ -132,6 +289,128 @@ class InvoiceRequests(BaseReqests):
             await session.commit()
             return await InvoiceRequests.get_invoice_by_id(invoice_id)
 
+    @staticmethod
+    async def settle_topup(
+        user_id: int,
+        platform: str,
+        amount: Decimal,
+        referral: Optional[Tuple[int, Decimal]] = None,
+        rollups: Sequence[Rollup] = (),
+        outbox: Sequence[OutboxMessage] = (),
+    ) -> Optional[Decimal]:
+        # invoice status, credit, referral fee, counters and notices in one transaction;
+        # the invoice is claimed first, so a repeated webhook finds nothing left to pay
+        now = datetime.now(timezone.utc)
+        async with get_session() as session:
+            match = InvoiceRequests.pending_match(user_id, platform, amount, now)
+            invoice_id = (
+                await session.execute(
+                    update(Invoice)
+                    .where(
+                        Invoice.id == match.correlate(None).scalar_subquery(),
+                        Invoice.status == "pending",
+                        Invoice.created_at >= now - 2 * INVOICE_TTL,
+                    )
+                    .values(status="payed")
+                    .returning(Invoice.id)
+                )
+            ).scalar()
+            if invoice_id is None:
+                await session.rollback()
+                return None
+            balance = (
+                await session.execute(
+                    update(User)
+                    .where(User.id == user_id)
+                    .values(balance=User.balance + amount)
+                    .returning(User.balance)
+                )
+            ).scalar()
+            if balance is None:
+                await session.rollback()
+                return None
+            if referral:
+                owner_id, fee = referral
+                await session.execute(
+                    update(User).where(User.id == owner_id).values(balance=User.balance + fee)
+                )
+            await apply_rollups(session, rollups)
+            session.add_all(outbox)
+            await session.commit()
+            return balance
+
+    @staticmethod
+    def pending_match(user_id: int, platform: str, amount, now: Optional[datetime] = None):
+        # invoices don't keep the provider's id, settle the oldest matching one;
+        # only unexpired ones can be paid, so at most two monthly partitions are read
+        now = now or datetime.now(timezone.utc)
+        return (
+            select(Invoice.id)
+            .where(
+                Invoice.user_id == user_id,
+                Invoice.platform == platform,
+                Invoice.status == "pending",
+                Invoice.amount == float(amount),
+                Invoice.created_at >= now - 2 * INVOICE_TTL,
+            )
+            .order_by(Invoice.id)
+            .limit(1)
+        )
+
+    @staticmethod
+    def expired_pending(before: datetime, limit: int):
+        return (
+            select(Invoice.id)
+            .where(Invoice.status == "pending", Invoice.created_at < before)
+            .order_by(Invoice.created_at)
+            .limit(limit)
+        )
+
+    @staticmethod
+    async def archive_expired(before: datetime, batch_size: int = 5000) -> int:
+        # moves unpaid invoices created before `before` to invoices_archive, one
+        # short transaction per batch so settlements never wait long on it
+        columns = [c.name for c in InvoiceArchive.__table__.columns if c.name != "archived_at"]
+        archived = 0
+        while True:
+            async with get_session() as session:
+                ids = (
+                    await session.execute(InvoiceRequests.expired_pending(before, batch_size))
+                ).scalars().all()
+                if not ids:
+                    return archived
+                # status is checked again, a payment may have settled one meanwhile
+                where = (
+                    Invoice.id.in_(ids),
+                    Invoice.status == "pending",
+                    Invoice.created_at < before,
+                )
+                source = [getattr(Invoice, c) for c in columns]
+                if session.bind.dialect.name == "postgresql":
+                    moved = delete(Invoice).where(*where).returning(*source).cte("moved")
+                    stmt = insert(InvoiceArchive).from_select(
+                        columns, select(*[moved.c[c] for c in columns])
+                    )
+                    await session.execute(stmt)
+                else:
+                    await session.execute(
+                        insert(InvoiceArchive).from_select(columns, select(*source).where(*where))
+                    )
+                    await session.execute(delete(Invoice).where(*where))
+                await session.commit()
+            archived += len(ids)
+            if len(ids) < batch_size:
+                return archived
+
+    @staticmethod
+    async def ensure_partitions(now: Optional[datetime] = None) -> List[str]:
+        now = now or datetime.now(timezone.utc)
+        async with get_session() as session:
+            conn = await session.connection()
+            created = await ensure_monthly(conn, Invoice.__tablename__, [now, next_month(now)])
+            await session.commit()
+            return created
+
 
 class ReferralLinkRequests(BaseReqests):
     @staticmethod
@@ -140,6 +419,7 @@ class ReferralLinkRequests(BaseReqests):
         user_id: int,
         user_tgid,
         user_full_name,
+        outbox: Sequence[OutboxMessage] = (),
     ) -> ReferralLink:
         async with get_session() as session:
             referral = ReferralLink(
@@ -149,34 +429,35 @@ class ReferralLinkRequests(BaseReqests):
                 user_full_name=user_full_name,
             )
             session.add(referral)
+            session.add_all(outbox)
             await session.commit()
             await session.refresh(referral)
             return referral
 
     @staticmethod
     async def get_referral_link_by_id(referral_id: int) -> Optional[ReferralLink]:
-        async with get_session() as session:
+        async with get_session(readonly=True) as session:
             stmt = select(ReferralLink).where(ReferralLink.id == referral_id)
             result = await session.execute(stmt)
             return result.scalars().first()
 
     @staticmethod
     async def get_referral_links_by_owner_id(owner_id: int) -> List[ReferralLink]:
-        async with get_session() as session:
+        async with get_session(readonly=True) as session:
             stmt = select(ReferralLink).where(ReferralLink.owner_id == owner_id)
             result = await session.execute(stmt)
             return result.scalars().all()
 
     @staticmethod
     async def get_referral_link_by_user_id(user_id: int) -> Optional[ReferralLink]:
-        async with get_session() as session:
+        async with get_session(readonly=True) as session:
             stmt = select(ReferralLink).where(ReferralLink.user_id == user_id)
             result = await session.execute(stmt)
             return result.scalars().first()
 
     @staticmethod
     async def get_all_referral_links() -> List[ReferralLink]:
-        async with get_session() as session:
+        async with get_session(readonly=True) as session:
             stmt = select(ReferralLink)
             result = await session.execute(stmt)
             return result.scalars().all()
@@ -194,3 +475,480 @@ class ReferralLinkRequests(BaseReqests):
             await session.execute(stmt)
             await session.commit()
             return await ReferralLinkRequests.get_referral_link_by_id(referral_id)
+
+
+class ReminderRequests:
+    @staticmethod
+    async def get_expiring(start: datetime, end: datetime) -> list:
+        async with get_session() as session:
+            stmt = (
+                select(Sublink.id, Sublink.expires_at, User.telegram_id, User.locale)
+                .join(User, User.id == Sublink.user_id)
+                .where(Sublink.expires_at > start, Sublink.expires_at <= end)
+            )
+            result = await session.execute(stmt)
+            return result.all()
+
+    @staticmethod
+    async def get_last_modified() -> Optional[datetime]:
+        async with get_session() as session:
+            result = await session.execute(select(func.max(Sublink.modified_at)))
+            return result.scalar()
+
+    @staticmethod
+    async def get_changed_since(watermark: datetime) -> list:
+        async with get_session() as session:
+            stmt = (
+                select(
+                    Sublink.id,
+                    Sublink.expires_at,
+                    User.telegram_id,
+                    User.locale,
+                    Sublink.modified_at,
+                )
+                .join(User, User.id == Sublink.user_id)
+                .where(Sublink.modified_at >= watermark)
+            )
+            result = await session.execute(stmt)
+            return result.all()
+
+    @staticmethod
+    async def get_sent(start: datetime, end: datetime) -> list:
+        async with get_session() as session:
+            stmt = select(
+                ExpiryReminder.sublink_id,
+                ExpiryReminder.hours,
+                ExpiryReminder.expires_at,
+            ).where(ExpiryReminder.expires_at > start, ExpiryReminder.expires_at <= end)
+            result = await session.execute(stmt)
+            return result.all()
+
+    @staticmethod
+    async def mark_sent(rows: List[dict]):
+        if not rows:
+            return
+        async with get_session() as session:
+            dialect = session.bind.dialect.name
+            if dialect == "postgresql":
+                stmt = pg_insert(ExpiryReminder).on_conflict_do_nothing()
+            elif dialect == "sqlite":
+                stmt = sqlite_insert(ExpiryReminder).on_conflict_do_nothing()
+            else:
+                stmt = insert(ExpiryReminder)
+            await session.execute(stmt, rows)
+            await session.commit()
+
+
+class OutboxRequests:
+    @staticmethod
+    def build(kind: str, user_key: int, payload: dict) -> OutboxMessage:
+        return OutboxMessage(
+            kind=kind,
+            user_key=user_key,
+            payload=payload,
+            status="pending",
+            attempts=0,
+            available_at=datetime.now(timezone.utc),
+        )
+
+    @staticmethod
+    async def enqueue(kind: str, user_key: int, payload: dict) -> OutboxMessage:
+        async with get_session() as session:
+            message = OutboxRequests.build(kind, user_key, payload)
+            session.add(message)
+            await session.commit()
+            return message
+
+    @staticmethod
+    async def claim(limit: int) -> List[OutboxMessage]:
+        now = datetime.now(timezone.utc)
+        async with get_session() as session:
+            # only the oldest unfinished message of each user is claimable,
+            # which keeps per-user ordering across workers and instances
+            heads = (
+                select(func.min(OutboxMessage.id))
+                .where(OutboxMessage.status.in_(("pending", "processing")))
+                .group_by(OutboxMessage.user_key)
+            )
+            stmt = (
+                select(OutboxMessage)
+                .where(
+                    OutboxMessage.id.in_(heads),
+                    OutboxMessage.status == "pending",
+                    OutboxMessage.available_at <= now,
+                )
+                .order_by(OutboxMessage.id)
+                .limit(limit)
+            )
+            if session.bind.dialect.name == "postgresql":
+                stmt = stmt.with_for_update(skip_locked=True)
+            messages = (await session.execute(stmt)).scalars().all()
+            if messages:
+                await session.execute(
+                    update(OutboxMessage)
+                    .where(OutboxMessage.id.in_([m.id for m in messages]))
+                    .values(status="processing", locked_at=now)
+                )
+            await session.commit()
+            return messages
+
+    @staticmethod
+    async def complete(message_id: int):
+        async with get_session() as session:
+            stmt = (
+                update(OutboxMessage)
+                .where(OutboxMessage.id == message_id)
+                .values(status="done", locked_at=None, attempts=OutboxMessage.attempts + 1)
+            )
+            await session.execute(stmt)
+            await session.commit()
+
+    @staticmethod
+    async def retry(message_id: int, error: str, available_at: datetime):
+        async with get_session() as session:
+            stmt = (
+                update(OutboxMessage)
+                .where(OutboxMessage.id == message_id)
+                .values(
+                    status="pending",
+                    locked_at=None,
+                    attempts=OutboxMessage.attempts + 1,
+                    last_error=error,
+                    available_at=available_at,
+                )
+            )
+            await session.execute(stmt)
+            await session.commit()
+
+    @staticmethod
+    async def fail(
+        message_id: int,
+        error: str,
+        refund: Optional[Tuple[int, Decimal]] = None,
+        outbox: Sequence[OutboxMessage] = (),
+    ):
+        async with get_session() as session:
+            stmt = (
+                update(OutboxMessage)
+                .where(OutboxMessage.id == message_id)
+                .values(
+                    status="failed",
+                    locked_at=None,
+                    attempts=OutboxMessage.attempts + 1,
+                    last_error=error,
+                )
+            )
+            await session.execute(stmt)
+            if refund:
+                user_id, amount = refund
+                await session.execute(
+                    update(User)
+                    .where(User.id == user_id)
+                    .values(balance=User.balance + amount)
+                )
+            session.add_all(outbox)
+            await session.commit()
+
+    @staticmethod
+    async def release_stale(before: datetime) -> int:
+        async with get_session() as session:
+            stmt = (
+                update(OutboxMessage)
+                .where(OutboxMessage.status == "processing", OutboxMessage.locked_at < before)
+                .values(status="pending", locked_at=None)
+            )
+            result = await session.execute(stmt)
+            await session.commit()
+            return result.rowcount
+
+    @staticmethod
+    async def release(message_ids: List[int]) -> int:
+        async with get_session() as session:
+            stmt = (
+                update(OutboxMessage)
+                .where(OutboxMessage.id.in_(message_ids), OutboxMessage.status == "processing")
+                .values(status="pending", locked_at=None)
+            )
+            result = await session.execute(stmt)
+            await session.commit()
+            return result.rowcount
+
+    @staticmethod
+    async def purge(before: datetime) -> int:
+        async with get_session() as session:
+            stmt = delete(OutboxMessage).where(
+                OutboxMessage.status == "done", OutboxMessage.modified_at < before
+            )
+            result = await session.execute(stmt)
+            await session.commit()
+            return result.rowcount
+
+
+class StatsRequests:
+    @staticmethod
+    async def totals(granularity: str, since: datetime) -> list:
+        # bounded by buckets x metrics x dimensions, not by the size of the history
+        table = ROLLUP_TABLES[granularity]
+        async with get_session(readonly=True) as session:
+            stmt = (
+                select(
+                    table.metric,
+                    table.dimension,
+                    func.sum(table.count),
+                    func.sum(table.amount),
+                )
+                .where(table.bucket_start >= since)
+                .group_by(table.metric, table.dimension)
+            )
+            result = await session.execute(stmt)
+            return result.all()
+
+    @staticmethod
+    def _hour(session, column):
+        # hour buckets in UTC, normalized to aware datetimes by _rows
+        if session.bind.dialect.name == "postgresql":
+            return func.date_trunc("hour", func.timezone("UTC", column))
+        return func.strftime("%Y-%m-%d %H:00:00", column)
+
+    @staticmethod
+    def _rows(result) -> list:
+        rows = []
+        for hour, dimension, count, amount in result:
+            if isinstance(hour, str):
+                hour = datetime.fromisoformat(hour)
+            rows.append((bucket_start(hour, "hour"), dimension, count, amount))
+        return rows
+
+    @staticmethod
+    async def signups_by_hour(until: datetime) -> list:
+        async with get_session(readonly=True) as session:
+            hour = StatsRequests._hour(session, User.created_at)
+            stmt = (
+                select(hour, literal_column("''"), func.count(), literal_column("0"))
+                .where(User.created_at < until)
+                .group_by(hour)
+            )
+            return StatsRequests._rows(await session.execute(stmt))
+
+    @staticmethod
+    def topups_stmt(session, until: datetime):
+        hour = StatsRequests._hour(session, Invoice.modified_at)
+        return (
+            select(hour, Invoice.platform, func.count(), func.sum(Invoice.amount))
+            .where(
+                Invoice.status == "payed",
+                Invoice.modified_at < until,
+                # implied by the line above, but lets postgres skip later partitions
+                Invoice.created_at < until,
+            )
+            .group_by(hour, Invoice.platform)
+        )
+
+    @staticmethod
+    async def topups_by_hour(until: datetime) -> list:
+        async with get_session(readonly=True) as session:
+            stmt = StatsRequests.topups_stmt(session, until)
+            return StatsRequests._rows(await session.execute(stmt))
+
+    @staticmethod
+    async def sublinks_by_hour(until: datetime) -> list:
+        # the rate is not stored on the sublink, callers map limit_gb back to it
+        async with get_session(readonly=True) as session:
+            hour = StatsRequests._hour(session, Sublink.created_at)
+            stmt = (
+                select(hour, Sublink.limit_gb, func.count(), literal_column("0"))
+                .where(Sublink.created_at < until)
+                .group_by(hour, Sublink.limit_gb)
+            )
+            return StatsRequests._rows(await session.execute(stmt))
+
+    @staticmethod
+    async def replace_hourly(metrics: Sequence[str], until: datetime, rows: List[dict]):
+        table = ROLLUP_TABLES["hour"]
+        async with get_session() as session:
+            await session.execute(
+                delete(table).where(table.bucket_start < until, table.metric.in_(metrics))
+            )
+            if rows:
+                await session.execute(insert(table), rows)
+            await session.commit()
+
+    @staticmethod
+    async def rebuild_daily(metrics: Sequence[str], until: datetime) -> int:
+        # every day up to and including the one holding `until`, summed from the
+        # hourly rows; live settlements wait on the lock instead of being lost
+        hourly, daily = ROLLUP_TABLES["hour"], ROLLUP_TABLES["day"]
+        end = bucket_start(until, "day") + timedelta(days=1)
+        async with get_session() as session:
+            if session.bind.dialect.name == "postgresql":
+                await session.execute(text("LOCK TABLE stats_daily IN SHARE ROW EXCLUSIVE MODE"))
+            result = await session.execute(
+                select(
+                    hourly.bucket_start,
+                    hourly.metric,
+                    hourly.dimension,
+                    hourly.count,
+                    hourly.amount,
+                ).where(hourly.bucket_start < end, hourly.metric.in_(metrics))
+            )
+            days = {}
+            for hour, metric, dimension, count, amount in result:
+                key = (bucket_start(hour, "day"), metric, dimension)
+                total_count, total_amount = days.get(key, (0, Decimal("0")))
+                days[key] = (total_count + count, total_amount + amount)
+            await session.execute(
+                delete(daily).where(daily.bucket_start < end, daily.metric.in_(metrics))
+            )
+            rows = [
+                {"bucket_start": b, "metric": m, "dimension": d, "count": c, "amount": a}
+                for (b, m, d), (c, a) in sorted(days.items())
+            ]
+            if rows:
+                await session.execute(insert(daily), rows)
+            await session.commit()
+            return len(rows)
+
+
+class TrafficRequests:
+    @staticmethod
+    async def record(counters: Dict[str, int], at: datetime) -> int:
+        # counters are panel used_traffic_bytes keyed by subscription url; only
+        # counters that moved since the last sample are written
+        async with get_session() as session:
+            conn = await session.connection()
+            if conn.dialect.name == "postgresql":
+                # two syncs must not both add the same delta
+                await conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('traffic_samples'))"))
+            await ensure_monthly(conn, TrafficSample.__tablename__, [at, next_month(at)])
+            ids = dict(
+                (
+                    await session.execute(
+                        select(Sublink.link, Sublink.id).where(Sublink.link.in_(list(counters)))
+                    )
+                ).all()
+            )
+            latest = (
+                select(TrafficDaily.sublink_id, func.max(TrafficDaily.day).label("day"))
+                .where(TrafficDaily.sublink_id.in_(list(ids.values())))
+                .group_by(TrafficDaily.sublink_id)
+                .subquery()
+            )
+            last = dict(
+                (
+                    await session.execute(
+                        select(TrafficDaily.sublink_id, TrafficDaily.last_bytes).join(
+                            latest,
+                            (latest.c.sublink_id == TrafficDaily.sublink_id)
+                            & (latest.c.day == TrafficDaily.day),
+                        )
+                    )
+                ).all()
+            )
+
+            day = at.astimezone(timezone.utc).date()
+            samples, days = [], []
+            for link, used in counters.items():
+                sublink_id = ids.get(link)
+                if sublink_id is None or last.get(sublink_id) == used:
+                    continue
+                previous = last.get(sublink_id)
+                if previous is None:
+                    # first sight, whatever was used before is not today's traffic
+                    delta = 0
+                elif used < previous:
+                    # the panel reset the counter
+                    delta = used
+                else:
+                    delta = used - previous
+                samples.append({"sublink_id": sublink_id, "sampled_at": at, "used_bytes": used})
+                days.append(
+                    {"sublink_id": sublink_id, "day": day, "delta_bytes": delta, "last_bytes": used}
+                )
+            if samples:
+                await session.execute(insert(TrafficSample), samples)
+                dialect = session.bind.dialect.name
+                stmt = (pg_insert if dialect == "postgresql" else sqlite_insert)(TrafficDaily)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[TrafficDaily.sublink_id, TrafficDaily.day],
+                    set_={
+                        "delta_bytes": TrafficDaily.delta_bytes + stmt.excluded.delta_bytes,
+                        "last_bytes": stmt.excluded.last_bytes,
+                    },
+                )
+                await session.execute(stmt, sorted(days, key=lambda d: d["sublink_id"]))
+            await session.commit()
+            return len(samples)
+
+    @staticmethod
+    async def get_daily(sublink_id: int, telegram_id: int, since: date) -> list:
+        # ownership is checked in the same query, someone else's id reads as no data
+        async with get_session(readonly=True) as session:
+            stmt = (
+                select(TrafficDaily.day, TrafficDaily.delta_bytes)
+                .join(Sublink, Sublink.id == TrafficDaily.sublink_id)
+                .join(User, User.id == Sublink.user_id)
+                .where(
+                    TrafficDaily.sublink_id == sublink_id,
+                    User.telegram_id == telegram_id,
+                    TrafficDaily.day >= since,
+                )
+                .order_by(TrafficDaily.day)
+            )
+            result = await session.execute(stmt)
+            return result.all()
+
+    @staticmethod
+    async def downsample(start: datetime, end: datetime) -> int:
+        # keeps the last sample of every sublink and hour in [start, end); the
+        # counters are cumulative, so nothing the daily buckets need is lost
+        async with get_session() as session:
+            window = (TrafficSample.sampled_at >= start, TrafficSample.sampled_at < end)
+            hour = StatsRequests._hour(session, TrafficSample.sampled_at)
+            keep = (
+                select(TrafficSample.sublink_id, func.max(TrafficSample.sampled_at))
+                .where(*window)
+                .group_by(TrafficSample.sublink_id, hour)
+            )
+            result = await session.execute(
+                delete(TrafficSample).where(
+                    *window,
+                    tuple_(TrafficSample.sublink_id, TrafficSample.sampled_at).not_in(keep),
+                )
+            )
+            await session.commit()
+            return result.rowcount
+
+    @staticmethod
+    async def purge(before: datetime) -> int:
+        async with get_session() as session:
+            conn = await session.connection()
+            if conn.dialect.name == "postgresql":
+                dropped = await drop_monthly_before(conn, TrafficSample.__tablename__, before)
+                await session.commit()
+                return len(dropped)
+            result = await session.execute(
+                delete(TrafficSample).where(TrafficSample.sampled_at < before)
+            )
+            await session.commit()
+            return result.rowcount
+
+
+class ExportRequests:
+    @staticmethod
+    async def stream(
+        model,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        batch_size: int = 5000,
+    ):
+        # server-side cursor on asyncpg, only one batch of plain tuples is held at a time
+        columns = list(model.__table__.columns)
+        stmt = select(*columns).order_by(model.id)
+        if since is not None:
+            stmt = stmt.where(model.created_at >= since)
+        if until is not None:
+            stmt = stmt.where(model.created_at < until)
+        async with get_session(readonly=True) as session:
+            result = await session.stream(stmt.execution_options(yield_per=batch_size))
+            async for batch in result.partitions():
+                yield batch
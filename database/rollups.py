@@ -0,0 +1,70 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import NamedTuple, Optional, Sequence
+
+from sqlalchemy import insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.db import StatsDaily, StatsHourly
+
+SIGNUPS = "signups"
+TOPUPS = "topups"
+PURCHASES = "purchases"
+REFERRAL_PAYOUTS = "referral_payouts"
+
+ROLLUP_TABLES = {"hour": StatsHourly, "day": StatsDaily}
+
+
+class Rollup(NamedTuple):
+    metric: str
+    dimension: str = ""
+    amount: Decimal = Decimal("0")
+    count: int = 1
+    at: Optional[datetime] = None
+
+
+def bucket_start(at: datetime, granularity: str) -> datetime:
+    at = at.astimezone(timezone.utc) if at.tzinfo else at.replace(tzinfo=timezone.utc)
+    at = at.replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        at = at.replace(hour=0)
+    return at
+
+
+def _upsert(dialect: str, table):
+    if dialect == "postgresql":
+        stmt = pg_insert(table)
+    elif dialect == "sqlite":
+        stmt = sqlite_insert(table)
+    else:
+        return insert(table)
+    return stmt.on_conflict_do_update(
+        index_elements=[table.bucket_start, table.metric, table.dimension],
+        set_={
+            "count": table.count + stmt.excluded.count,
+            "amount": table.amount + stmt.excluded.amount,
+        },
+    )
+
+
+async def apply_rollups(session: AsyncSession, rollups: Sequence[Rollup]):
+    # runs inside the caller's transaction, so a settlement and its counters
+    # commit or roll back together
+    if not rollups:
+        return
+    now = datetime.now(timezone.utc)
+    dialect = session.bind.dialect.name
+    for granularity, table in ROLLUP_TABLES.items():
+        merged = {}
+        for r in rollups:
+            key = (bucket_start(r.at or now, granularity), r.metric, r.dimension)
+            count, amount = merged.get(key, (0, Decimal("0")))
+            merged[key] = (count + r.count, amount + Decimal(str(r.amount)))
+        # a fixed row order keeps two settlements from locking the same rows crosswise
+        rows = [
+            {"bucket_start": b, "metric": m, "dimension": d, "count": c, "amount": a}
+            for (b, m, d), (c, a) in sorted(merged.items())
+        ]
+        await session.execute(_upsert(dialect, table), rows)
@@ -0,0 +1,191 @@
+from datetime import datetime
+from decimal import Decimal
+from typing import AsyncIterator, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import text
+
+from database.db import get_session
+
+
+class Staging(NamedTuple):
+    # columns of the staging table after "line", with their postgres types
+    columns: Tuple[Tuple[str, str], ...]
+    # one row per key survives, the last one in the file
+    key: str
+    target: str
+    conflict: str
+    # target rows built from the deduplicated staging rows, {s} is the staging table
+    select: str
+    merge: str
+
+
+STAGING: Dict[str, Staging] = {
+    "users": Staging(
+        columns=(
+            ("telegram_id", "bigint"),
+            ("username", "text"),
+            ("name", "text"),
+            ("balance", "numeric(10,2)"),
+            ("locale", "text"),
+            ("created_at", "timestamptz"),
+        ),
+        key="telegram_id",
+        target="users (telegram_id, username, name, balance, locale, created_at, modified_at)",
+        conflict="telegram_id",
+        select=(
+            "SELECT s.telegram_id, s.username, COALESCE(s.name, s.username, '') AS name, "
+            "COALESCE(s.balance, 0) AS balance, COALESCE(s.locale, 'ru') AS locale, "
+            "COALESCE(s.created_at, CURRENT_TIMESTAMP) AS created_at, "
+            "CURRENT_TIMESTAMP AS modified_at "
+            "FROM {s} s WHERE s.line IN (SELECT max(line) FROM {s} GROUP BY telegram_id)"
+        ),
+        # balances moved over from the old shop are added to what the user has here
+        merge=(
+            "username = COALESCE(excluded.username, users.username), "
+            "name = COALESCE(NULLIF(excluded.name, ''), users.name), "
+            "locale = excluded.locale, "
+            "balance = users.balance + excluded.balance, "
+            "modified_at = CURRENT_TIMESTAMP"
+        ),
+    ),
+    "sublinks": Staging(
+        columns=(
+            ("telegram_id", "bigint"),
+            ("link", "text"),
+            ("expires_at", "timestamptz"),
+            ("username", "text"),
+            ("limit_gb", "numeric(10,2)"),
+            ("used_gb", "numeric(10,2)"),
+            ("status", "text"),
+            ("created_at", "timestamptz"),
+        ),
+        key="link",
+        target=(
+            "sublinks (link, expires_at, username, user_id, limit_gb, used_gb, status, "
+            "created_at, modified_at)"
+        ),
+        conflict="link",
+        select=(
+            "SELECT s.link, s.expires_at, COALESCE(s.username, '') AS username, u.id AS user_id, "
+            "COALESCE(s.limit_gb, 0) AS limit_gb, COALESCE(s.used_gb, 0) AS used_gb, "
+            "COALESCE(s.status, 'ACTIVE') AS status, "
+            "COALESCE(s.created_at, CURRENT_TIMESTAMP) AS created_at, "
+            "CURRENT_TIMESTAMP AS modified_at "
+            "FROM {s} s JOIN users u ON u.telegram_id = s.telegram_id "
+            "WHERE s.line IN (SELECT max(line) FROM {s} GROUP BY link)"
+        ),
+        merge=(
+            "expires_at = excluded.expires_at, limit_gb = excluded.limit_gb, "
+            "used_gb = excluded.used_gb, status = excluded.status, "
+            "modified_at = CURRENT_TIMESTAMP"
+        ),
+    ),
+    "referral_links": Staging(
+        columns=(
+            ("owner_tgid", "bigint"),
+            ("user_tgid", "bigint"),
+            ("user_full_name", "text"),
+            ("created_at", "timestamptz"),
+        ),
+        key="user_tgid",
+        target=(
+            "referral_links (owner_id, user_id, user_tgid, user_full_name, created_at, modified_at)"
+        ),
+        conflict="user_id",
+        select=(
+            "SELECT o.id AS owner_id, u.id AS user_id, u.telegram_id AS user_tgid, "
+            "COALESCE(s.user_full_name, u.name) AS user_full_name, "
+            "COALESCE(s.created_at, CURRENT_TIMESTAMP) AS created_at, "
+            "CURRENT_TIMESTAMP AS modified_at "
+            "FROM {s} s JOIN users o ON o.telegram_id = s.owner_tgid "
+            "JOIN users u ON u.telegram_id = s.user_tgid "
+            "WHERE o.id <> u.id AND s.line IN (SELECT max(line) FROM {s} GROUP BY user_tgid)"
+        ),
+        merge="owner_id = excluded.owner_id, modified_at = CURRENT_TIMESTAMP",
+    ),
+}
+
+
+def _sqlite_value(value):
+    # same text layout SQLAlchemy writes, so imported rows compare like the rest
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S.%f")
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+async def import_rows(
+    table: str,
+    batches: AsyncIterator[List[tuple]],
+    conflict: str = "skip",
+    dry_run: bool = False,
+    progress: Optional[Callable[[int], None]] = None,
+) -> Dict[str, int]:
+    # Everything happens in one transaction: batches are COPYed into a temp table,
+    # then a single INSERT ... SELECT ... ON CONFLICT merges them. A dry run
+    # reports the same counts and rolls back.
+    spec = STAGING[table]
+    staging = f"import_{table}"
+    columns = ["line"] + [name for name, _ in spec.columns]
+    select = spec.select.format(s=staging)
+    async with get_session() as session:
+        conn = await session.connection()
+        postgres = conn.dialect.name == "postgresql"
+        ddl = ", ".join(f"{name} {kind}" for name, kind in (("line", "integer"),) + spec.columns)
+        if postgres:
+            await conn.execute(text(f"CREATE TEMP TABLE {staging} ({ddl}) ON COMMIT DROP"))
+            driver = (await conn.get_raw_connection()).driver_connection
+        else:
+            await conn.execute(text(f"DROP TABLE IF EXISTS temp.{staging}"))
+            await conn.execute(text(f"CREATE TEMP TABLE {staging} ({ddl})"))
+            insert = text(
+                f"INSERT INTO {staging} ({', '.join(columns)}) "
+                f"VALUES ({', '.join(':' + c for c in columns)})"
+            )
+
+        staged = 0
+        async for batch in batches:
+            if postgres:
+                await driver.copy_records_to_table(staging, records=batch, columns=columns)
+            else:
+                await conn.execute(
+                    insert, [dict(zip(columns, map(_sqlite_value, row))) for row in batch]
+                )
+            staged += len(batch)
+            if progress:
+                progress(staged)
+        if postgres:
+            await conn.execute(text(f"ANALYZE {staging}"))
+
+        async def scalar(sql: str) -> int:
+            return (await conn.execute(text(sql))).scalar() or 0
+
+        unique = await scalar(f"SELECT count(DISTINCT {spec.key}) FROM {staging}")
+        candidates = await scalar(f"SELECT count(*) FROM ({select}) c")
+        existing = await scalar(
+            f"SELECT count(*) FROM ({select}) c JOIN {spec.target.split()[0]} t "
+            f"ON t.{spec.conflict} = c.{spec.conflict}"
+        )
+        counts = {
+            "staged": staged,
+            "duplicates": staged - unique,
+            # owner or referral side not found among users
+            "unresolved": unique - candidates,
+            "new": candidates - existing,
+            "existing": existing,
+            "written": 0,
+        }
+        if dry_run:
+            await session.rollback()
+            return counts
+
+        action = f"DO UPDATE SET {spec.merge}" if conflict == "merge" else "DO NOTHING"
+        result = await conn.execute(
+            text(f"INSERT INTO {spec.target} {select} ON CONFLICT ({spec.conflict}) {action}")
+        )
+        counts["written"] = result.rowcount
+        if not postgres:
+            await conn.execute(text(f"DROP TABLE temp.{staging}"))
+        await session.commit()
+    return counts
@@ -0,0 +1,8 @@
+#!/bin/bash
+set -e
+
+# runs once on a fresh primary data dir, lets the replica service stream WAL
+psql -v ON_ERROR_STOP=1 --username "$POSTGRES_USER" --dbname "$POSTGRES_DB" <<-SQL
+    CREATE ROLE replicator WITH REPLICATION LOGIN PASSWORD '${PSQL_REPLICATION_PASSWD}';
+SQL
+echo "host replication replicator all scram-sha-256" >> "$PGDATA/pg_hba.conf"
@@ -1,17 +1,79 @@
-from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
-from aiogram.filters import Command
-from keyboards.user_keyboards import main_menu_kb, rates_kb, payment_methods_kb
-from config.locale import Locale, escape_markdown_v2
-from config.dotenv import RateConfig
+from aiogram import Router
+from aiogram.filters import Command, CommandObject
+from aiogram.filters.base import Filter
+from aiogram.types import FSInputFile, Message
+from config.dotenv import EnvConfig
+from config.log import log_stats
+from services.analytics import AnalyticsService, format_report
+from services.export import FORMATS, TABLES, Exporter, parse_date
+from html import escape
+import json
 import logging
-from database.req import get_all_users
+import os
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class IsAdmin(Filter):
+    # async on purpose, see keyboards.callbacks.Action
+    def __init__(self, admin_ids=None):
+        self.admin_ids = admin_ids if admin_ids is not None else EnvConfig().get_admin_ids()
+
+    async def __call__(self, message: Message) -> bool:
+        return bool(message.from_user) and message.from_user.id in self.admin_ids
 
-logger = logging.getLogger("__main__")
 
 admin_router = Router()
+admin_router.message.filter(IsAdmin())
 
 
-@admin_router.message(Command="admin")
+@admin_router.message(Command("admin"))
 async def admin_menu(message: Message):
-    await message.answer("hi its admin menu im very lazy to code it lmao")
+    await message.answer(
+        "/stats - revenue and signups from the rollup tables\n"
+        "/throttle - anti-flood, per-user lock and dropped log counters\n"
+        f"/export &lt;{'|'.join(TABLES)}&gt; [{'|'.join(FORMATS)}] [since] [until]"
+    )
+
+
+@admin_router.message(Command("stats"))
+async def show_stats(message: Message):
+    started = time.perf_counter()
+    report = await AnalyticsService().report()
+    logger.info(f"stats built in {(time.perf_counter() - started) * 1000:.1f} ms")
+    await message.answer(format_report(report))
+
+
+@admin_router.message(Command("throttle"))
+async def show_throttle(message: Message, throttle=None, user_locks=None):
+    stats = {
+        "throttle": throttle.stats() if throttle else "disabled",
+        "user_locks": user_locks.stats() if user_locks else None,
+        "logging": log_stats(),
+    }
+    await message.answer(f"<code>{escape(json.dumps(stats, indent=1))}</code>")
+
+
+@admin_router.message(Command("export"))
+async def export_table(message: Message, command: CommandObject):
+    args = (command.args or "").split()
+    fmt = args.pop(1) if len(args) > 1 and args[1] in FORMATS else "csv"
+    try:
+        if not args or args[0] not in TABLES or len(args) > 3:
+            raise ValueError(f"usage: /export <{'|'.join(TABLES)}> [csv|jsonl] [since] [until]")
+        since = parse_date(args[1]) if len(args) > 1 else None
+        until = parse_date(args[2]) if len(args) > 2 else None
+    except ValueError as e:
+        await message.answer(str(e), parse_mode=None)
+        return
+    await message.answer(f"exporting {args[0]}...")
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            paths = await Exporter().export(args[0], fmt, directory, since, until)
+            for path in paths:
+                await message.answer_document(FSInputFile(path, filename=os.path.basename(path)))
+    except Exception as e:
+        logger.exception(f"export of {args[0]} failed: {e}")
+        await message.answer(f"export of {args[0]} failed: {e}", parse_mode=None)
@@ -1,4 +1,4 @@
-from aiogram import Router, F
+from aiogram import Router
 from aiogram.types import Message, CallbackQuery
 from aiogram.filters import CommandStart, CommandObject
 from keyboards.user_keyboards import (
@@ -8,29 +8,43 @@ from keyboards.user_keyboards import (
     crypto_button,
     show_months,
     topup_balance,
-    build_subscription_detail_keyboard,
     build_subscriptions_keyboard,
     confirm_pay,
-    sub_kb,
     back_kb,
 )
+from keyboards.callbacks import Action, PayRate, SelectMonths, SelectRate, SubInfo, SubUsage
 from config.locale import Locale
+from config.templates import templates
 from config.dotenv import RateConfig, EnvConfig
 import logging
 from database.req import (
     UserRequests,
     InvoiceRequests,
     ReferralLinkRequests,
-    SublinkRequests,
+    TrafficRequests,
 )
-from services.user_service import UserService, ReferralService, PaymentService
+from services.user_service import (
+    UserService,
+    ReferralService,
+    PaymentService,
+    PAY_BUSY,
+    PAY_QUEUED,
+)
+from services.outbox import OutboxWorker
+from services.subscription_view import SubscriptionView
+from services.traffic import CHART_DAYS, usage_chart
+from services.known_users import KnownUsers
 from api.user_manager import UserManager
-from api.cryptobot import CryptoBotWebhook
-from remnawave import RemnawaveSDK
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 import base58
+from datetime import datetime, timedelta, timezone
 from decimal import Decimal
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from api.cryptobot import CryptoBotWebhook
+    from remnawave import RemnawaveSDK
 
 logger = logging.getLogger("__main__")
 user_router = Router()
@@ -46,51 +60,50 @@ async def start(message: Message, locale: Locale, command: CommandObject, **kwar
     logger.info(
         f"user {message.from_user.username} started bot. id={message.from_user.id}"
     )
-    client = UserService()
+    client = UserService(kwargs.get("known_users"))
     status, user = await client.create_or_get_user(
         name=message.from_user.full_name,
         telegram_id=message.from_user.id,
         userlang=message.from_user.language_code,
         username=message.from_user.username,
+        fetch=False,
     )
-    logger.info(f"status:{status},user:{user}")
+    logger.debug(f"status:{status},user:{user}")
     if status and command.args:
         ref = ReferralService()
-        logger.info(f"{command.args}")
+        logger.debug(f"{command.args}")
         await ref.create_or_get_referral(
             cryptid=command.args,
-            uid=user.id,
+            user_id=user.id,
             full_name=message.from_user.full_name,
             locale=locale,
             username=message.from_user.username,
             user_tgid=message.from_user.id,
-            bot=kwargs.get("bot"),
+            outbox=kwargs.get("outbox"),
         )
     await message.answer(greeting, reply_markup=main_menu_kb(locale))
 
 
-@user_router.callback_query(F.data == "back_to_main")
-async def restart(callback: CallbackQuery, locale: Locale):
-    callback.answer()
+@user_router.callback_query(Action("back_to_main"))
+async def restart(
+    callback: CallbackQuery, locale: Locale, known_users: Optional[KnownUsers] = None
+):
+    await callback.answer()
     greeting = locale.get("greeting")
-    logger.info(
-        f"user {callback.message.from_user.username} started bot. id={callback.message.from_user.id}"
+    logger.debug(
+        f"user {callback.from_user.username} back to main. id={callback.from_user.id}"
     )
-    client = UserRequests
-    user = await client.create_user(
-        username=callback.message.from_user.username,
-        name=callback.message.from_user.full_name,
-        telegram_id=callback.message.from_user.id,
-        locale=callback.message.from_user.language_code,
+    await UserService(known_users).create_or_get_user(
+        username=callback.from_user.username,
+        name=callback.from_user.full_name,
+        telegram_id=callback.from_user.id,
+        userlang=callback.from_user.language_code,
+        fetch=False,
     )
-    if user:
-        logger.info("user added into db")
-    else:
-        logger.info("user already in db")
     await callback.message.edit_text(greeting, reply_markup=main_menu_kb(locale))
 
 
-@user_router.callback_query(F.data == "buy_sub")
+@user_router.callback_query(Action("buy_sub"))
 async def buy_sub(callback: CallbackQuery, locale: Locale):
     choose_rate = locale.get("choose_rate")
     await callback.answer()
@@ -100,41 +113,47 @@ async def buy_sub(callback: CallbackQuery, locale: Locale):
     )
 
 
-@user_router.callback_query(F.data.startswith("select_rate_"))
-async def choose_months(callback: CallbackQuery, locale: Locale):
-    rate_id = int(callback.data.replace("select_rate_", ""))
+@user_router.callback_query(SelectRate.filter())
+async def choose_months(callback: CallbackQuery, callback_data: SelectRate, locale: Locale):
     await callback.answer()
     await callback.message.edit_text(
-        locale.get("choose_months"), reply_markup=show_months(rate_id, locale)
+        locale.get("choose_months"), reply_markup=show_months(callback_data.rate, locale)
     )
 
 
-@user_router.callback_query(F.data.startswith("select_months_"))
-async def confirm_purchase(callback: CallbackQuery, locale: Locale):
+@user_router.callback_query(SelectMonths.filter())
+async def confirm_purchase(
+    callback: CallbackQuery, callback_data: SelectMonths, locale: Locale
+):
     await callback.answer()
     config = RateConfig()
-    _, _, rate_number, months = callback.data.split("_")
-    months = int(months)
-    logger.info(f"rate_numer:{rate_number},months:{months}")
-    confirm_purchase_locale = locale.get("confirm_purchase")
+    rate_number, months = callback_data.rate, callback_data.months
+    logger.debug(f"rate_numer:{rate_number},months:{months}")
     rate_data = config.get_rate_by_number(rate_number)
     if rate_data:
-        prices = f"{locale.get('buy_rate')}{rate_data['limit']}\n{locale.get('rate_value')}{rate_data['value'] * months}\n{locale.get('rate_description')}{rate_data['desc']}\n{locale.get('rate_period')}{months}"
+        text = templates.render(
+            "confirm_purchase",
+            locale.lang,
+            limit=rate_data["limit"],
+            price=rate_data["value"] * months,
+            desc=rate_data["desc"],
+            months=months,
+        )
     else:
-        prices = "Rate not found"
+        text = templates.render("rate_not_found", locale.lang)
     await callback.message.edit_text(
-        f"{confirm_purchase_locale}\n\n{prices}",
+        text,
         reply_markup=confirm_pay(locale, rate_number, months),
     )
 
 
-@user_router.callback_query(F.data == "show_sub")
-async def show_sub(callback: CallbackQuery, remnawave: RemnawaveSDK, locale: Locale):
+@user_router.callback_query(Action("show_sub"))
+async def show_sub(callback: CallbackQuery, remnawave: "RemnawaveSDK", locale: Locale):
     await callback.answer()
     user = UserManager(remnawave)
     try:
         ans = await user.get_subscription(str(callback.from_user.id))
-        logger.info(f"subscrption get from api:{ans}")
+        logger.debug(f"subscrption get from api:{ans}")
         answer = locale.get("sub_list")
         usr = UserRequests()
         uid = await usr.get_user_by_telegram_id(callback.from_user.id)
@@ -149,43 +168,34 @@ async def show_sub(callback: CallbackQuery, remnawave: RemnawaveSDK, locale: Loc
         await callback.message.edit_text(ans, reply_markup=back_kb(locale))
 
 
-@user_router.callback_query(F.data.startswith("sub_info:"))
+@user_router.callback_query(SubInfo.filter())
 async def show_subscription_info(
-    callback: CallbackQuery, locale: Locale, remnawave: RemnawaveSDK
+    callback: CallbackQuery, callback_data: SubInfo, locale: Locale
 ):
+    view = await SubscriptionView.load(callback_data.sublink_id, callback.from_user.id)
+    if view is None:
+        await callback.answer(locale.get("sub_not_found"), show_alert=True)
+        return
     await callback.answer()
-    data_parts = callback.data.split(":")
-    subid = int(data_parts[1])
-    raw_status = data_parts[2]
-    used_gb = data_parts[3]
-    limit_gb = data_parts[4]
-
-    rq = SublinkRequests()
-    sub = await rq.get_sublink_by_id(subid)
-    expire_at = sub.expires_at
-
-    status_map = {
-        "ACTIVE": f"🟢 {locale.get('active')}",
-        "EXPIRED": f"🟡 {locale.get('expired')}",
-        "LIMITED": f"🟡 {locale.get('limited')}",
-        "DISABLED": f"🔴 {locale.get('disabled')}",
-    }
-    expire_date = expire_at.strftime("%d.%m.%Y %H:%M")
-    status = status_map.get(raw_status)
-    info_text = f"""📊 <b>{locale.get('subscription')}</b>
-🚦 <b>{locale.get('status')}:</b> {status}
-📈 <b>{locale.get('traffic_used')}:</b> {used_gb} GB
-📊 <b>{locale.get('traffic_limit')}:</b> {limit_gb} GB
-📅 <b>{locale.get('expires')}:</b> {expire_date}
-🔗 <b>{locale.get('sub_url')}:</b>
-<code>{sub.link}</code>"""
+    text, markup = view.render(locale, callback_data)
+    await callback.message.answer(text, reply_markup=markup)
 
+
+@user_router.callback_query(SubUsage.filter())
+async def show_usage_chart(callback: CallbackQuery, callback_data: SubUsage, locale: Locale):
+    await callback.answer()
+    today = datetime.now(timezone.utc).date()
+    rows = await TrafficRequests.get_daily(
+        callback_data.sublink_id,
+        callback.from_user.id,
+        today - timedelta(days=CHART_DAYS - 1),
+    )
     await callback.message.answer(
-        info_text, reply_markup=await build_subscription_detail_keyboard(sub.link)
+        usage_chart(locale.lang, rows, today), reply_markup=back_kb(locale)
     )
 
 
-@user_router.callback_query(F.data == "show_balance")
+@user_router.callback_query(Action("show_balance"))
 async def show_balance(callback: CallbackQuery, locale: Locale):
     await callback.answer()
     user = UserRequests()
@@ -195,7 +205,7 @@ async def show_balance(callback: CallbackQuery, locale: Locale):
     )
 
 
-@user_router.callback_query(F.data == "topup_balance")
+@user_router.callback_query(Action("topup_balance"))
 async def choose_pay_type(callback: CallbackQuery, locale: Locale):
     await callback.answer()
     await callback.message.edit_text(
@@ -203,54 +213,33 @@ async def choose_pay_type(callback: CallbackQuery, locale: Locale):
     )
 
 
-@user_router.callback_query(F.data.startswith("pay_rate:"))
-async def pay_rate(callback: CallbackQuery, locale: Locale, remnawave: RemnawaveSDK):
+@user_router.callback_query(PayRate.filter())
+async def pay_rate(
+    callback: CallbackQuery,
+    callback_data: PayRate,
+    locale: Locale,
+    outbox: Optional[OutboxWorker] = None,
+):
     await callback.answer()
-    ps = PaymentService()
-    payment, ballance = await ps.service_pay_rate(
-        tgid=callback.from_user.id, callbackdata=callback.data
+    # shown before the job is queued, the worker edits this message with the
+    # result and must not be overwritten by it
+    await callback.message.edit_text(locale.get("sub_processing"))
+    ps = PaymentService(outbox)
+    status, ballance = await ps.service_pay_rate(
+        tgid=callback.from_user.id,
+        rate_number=callback_data.rate,
+        months=callback_data.months,
+        message_id=callback.message.message_id,
     )
-    """     rq = UserRequests()
-    rt = RateConfig()
-    sb = SublinkRequests()
-    submanager = UserManager(remnawave)
-    rate_number = callback.data.split(":")[1]
-    months = callback.data.split(":")[2]
-    usr = await rq.get_user_by_telegram_id(callback.from_user.id)
-    rate_data = rt.get_rate_by_number(rate_number)
-    value = Decimal(str(rate_data["value"]))
-    limit = int(rate_data["limit"])
-    limit_bytes = limit * 1024**3 """
-
-    """ if usr.balance >= value:
-        await rq.update_user(user_id=usr.id, balance=usr.balance - value)
-        sub = await submanager.create_user(callback.from_user.id, months, limit_bytes)
-        await sb.create_sublink(
-            link=sub.subscription_url,
-            expires_at=sub.expire_at,
-            username=sub.username,
-            user_id=usr.id,
-            limit_gb=sub.traffic_limit_bytes / 1024**3,
-            status=sub.status,
-        )
-        logger.info(f"sublink created:{sub.subscription_url}")
-
-        )
-
-    else:
-        await callback.message.edit_text(
-            f'{locale.get("not_enough_money")}:{usr.balance}'
-    ) """
-    if payment:
+    if status == PAY_BUSY:
+        await callback.message.edit_text(locale.get("sub_in_progress"))
+    elif status != PAY_QUEUED:
         await callback.message.edit_text(
-            f'{locale.get("sub_bought")}\n{locale.get("new_balance")}{ballance}\n{locale.get("sub_already_in_subs")}',
-            callback_data=sub_kb(locale),
+            templates.render("not_enough_money", locale.lang, balance=ballance)
         )
-    else:
-        await callback.message.edit_text(f'{locale.get("not_enough_money")}:{ballance}')
 
 
-@user_router.callback_query(F.data == "pay_crypto")
+@user_router.callback_query(Action("pay_crypto"))
 async def pay_crypto_start(callback: CallbackQuery, locale: Locale, state: FSMContext):
     await callback.answer()
     await state.set_state(PaymentStates.waiting_amount)
@@ -264,7 +253,7 @@ async def process_amount_and_create_invoice(
     message: Message,
     locale: Locale,
     state: FSMContext,
-    cryptobot: CryptoBotWebhook,
+    cryptobot: "CryptoBotWebhook",
     **kwargs,
 ):
     try:
@@ -312,7 +301,7 @@ async def process_amount_and_create_invoice(
         logger.exception(f"error:{e}")
 
 
-@user_router.callback_query(F.data == "show_refferals")
+@user_router.callback_query(Action("show_refferals"))
 async def show_refs(callback: CallbackQuery, locale: Locale, **kwargs):
     env = EnvConfig()
     percent = env.get_ref_percent()
@@ -322,20 +311,15 @@ async def show_refs(callback: CallbackQuery, locale: Locale, **kwargs):
     tg_id = callback.from_user.id
     cryptedid = base58.b58encode_int(tg_id).decode()
     reflink = f"https://t.me/{me.username}?start={cryptedid}"
-    ans = f"""{locale.get("refheader")}
-
-{locale.get("your_reflink")} {reflink}
-{locale.get("ref_percent")} {percent}%
-    """
+    ans = templates.render("referrals", locale.lang, reflink=reflink, percent=percent)
     user = UserRequests()
-    owner_id = await user.get_user_by_telegram_id(tg_id)
+    owner = await user.get_user_by_telegram_id(tg_id)
     try:
         refs = ReferralLinkRequests()
-        referrals = await refs.get_referral_links_by_owner_id(owner_id=owner_id)
+        referrals = await refs.get_referral_links_by_owner_id(owner_id=owner.id)
 
         for ref in referrals:
-            ans += f"""• {ref.full_name}
-            """
+            ans += templates.render("referral_item", locale.lang, name=ref.user_full_name)
     except Exception as e:
         logger.debug(e)
     await callback.message.edit_text(ans)
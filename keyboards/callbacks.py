@@ -0,0 +1,304 @@
+import base64
+import binascii
+from enum import Enum
+from typing import Any, Callable, ClassVar, Dict, List, Literal, Optional, Tuple, Type, Union
+
+from aiogram.filters.base import Filter
+from aiogram.filters.callback_data import MAX_CALLBACK_LENGTH, CallbackData
+from aiogram.types import CallbackQuery
+from annotated_types import Ge, Le, MaxLen
+from magic_filter import MagicFilter
+from pydantic import Field
+
+# Callback payloads are "<prefix>:<base64url(version byte + fields)>". Fields are
+# packed in declaration order: ints as varints, enums as member indexes, strings
+# as length-prefixed utf-8. Every class is checked against Telegram's 64 byte
+# limit when it is defined, using the largest value each field can hold.
+
+REGISTRY: Dict[str, Type["PackedCallbackData"]] = {}
+
+# pre-codec callback strings still sitting in old chat messages
+LEGACY_PREFIXES = ("sub_info:", "pay_rate:", "select_months_", "select_rate_")
+
+
+class StaleCallbackError(ValueError):
+    pass
+
+
+def _write_varint(out: bytearray, value: int):
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(raw: bytes, pos: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        if pos >= len(raw) or shift > 63:
+            raise ValueError("truncated varint")
+        byte = raw[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def _varint_size(value: int) -> int:
+    return max(1, (value.bit_length() + 6) // 7)
+
+
+def _zigzag(value: int) -> int:
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+
+def _unzigzag(value: int) -> int:
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+class _Codec:
+    def __init__(self, size: int, encode: Callable, decode: Callable):
+        self.size = size
+        self.encode = encode
+        self.decode = decode
+
+
+def _constraint(field, kind, attr):
+    for meta in field.metadata:
+        if isinstance(meta, kind):
+            return getattr(meta, attr)
+    return None
+
+
+def _int_codec(field) -> _Codec:
+    low, high = _constraint(field, Ge, "ge"), _constraint(field, Le, "le")
+    if low is not None and low >= 0:
+        size = _varint_size(high) if high is not None else 10
+
+        def decode(raw, pos):
+            return _read_varint(raw, pos)
+
+        return _Codec(size, _write_varint, decode)
+
+    size = 10
+    if low is not None and high is not None:
+        size = max(_varint_size(_zigzag(low)), _varint_size(_zigzag(high)))
+
+    def decode(raw, pos):
+        value, pos = _read_varint(raw, pos)
+        return _unzigzag(value), pos
+
+    return _Codec(size, lambda out, value: _write_varint(out, _zigzag(value)), decode)
+
+
+def _bool_codec(field) -> _Codec:
+    def decode(raw, pos):
+        if pos >= len(raw):
+            raise ValueError("truncated bool")
+        return bool(raw[pos]), pos + 1
+
+    return _Codec(1, lambda out, value: out.append(1 if value else 0), decode)
+
+
+def _enum_codec(field) -> _Codec:
+    members = list(field.annotation)
+    index = {member: i for i, member in enumerate(members)}
+
+    def decode(raw, pos):
+        i, pos = _read_varint(raw, pos)
+        if i >= len(members):
+            raise ValueError(f"unknown {field.annotation.__name__} index {i}")
+        return members[i], pos
+
+    return _Codec(
+        _varint_size(len(members) - 1),
+        lambda out, value: _write_varint(out, index[value]),
+        decode,
+    )
+
+
+def _str_codec(field) -> _Codec:
+    max_length = _constraint(field, MaxLen, "max_length")
+    if max_length is None:
+        raise TypeError("str callback fields need a max_length")
+    max_bytes = max_length * 4
+
+    def encode(out, value):
+        data = value.encode()
+        _write_varint(out, len(data))
+        out += data
+
+    def decode(raw, pos):
+        length, pos = _read_varint(raw, pos)
+        if pos + length > len(raw):
+            raise ValueError("truncated str")
+        return raw[pos : pos + length].decode(), pos + length
+
+    return _Codec(_varint_size(max_bytes) + max_bytes, encode, decode)
+
+
+def _codec(name: str, field) -> _Codec:
+    annotation = field.annotation
+    if annotation is bool:
+        return _bool_codec(field)
+    if annotation is int:
+        return _int_codec(field)
+    if isinstance(annotation, type) and issubclass(annotation, Enum):
+        return _enum_codec(field)
+    if annotation is str:
+        return _str_codec(field)
+    raise TypeError(f"callback field {name}: {annotation} can not be packed")
+
+
+def _encoded_length(size: int) -> int:
+    return (size * 4 + 2) // 3
+
+
+class PackedCallbackData(CallbackData, prefix="packed"):
+    __version__: ClassVar[int]
+    __codecs__: ClassVar[List[Tuple[str, _Codec]]]
+    __max_length__: ClassVar[int]
+
+    def __init_subclass__(cls, **kwargs: Any):
+        cls.__version__ = kwargs.pop("version", 1)
+        if not 0 <= cls.__version__ <= 255:
+            raise ValueError(f"{cls.__name__}: version must fit in one byte")
+        super().__init_subclass__(**kwargs)
+
+    @classmethod
+    def __pydantic_init_subclass__(cls, **kwargs: Any):
+        super().__pydantic_init_subclass__(**kwargs)
+        cls.__codecs__ = [(name, _codec(name, f)) for name, f in cls.model_fields.items()]
+        size = 1 + sum(codec.size for _, codec in cls.__codecs__)
+        cls.__max_length__ = len(cls.__prefix__) + 1 + _encoded_length(size)
+        if cls.__max_length__ > MAX_CALLBACK_LENGTH:
+            raise TypeError(
+                f"{cls.__name__} can take up to {cls.__max_length__} bytes, "
+                f"callback data is limited to {MAX_CALLBACK_LENGTH}"
+            )
+        registered = REGISTRY.get(cls.__prefix__)
+        if registered is not None and registered.__qualname__ != cls.__qualname__:
+            raise ValueError(
+                f"callback prefix {cls.__prefix__!r} is used by {registered.__name__}"
+            )
+        REGISTRY[cls.__prefix__] = cls
+
+    def pack(self) -> str:
+        out = bytearray((self.__version__,))
+        for name, codec in self.__codecs__:
+            codec.encode(out, getattr(self, name))
+        return f"{self.__prefix__}:{base64.urlsafe_b64encode(out).rstrip(b'=').decode()}"
+
+    @classmethod
+    def unpack(cls, value: str) -> "PackedCallbackData":
+        prefix, _, payload = value.partition(":")
+        if prefix != cls.__prefix__:
+            raise ValueError(f"Bad prefix ({prefix!r} != {cls.__prefix__!r})")
+        try:
+            raw = base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4))
+        except binascii.Error as e:
+            raise ValueError(f"bad {cls.__name__} payload: {e}")
+        if not raw:
+            raise ValueError(f"empty {cls.__name__} payload")
+        if raw[0] != cls.__version__:
+            raise StaleCallbackError(
+                f"{cls.__name__} v{raw[0]} is outdated, current is v{cls.__version__}"
+            )
+        values, pos = {}, 1
+        for name, codec in cls.__codecs__:
+            values[name], pos = codec.decode(raw, pos)
+        if pos != len(raw):
+            raise ValueError(f"trailing bytes in {cls.__name__} payload")
+        return cls(**values)
+
+    @classmethod
+    def filter(cls, rule: Optional[MagicFilter] = None) -> "PackedCallbackFilter":
+        return PackedCallbackFilter(callback_data=cls, rule=rule)
+
+
+def parse(data: Optional[str]) -> Optional[PackedCallbackData]:
+    if not data:
+        return None
+    cls = REGISTRY.get(data.partition(":")[0])
+    if cls is None:
+        if data.startswith(LEGACY_PREFIXES):
+            raise StaleCallbackError(f"legacy callback {data!r}")
+        return None
+    return cls.unpack(data)
+
+
+class PackedCallbackFilter(Filter):
+    __slots__ = ("callback_data", "rule")
+
+    def __init__(self, *, callback_data: Type[PackedCallbackData], rule: Optional[MagicFilter] = None):
+        self.callback_data = callback_data
+        self.rule = rule
+
+    def __str__(self) -> str:
+        return self._signature_to_string(callback_data=self.callback_data, rule=self.rule)
+
+    async def __call__(
+        self, query: CallbackQuery, packed_callback: Optional[PackedCallbackData] = None
+    ) -> Union[Literal[False], Dict[str, Any]]:
+        # CallbackDataMiddleware decodes once per update, the filter is then a type check
+        if packed_callback is None:
+            if not isinstance(query, CallbackQuery) or not query.data:
+                return False
+            try:
+                packed_callback = self.callback_data.unpack(query.data)
+            except (TypeError, ValueError):
+                return False
+        if type(packed_callback) is not self.callback_data:
+            return False
+        if self.rule is None or self.rule.resolve(packed_callback):
+            return {"callback_data": packed_callback}
+        return False
+
+
+class Action(Filter):
+    # Plain callback strings. aiogram runs sync filters such as F.data == "..." in
+    # the default executor, a thread hop for every handler checked on every update.
+    __slots__ = ("action",)
+
+    def __init__(self, action: str):
+        self.action = action
+
+    def __str__(self) -> str:
+        return self._signature_to_string(action=self.action)
+
+    async def __call__(self, query: CallbackQuery) -> bool:
+        return query.data == self.action
+
+
+class SubStatus(str, Enum):
+    ACTIVE = "ACTIVE"
+    DISABLED = "DISABLED"
+    LIMITED = "LIMITED"
+    EXPIRED = "EXPIRED"
+
+
+class SelectRate(PackedCallbackData, prefix="sr"):
+    rate: int = Field(ge=1, le=9)
+
+
+class SelectMonths(PackedCallbackData, prefix="sm"):
+    rate: int = Field(ge=1, le=9)
+    months: int = Field(ge=1, le=12)
+
+
+class PayRate(PackedCallbackData, prefix="pr"):
+    rate: int = Field(ge=1, le=9)
+    months: int = Field(ge=1, le=12)
+
+
+class SubInfo(PackedCallbackData, prefix="si"):
+    sublink_id: int = Field(ge=1)
+    status: SubStatus
+    used_bytes: int = Field(ge=0)
+    # 0 means unlimited, as in the panel
+    limit_bytes: int = Field(ge=0)
+
+
+class SubUsage(PackedCallbackData, prefix="su"):
+    sublink_id: int = Field(ge=1)
@@ -7,6 +7,9 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 import database.req as rq
 from config.dotenv import RateConfig
 from config.locale import Locale
+from keyboards.callbacks import PayRate, SelectMonths, SelectRate, SubInfo, SubStatus, SubUsage
+
+logger = logging.getLogger(__name__)
 
 
 def back_kb(locale):
@@ -67,7 +70,7 @@ def rates_kb(locale, config: Optional[RateConfig] = None):
 
         for rate_key, rate_data in rates.items():
             button_text = f"{rate_data['limit']} - {rate_data['value']}"
-            callback_data = f"select_{rate_key}"
+            callback_data = SelectRate(rate=int(rate_key.split("_")[1])).pack()
 
             button = InlineKeyboardButton(text=button_text, callback_data=callback_data)
             buttons.append([button])
@@ -117,7 +120,7 @@ def rates_kb_compact(
 
         for rate_key, rate_data in rates.items():
             button_text = f"{rate_data['limit']}\n{rate_data['value']}"
-            callback_data = f"select_{rate_key}"
+            callback_data = SelectRate(rate=int(rate_key.split("_")[1])).pack()
 
             button = InlineKeyboardButton(text=button_text, callback_data=callback_data)
 
@@ -233,7 +236,8 @@ def confirm_pay(locale, rate_id, months):
     buttons = [
         [
             InlineKeyboardButton(
-                text=locale.get("pay"), callback_data=f"pay_rate:{rate_id}:{months}"
+                text=locale.get("pay"),
+                callback_data=PayRate(rate=rate_id, months=months).pack(),
             )
         ]
     ]
@@ -252,7 +256,7 @@ def rates_kb_dict_locale(
 
         for rate_key, rate_data in rates.items():
             button_text = f"{rate_data['limit']} - {rate_data['value']}"
-            callback_data = f"select_{rate_key}"
+            callback_data = SelectRate(rate=int(rate_key.split("_")[1])).pack()
 
             button = InlineKeyboardButton(text=button_text, callback_data=callback_data)
             buttons.append([button])
@@ -282,25 +286,25 @@ def show_months(rate_id, locale):
             [
                 InlineKeyboardButton(
                     text=locale.get("1_month"),
-                    callback_data=f"select_months_{rate_id}_1",
+                    callback_data=SelectMonths(rate=rate_id, months=1).pack(),
                 )
             ],
             [
                 InlineKeyboardButton(
                     text=locale.get("3_month"),
-                    callback_data=f"select_months_{rate_id}_3",
+                    callback_data=SelectMonths(rate=rate_id, months=3).pack(),
                 )
             ],
             [
                 InlineKeyboardButton(
                     text=locale.get("6_month"),
-                    callback_data=f"select_months_{rate_id}_6",
+                    callback_data=SelectMonths(rate=rate_id, months=6).pack(),
                 )
             ],
             [
                 InlineKeyboardButton(
                     text=locale.get("12_month"),
-                    callback_data=f"select_months_{rate_id}_12",
+                    callback_data=SelectMonths(rate=rate_id, months=12).pack(),
                 )
             ],
         ]
@@ -330,8 +334,7 @@ async def build_subscriptions_keyboard(user_response, uid):
         button_text = f"{status_emoji} {used_gb}/{limit_gb} {locale.get('GB')}"
 
         sub = await sublink.get_sublink_by_link(subscription.subscription_url)
-        print(f"Looking for: {subscription.subscription_url}")
-        print(f"Found sub: {sub}")
+        logger.debug(f"sublink for {subscription.subscription_url}: {sub}")
         if sub:
             await sublink.update_sublink(
                 sublink_id=sub.id,
@@ -344,7 +347,12 @@ async def build_subscriptions_keyboard(user_response, uid):
         builder.add(
             InlineKeyboardButton(
                 text=button_text,
-                callback_data=f"sub_info:{sub.id}:{subscription.status.value}:{used_gb}:{limit_gb}:{subscription.expire_at}",
+                callback_data=SubInfo(
+                    sublink_id=sub.id,
+                    status=SubStatus(subscription.status.value),
+                    used_bytes=int(subscription.used_traffic_bytes),
+                    limit_bytes=max(subscription.traffic_limit_bytes or 0, 0),
+                ).pack(),
             )
         )
     total_subs = len(subscriptions)
@@ -360,21 +368,15 @@ async def build_subscriptions_keyboard(user_response, uid):
     return builder.as_markup()
 
 
-async def build_subscription_detail_keyboard(subscription_url):
-
+def subscription_detail_kb(locale, link: str, sublink_id: int):
     builder = InlineKeyboardBuilder()
-    sublink = rq.SublinkRequests
-    sl = await sublink.get_sublink_by_link(subscription_url)
-    uid = sl.user_id
-    userreq = rq.UserRequests()
-    usr = await userreq.get_user_by_id(uid)
-    lang = usr.locale
-    locale = Locale(lang)
-
-    builder.add(InlineKeyboardButton(text=locale.get("open_sub"), url=f"{sl.link}"))
-
-    builder.add(InlineKeyboardButton(text="◀️ Назад", callback_data="back_to_subs"))
-
+    builder.add(InlineKeyboardButton(text=locale.get("open_sub"), url=link))
+    builder.add(
+        InlineKeyboardButton(
+            text=locale.get("usage_chart_button"),
+            callback_data=SubUsage(sublink_id=sublink_id).pack(),
+        )
+    )
+    builder.add(InlineKeyboardButton(text=locale.get("back"), callback_data="back_to_subs"))
     builder.adjust(2, 1)
-
     return builder.as_markup()
@@ -1,6 +1,10 @@
-import asyncio
-import logging
-import os
+import time
+
+IMPORTS_STARTED = time.perf_counter()
+
+import asyncio  # noqa: E402
+from datetime import timedelta  # noqa: E402
+import logging  # noqa: E402
 
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
@@ -9,25 +13,49 @@ from aiohttp import web
 from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 
 from config.dotenv import EnvConfig
-from middleware import LocaleMiddleware
+from config.log import setup_logging as start_log_listener, stop_logging
+from config.startup import StartupTimer
+from middleware import (
+    CallbackDataMiddleware,
+    InFlightMiddleware,
+    LocaleMiddleware,
+    QueryProfilerMiddleware,
+    SerializeMiddleware,
+    ThrottleMiddleware,
+)
+from handlers.admin_handlers import admin_router
 from handlers.user_handlers import user_router
-from database.db import init_db
-from remnawave import RemnawaveSDK
+from database.db import init_db, engine, replicas
+from database.profiler import QueryProfiler
+from services.locale_loader import LocaleLoader
+from services.outbox import OutboxWorker
+from services.known_users import KnownUsers
+from services.inflight import InFlight
+from services.throttle import Throttle
+from services.user_locks import UserLocks
+from services.reminders import ExpiryReminderScheduler
+from services.retention import InvoiceRetention
+from services.traffic import TrafficSync
 
 from api.user_manager import PanelWebhookHandler
-from api.cryptobot import CryptoBotWebhook
 from api.tribute import TributeWebhookHandler
+from api.signature import build_scheme, signature_middleware
 
 dp = Dispatcher()
 
 
 def setup_logging():
-    if not os.path.exists("logs"):
-        os.makedirs("logs")
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-        handlers=[logging.FileHandler("logs/app.log"), logging.StreamHandler()],
+    config = EnvConfig()
+    max_bytes, backup_count = config.get_log_rotation()
+    sample_rates, rate_limits = config.get_log_sampling()
+    start_log_listener(
+        level=config.get_log_level(),
+        fmt=config.get_log_format(),
+        path="logs/app.log",
+        max_bytes=max_bytes,
+        backup_count=backup_count,
+        sample_rates=sample_rates,
+        rate_limits=rate_limits,
     )
     for logger_name in [
         "sqlalchemy",
@@ -40,47 +68,101 @@ def setup_logging():
     ]:
         logging.getLogger(logger_name).setLevel(logging.WARNING)
     logging.getLogger("aiogram").setLevel(logging.INFO)
+    # one line per handled update, aiogram already reports failures separately
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
     return logging.getLogger(__name__)
 
 
 logger = setup_logging()
+timer = StartupTimer(IMPORTS_STARTED)
+timer.record("imports", IMPORTS_STARTED)
 
 
-async def setup_bot():
-    logger.info("bot initializing...")
-    config = EnvConfig()
-    telegram_token = config.get_telegram_token()
-    bot = Bot(
-        token=telegram_token,
-        default=DefaultBotProperties(parse_mode=ParseMode.HTML),
-    )
-
-    dp.workflow_data["bot"] = bot
+def build_clients(config, bot, locale_loader):
+    # remnawave and aiosend are the slowest imports and CryptoPay checks its token
+    # with a blocking request, so this runs in a thread while the loop waits on the database
+    from remnawave import RemnawaveSDK
+    from api.cryptobot import CryptoBotWebhook
 
     token, currency = config.get_cryptobot_data()
-    cryptobot = CryptoBotWebhook(token, currency, bot)
-    dp.workflow_data["cryptobot"] = cryptobot
-    logger.info("cryptobot setup ended")
-
-    remnawave_token, panel_url = config.get_remnawave_data()
-    remnawave = RemnawaveSDK(base_url=panel_url, token=remnawave_token)
-    if asyncio.iscoroutine(remnawave):
-        remnawave = await remnawave
-    dp.workflow_data["remnawave"] = remnawave
-    logger.info("remnawave setup ended")
-
-    middleware = LocaleMiddleware()
-    dp.include_router(user_router)
+    cryptobot = CryptoBotWebhook(token, currency, bot, locale_loader=locale_loader)
+    return RemnawaveSDK, cryptobot
+
+
+async def setup_bot():
+    logger.info("bot initializing...")
+    with timer.phase("config"):
+        config = EnvConfig()
+        telegram_token = config.get_telegram_token()
+        bot = Bot(
+            token=telegram_token,
+            default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+        )
+
+        dp.workflow_data["bot"] = bot
+
+        locale_loader = LocaleLoader()
+        dp.workflow_data["locale_loader"] = locale_loader
+
+        middleware = LocaleMiddleware()
+        dp.include_router(admin_router)
+        dp.include_router(user_router)
+        clients = asyncio.create_task(
+            asyncio.to_thread(build_clients, config, bot, locale_loader)
+        )
+
+    with timer.phase("database"):
+        migrated = await init_db()
+        logger.info("schema migrated" if migrated else "schema is up to date")
+        known_users = KnownUsers()
+        await known_users.load()
+        dp.workflow_data["known_users"] = known_users
+        logger.info(f"known users loaded: {known_users.stats()}")
+
+    with timer.phase("clients"):
+        RemnawaveSDK, cryptobot = await clients
+        dp.workflow_data["cryptobot"] = cryptobot
+        logger.info("cryptobot setup ended")
+
+        remnawave_token, panel_url = config.get_remnawave_data()
+        remnawave = RemnawaveSDK(base_url=panel_url, token=remnawave_token)
+        if asyncio.iscoroutine(remnawave):
+            remnawave = await remnawave
+        dp.workflow_data["remnawave"] = remnawave
+        logger.info("remnawave setup ended")
+
+        dp.workflow_data["outbox"] = OutboxWorker(bot, remnawave)
+        cryptobot.outbox = dp.workflow_data["outbox"]
+
+    inflight = InFlight()
+    dp.workflow_data["inflight"] = inflight
+    dp.update.outer_middleware(InFlightMiddleware(inflight))
+    throttle_enabled, rate, burst, costs = config.get_throttle()
+    if throttle_enabled:
+        throttle = Throttle(rate, burst, costs)
+        dp.workflow_data["throttle"] = throttle
+        dp.update.outer_middleware(ThrottleMiddleware(throttle))
+        logger.info(f"throttling at {rate}/s, burst {burst}")
+    user_locks = UserLocks()
+    dp.workflow_data["user_locks"] = user_locks
+    dp.update.outer_middleware(SerializeMiddleware(user_locks))
+    if config.get_db_profile():
+        max_queries, max_repeats, max_time_ms = config.get_db_query_budget()
+        profiler = QueryProfiler(max_queries, max_repeats, max_time_ms)
+        profiler.install(engine)
+        for replica in replicas.engines.values():
+            profiler.install(replica)
+        dp.workflow_data["query_profiler"] = profiler
+        dp.update.outer_middleware(QueryProfilerMiddleware(profiler))
+        logger.info("db query profiling enabled")
     dp.update.outer_middleware(middleware)
-    await init_db()
+    dp.callback_query.outer_middleware(CallbackDataMiddleware())
     return bot, config
 
 
 async def cleanup_bot(bot):
-    try:
-        await bot.delete_webhook()
-    except Exception:
-        pass
+    # the webhook stays registered: the next instance answers on the same url and
+    # Telegram keeps queueing updates while no one does
     try:
         await bot.session.close()
     except Exception:
@@ -90,26 +172,62 @@ async def cleanup_bot(bot):
             pass
 
 
-async def run_webhook(bot, config):
-    app = web.Application()
+def build_webhook_app(dispatcher: Dispatcher, bot, config) -> web.Application:
+    max_body = config.get_webhook_max_body()
+    app = web.Application(client_max_size=max_body)
+    profiler = dispatcher.workflow_data.get("query_profiler")
+    if profiler:
+        app.middlewares.append(profiler.aiohttp_middleware)
 
-    cryptobot = dp.workflow_data["cryptobot"]
-    remnawave = dp.workflow_data["remnawave"]
+    cryptobot = dispatcher.workflow_data["cryptobot"]
+    remnawave = dispatcher.workflow_data["remnawave"]
 
-    webhook_handler = PanelWebhookHandler(bot, remnawave, config.get_remna_secret())
+    locale_loader = dispatcher.workflow_data.get("locale_loader") or LocaleLoader()
+
+    reminders_enabled, _, _ = config.get_expiry_reminders()
+    webhook_handler = PanelWebhookHandler(
+        bot,
+        remnawave,
+        notify_expiring=not reminders_enabled,
+        locale_loader=locale_loader,
+    )
 
     tribute_handler = TributeWebhookHandler(
-        bot=bot, remnawave_sdk=remnawave, secret_key=config.get_tribute_secret()
+        bot=bot, remnawave_sdk=remnawave, locale_loader=locale_loader
     )
     webpath, cryptowebhook, remnawavewebhook = config.get_webhook_path()
     tribute_webhook = config.get_tribute_webhook_path()
+    cryptobot_token, _ = config.get_cryptobot_data()
+
+    signed_routes = {
+        webpath: build_scheme(
+            "secret-token", "X-Telegram-Bot-Api-Secret-Token", config.get_webhook_secret()
+        ),
+        f"{webpath}{remnawavewebhook}": build_scheme(
+            "hmac-sha256", "X-Remnawave-Signature", config.get_remna_secret()
+        ),
+        f"{webpath}{tribute_webhook}": build_scheme(
+            "hmac-sha256", "trbt-signature", config.get_tribute_secret()
+        ),
+        f"{webpath}{cryptowebhook}{config.get_cryptobot_secret()}": build_scheme(
+            "cryptopay", "crypto-pay-api-signature", cryptobot_token
+        ),
+    }
+    inflight = dispatcher.workflow_data["inflight"]
+    inflight.routes = {
+        webpath: "telegram",
+        f"{webpath}{remnawavewebhook}": "panel",
+        f"{webpath}{tribute_webhook}": "tribute",
+        f"{webpath}{cryptowebhook}{config.get_cryptobot_secret()}": "cryptobot",
+    }
+    app.middlewares.append(inflight.aiohttp_middleware)
+    app.middlewares.append(signature_middleware(signed_routes, max_body))
 
     logger.info(f"webhook_path: {webpath}")
     logger.info(f"crypto path will be: {webpath}{cryptowebhook}")
     logger.info(f"panel path will be:{webpath}{remnawavewebhook}")
     logger.info(f"tribute path will be: {webpath}{tribute_webhook}")
     app.add_subapp(f"{webpath}{cryptowebhook}", cryptobot.app)
-    app.add_subapp(f"{webpath}{cryptowebhook}", cryptobot.app)
 
     async def panel_webhook_route(request):
         return await webhook_handler.handle_webhook(request)
@@ -117,29 +235,74 @@ async def run_webhook(bot, config):
     app.router.add_post(f"{webpath}{remnawavewebhook}", panel_webhook_route)
     app.router.add_post(f"{webpath}{tribute_webhook}", tribute_handler.handle_webhook)
     SimpleRequestHandler(
-        dispatcher=dp, bot=bot, secret_token=config.get_webhook_secret()
+        dispatcher=dispatcher, bot=bot, secret_token=config.get_webhook_secret()
     ).register(app, path=webpath)
 
-    setup_application(app, dp, bot=bot)
+    setup_application(app, dispatcher, bot=bot)
+    return app
 
-    webhook_url = f"{config.get_webhook_url()}{webpath}"
-    await bot.set_webhook(
-        url=webhook_url,
-        allowed_updates=dp.resolve_used_update_types(),
-        drop_pending_updates=False,
-        secret_token=config.get_webhook_secret(),
-    )
-    logger.info(f"webhook set: {webhook_url}")
 
-    runner = web.AppRunner(app)
-    await runner.setup()
+async def run_webhook(bot, config):
+    with timer.phase("webhook app"):
+        app = build_webhook_app(dp, bot, config)
+    webpath, _, _ = config.get_webhook_path()
 
-    site = web.TCPSite(runner, config.get_webhook_host(), config.get_webhook_port())
+    webhook_url = f"{config.get_webhook_url()}{webpath}"
+    with timer.phase("set_webhook"):
+        await bot.set_webhook(
+            url=webhook_url,
+            allowed_updates=dp.resolve_used_update_types(),
+            drop_pending_updates=False,
+            secret_token=config.get_webhook_secret(),
+        )
+    logger.info(f"webhook set: {webhook_url}")
 
-    logger.info(
-        f"starting webhook server on {config.get_webhook_host()}:{config.get_webhook_port()}"
-    )
-    await site.start()
+    with timer.phase("server"):
+        # handlers are drained before cleanup, only stuck keep-alive connections are left
+        runner = web.AppRunner(app, shutdown_timeout=1.0)
+        await runner.setup()
+
+        site = web.TCPSite(runner, config.get_webhook_host(), config.get_webhook_port())
+
+        logger.info(
+            f"starting webhook server on {config.get_webhook_host()}:{config.get_webhook_port()}"
+        )
+        await site.start()
+    logger.info(f"startup finished: {timer.summary()}")
+
+    outbox = dp.workflow_data["outbox"]
+    await outbox.start()
+
+    if replicas:
+        replicas.start()
+        logger.info(f"reading from {len(replicas.engines)} replica(s)")
+
+    reminders = None
+    reminders_enabled, reminder_hours, reminder_reload = config.get_expiry_reminders()
+    if reminders_enabled:
+        reminders = ExpiryReminderScheduler(
+            bot, offsets=reminder_hours, reload_interval=reminder_reload
+        )
+        reminders.start()
+        logger.info(f"expiry reminders enabled at {reminder_hours} hours")
+
+    traffic = None
+    traffic_enabled, traffic_interval, raw_days, retention_months = config.get_traffic_sync()
+    if traffic_enabled:
+        traffic = TrafficSync(
+            dp.workflow_data["remnawave"],
+            interval=traffic_interval,
+            raw_days=raw_days,
+            retention_months=retention_months,
+        )
+        traffic.start()
+        logger.info(f"traffic sync every {traffic_interval:.0f}s")
+
+    retention = None
+    retention_enabled, archive_after = config.get_invoice_retention()
+    if retention_enabled:
+        retention = InvoiceRetention(archive_after=timedelta(hours=archive_after))
+        retention.start()
 
     shutdown_event = asyncio.Event()
 
@@ -159,8 +322,24 @@ async def run_webhook(bot, config):
         pass
     finally:
         logger.info("shutting down webhook server...")
-        await cleanup_bot(bot)
+        drain_timeout, outbox_timeout = config.get_shutdown_timeouts()
+        inflight = dp.workflow_data["inflight"]
+        # stop listening first, requests still arriving on open connections get a 503
+        inflight.close()
+        await site.stop()
+        await inflight.drain(drain_timeout)
+        if reminders:
+            await reminders.stop()
+        if traffic:
+            await traffic.stop()
+        if retention:
+            await retention.stop()
+        await outbox.stop(outbox_timeout)
+        await replicas.stop()
         await runner.cleanup()
+        await cleanup_bot(bot)
+        if inflight.rejected:
+            logger.info(f"{inflight.rejected} requests were turned away during shutdown")
 
 
 async def main():
@@ -173,6 +352,7 @@ async def main():
         logger.exception(f"unexpected error: {e}")
     finally:
         logger.info("bot stopped")
+        stop_logging()
 
 
 if __name__ == "__main__":
@@ -1,7 +1,16 @@
+import logging
+
 from aiogram import BaseMiddleware
 from aiogram.types import TelegramObject, Message, CallbackQuery, Update
 from database.req import UserRequests
 from config.locale import Locale
+from database.profiler import QueryProfiler
+from keyboards.callbacks import StaleCallbackError, parse
+from services.inflight import InFlight
+from services.throttle import Throttle
+from services.user_locks import UserLocks
+
+logger = logging.getLogger(__name__)
 
 
 class LocaleMiddleware(BaseMiddleware):
@@ -36,3 +45,89 @@ class LocaleMiddleware(BaseMiddleware):
 
         data["locale"] = Locale(lang)
         return await handler(event, data)
+
+
+class InFlightMiddleware(BaseMiddleware):
+    # an update can outlive its webhook request when aiogram's 55s response timeout fires
+    def __init__(self, inflight: InFlight):
+        super().__init__()
+        self.inflight = inflight
+
+    async def __call__(self, handler, event: TelegramObject, data: dict):
+        with self.inflight.track("update"):
+            return await handler(event, data)
+
+
+class ThrottleMiddleware(BaseMiddleware):
+    # Runs before LocaleMiddleware, a throttled update costs no query. The answer
+    # is returned instead of sent, aiogram puts it into the webhook response.
+    def __init__(self, throttle: Throttle):
+        super().__init__()
+        self.throttle = throttle
+
+    async def __call__(self, handler, event: Update, data: dict):
+        query = event.callback_query
+        user = query.from_user if query else event.message and event.message.from_user
+        if user is None:
+            return await handler(event, data)
+        if self.throttle.allow(user.id, self.throttle.kind(query.data if query else None)):
+            return await handler(event, data)
+        if query:
+            return query.answer()
+        return None
+
+
+class SerializeMiddleware(BaseMiddleware):
+    # Updates of one user run one at a time, so a double tap can't start two
+    # purchases. A press of the same button, or the same text, while the first
+    # one is still running or queued is dropped.
+    def __init__(self, locks: UserLocks):
+        super().__init__()
+        self.locks = locks
+
+    async def __call__(self, handler, event: Update, data: dict):
+        query, message = event.callback_query, event.message
+        user = query.from_user if query else message and message.from_user
+        if user is None:
+            return await handler(event, data)
+        if query:
+            fingerprint = (query.data, query.message.message_id if query.message else None)
+        else:
+            fingerprint = ("text", message.text) if message.text else None
+        if self.locks.busy(user.id, fingerprint):
+            return query.answer() if query else None
+        async with self.locks.hold(user.id, fingerprint):
+            return await handler(event, data)
+
+
+class QueryProfilerMiddleware(BaseMiddleware):
+    def __init__(self, profiler: QueryProfiler):
+        super().__init__()
+        self.profiler = profiler
+
+    async def __call__(self, handler, event: TelegramObject, data: dict):
+        label = f"update:{event.event_type}" if isinstance(event, Update) else "update"
+        if isinstance(event, Update) and event.callback_query:
+            label = f"{label}:{(event.callback_query.data or '').split(':')[0]}"
+        with self.profiler.track(label) as stats:
+            data["query_stats"] = stats
+            return await handler(event, data)
+
+
+class CallbackDataMiddleware(BaseMiddleware):
+    # Decodes packed callback data once by prefix, handler filters only compare types
+    async def __call__(self, handler, event: CallbackQuery, data: dict):
+        try:
+            packed = parse(event.data)
+        except StaleCallbackError as e:
+            logger.debug(f"stale callback from {event.from_user.id}: {e}")
+            locale = data.get("locale") or Locale("en")
+            await event.answer(locale.get("callback_outdated"), show_alert=True)
+            return None
+        except (TypeError, ValueError) as e:
+            logger.warning(f"malformed callback {event.data!r} from {event.from_user.id}: {e}")
+            await event.answer()
+            return None
+        if packed is not None:
+            data["packed_callback"] = packed
+        return await handler(event, data)
@@ -0,0 +1,153 @@
+import argparse
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Dict, Optional
+
+import database.req as rq
+from config.dotenv import RateConfig
+from database.rollups import (
+    PURCHASES,
+    REFERRAL_PAYOUTS,
+    SIGNUPS,
+    TOPUPS,
+    Rollup,
+    bucket_start,
+)
+
+logger = logging.getLogger(__name__)
+
+# metrics that can be recomputed from users, invoices and sublinks; referral
+# payouts are only known from the moment they are recorded
+BACKFILLED = (SIGNUPS, TOPUPS, PURCHASES)
+
+WINDOWS = (
+    ("24h", "hour", timedelta(hours=24)),
+    ("7d", "day", timedelta(days=7)),
+    ("30d", "day", timedelta(days=30)),
+)
+
+
+def topup(platform: str, amount) -> Rollup:
+    return Rollup(TOPUPS, platform, Decimal(str(amount)))
+
+
+def purchase(rate, amount) -> Rollup:
+    return Rollup(PURCHASES, str(rate or ""), Decimal(str(amount)))
+
+
+def referral_payout(amount) -> Rollup:
+    return Rollup(REFERRAL_PAYOUTS, "", Decimal(str(amount)))
+
+
+class AnalyticsService:
+    def __init__(self, rate_config: Optional[RateConfig] = None):
+        self.rate_config = rate_config or RateConfig()
+
+    async def report(self, now: Optional[datetime] = None) -> Dict[str, dict]:
+        # the 7d and 30d windows start at a day boundary, 24h at an hour boundary
+        now = now or datetime.now(timezone.utc)
+        report = {}
+        for name, granularity, span in WINDOWS:
+            since = bucket_start(now - span, granularity) + (
+                timedelta(hours=1) if granularity == "hour" else timedelta(days=1)
+            )
+            window = defaultdict(dict)
+            for metric, dimension, count, amount in await rq.StatsRequests.totals(granularity, since):
+                window[metric][dimension] = (int(count or 0), Decimal(amount or 0))
+            report[name] = dict(window)
+        return report
+
+    def _rates_by_limit(self) -> Dict[Decimal, str]:
+        rates = {}
+        for key, data in self.rate_config.get_rates().items():
+            if data["limit"] is not None:
+                rates.setdefault(Decimal(str(data["limit"])), key.split("_")[1])
+        return rates
+
+    async def backfill(self, until: Optional[datetime] = None) -> Dict[str, int]:
+        # replaces the backfilled metrics before `until` (start of the current hour
+        # by default); from there on the settlements keep the counters themselves
+        until = bucket_start(until or datetime.now(timezone.utc), "hour")
+        rows = []
+
+        def add(metric, hour, dimension, count, amount):
+            rows.append(
+                {
+                    "bucket_start": hour,
+                    "metric": metric,
+                    "dimension": dimension or "",
+                    "count": count,
+                    "amount": Decimal(str(amount or 0)),
+                }
+            )
+
+        for hour, dimension, count, amount in await rq.StatsRequests.signups_by_hour(until):
+            add(SIGNUPS, hour, dimension, count, amount)
+        for hour, platform, count, amount in await rq.StatsRequests.topups_by_hour(until):
+            add(TOPUPS, hour, platform, count, amount)
+
+        # sublinks don't record the price paid, the current rate table stands in for it
+        rates = self._rates_by_limit()
+        purchases = defaultdict(int)
+        for hour, limit_gb, count, _ in await rq.StatsRequests.sublinks_by_hour(until):
+            purchases[hour, rates.get(Decimal(str(limit_gb)), "")] += count
+        for (hour, rate), count in purchases.items():
+            value = self.rate_config.get_value_by_number(int(rate)) if rate else 0
+            add(PURCHASES, hour, rate, count, Decimal(str(value or 0)) * count)
+
+        await rq.StatsRequests.replace_hourly(BACKFILLED, until, rows)
+        days = await rq.StatsRequests.rebuild_daily(BACKFILLED, until)
+        logger.info(f"analytics backfilled up to {until}: {len(rows)} hourly, {days} daily rows")
+        return {"hourly": len(rows), "daily": days}
+
+
+def format_report(report: Dict[str, dict]) -> str:
+    lines = ["📊 <b>Stats</b>"]
+    for name, window in report.items():
+        signups = sum(c for c, _ in window.get(SIGNUPS, {}).values())
+        buyers = sum(c for c, _ in window.get(PURCHASES, {}).values())
+        conversion = f"{buyers / signups * 100:.1f}%" if signups else "-"
+        lines.append(f"\n<b>{name}</b>")
+        lines.append(f"signups: {signups}, purchases: {buyers}, conversion: {conversion}")
+        for metric, title in (
+            (TOPUPS, "top-ups"),
+            (PURCHASES, "purchases by rate"),
+            (REFERRAL_PAYOUTS, "referral payouts"),
+        ):
+            rows = window.get(metric)
+            if not rows:
+                continue
+            parts = [
+                f"{dimension or 'total'}: {count} / {amount:.2f}"
+                for dimension, (count, amount) in sorted(rows.items())
+            ]
+            lines.append(f"{title}: " + ", ".join(parts))
+    return "\n".join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild analytics rollups from history")
+    parser.add_argument(
+        "--until",
+        type=datetime.fromisoformat,
+        help="ISO timestamp, defaults to the start of the current hour",
+    )
+    return parser.parse_args(argv)
+
+
+async def _backfill(until: Optional[datetime]):
+    from database.db import engine, init_db
+
+    try:
+        await init_db()
+        print(await AnalyticsService().backfill(until))
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_backfill(parse_args().until))
@@ -0,0 +1,149 @@
+import argparse
+import asyncio
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import List, Optional
+
+import database.req as rq
+from database.db import Invoice, ReferralLink, Sublink, User
+
+logger = logging.getLogger(__name__)
+
+TABLES = {
+    "users": User,
+    "invoices": Invoice,
+    "sublinks": Sublink,
+    "referral_links": ReferralLink,
+}
+FORMATS = ("csv", "jsonl")
+
+# Telegram bots may upload documents up to 50 MB, parts are cut below that
+MAX_PART_BYTES = 45 * 1024 * 1024
+
+
+def _value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+class _Part:
+    def __init__(self, path: str, fmt: str, header: List[str]):
+        self.path = path
+        self.raw = open(path, "wb")
+        self.gz = gzip.GzipFile(fileobj=self.raw, mode="wb", compresslevel=6)
+        self.text = io.TextIOWrapper(self.gz, encoding="utf-8", newline="")
+        self.header = header
+        self.rows = 0
+        self.csv = csv.writer(self.text) if fmt == "csv" else None
+        if self.csv:
+            self.csv.writerow(header)
+
+    def write(self, batch):
+        if self.csv:
+            self.csv.writerows([_value(v) for v in row] for row in batch)
+        else:
+            self.text.writelines(
+                json.dumps(dict(zip(self.header, map(_value, row))), ensure_ascii=False) + "\n"
+                for row in batch
+            )
+        self.text.flush()
+        self.rows += len(batch)
+
+    @property
+    def size(self) -> int:
+        return self.raw.tell()
+
+    def close(self):
+        self.text.close()
+        self.raw.close()
+
+
+class Exporter:
+    # Rows arrive in batches from a server-side cursor and are compressed in a
+    # worker thread, so memory is one batch plus the gzip window whatever the
+    # table size, and the event loop keeps serving updates meanwhile.
+    def __init__(self, batch_size: int = 5000, max_part_bytes: int = MAX_PART_BYTES):
+        self.batch_size = batch_size
+        self.max_part_bytes = max_part_bytes
+
+    async def export(
+        self,
+        table: str,
+        fmt: str,
+        directory: str,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> List[str]:
+        if table not in TABLES:
+            raise ValueError(f"unknown table {table}, expected one of {', '.join(TABLES)}")
+        if fmt not in FORMATS:
+            raise ValueError(f"unknown format {fmt}, expected one of {', '.join(FORMATS)}")
+        model = TABLES[table]
+        header = [column.name for column in model.__table__.columns]
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
+        paths, part, rows = [], None, 0
+
+        def open_part():
+            path = os.path.join(directory, f"{table}_{stamp}_part{len(paths) + 1:03d}.{fmt}.gz")
+            paths.append(path)
+            return _Part(path, fmt, header)
+
+        try:
+            part = open_part()
+            async for batch in rq.ExportRequests.stream(model, since, until, self.batch_size):
+                if part.rows and part.size >= self.max_part_bytes:
+                    await asyncio.to_thread(part.close)
+                    part = open_part()
+                await asyncio.to_thread(part.write, batch)
+                rows += len(batch)
+        finally:
+            if part:
+                await asyncio.to_thread(part.close)
+        logger.info(f"exported {rows} {table} rows into {len(paths)} part(s)")
+        return paths
+
+
+def parse_date(value: str) -> datetime:
+    # a bare date means midnight UTC, so "--until 2026-02-01" excludes February
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Stream a table into gzip-compressed CSV/JSONL parts")
+    parser.add_argument("table", choices=list(TABLES))
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--since", type=parse_date, help="created_at >= this (ISO date or timestamp)")
+    parser.add_argument("--until", type=parse_date, help="created_at < this (ISO date or timestamp)")
+    parser.add_argument("--out", default=".", help="directory for the parts")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--max-part-mb", type=float, default=MAX_PART_BYTES / 1024 / 1024)
+    return parser.parse_args(argv)
+
+
+async def _main(args):
+    from database.db import engine
+
+    exporter = Exporter(args.batch_size, int(args.max_part_mb * 1024 * 1024))
+    try:
+        os.makedirs(args.out, exist_ok=True)
+        for path in await exporter.export(args.table, args.format, args.out, args.since, args.until):
+            print(path)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(parse_args()))
@@ -0,0 +1,193 @@
+import argparse
+import asyncio
+import csv
+import gzip
+import io
+import itertools
+import json
+import logging
+import sys
+import time
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
+from typing import Callable, Dict, Iterator, List, Optional
+
+from database.staging import STAGING, import_rows
+
+logger = logging.getLogger(__name__)
+
+
+def _str(value, limit: int) -> Optional[str]:
+    if value is None or value == "":
+        return None
+    return str(value)[:limit]
+
+
+def _int(value) -> Optional[int]:
+    if value is None or value == "":
+        return None
+    return int(value)
+
+
+def _decimal(value) -> Optional[Decimal]:
+    if value is None or value == "":
+        return None
+    try:
+        return Decimal(str(value)).quantize(Decimal("0.01"))
+    except InvalidOperation:
+        raise ValueError(f"not a number: {value!r}")
+
+
+def _datetime(value) -> Optional[datetime]:
+    if value is None or value == "":
+        return None
+    parsed = datetime.fromisoformat(str(value))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _required(value, name: str):
+    if value is None:
+        raise ValueError(f"{name} is required")
+    return value
+
+
+# one function per table, a source row in, the staging columns (without line) out;
+# column names match what services.export writes where the meaning is the same
+CONVERTERS: Dict[str, Callable[[dict], tuple]] = {
+    "users": lambda r: (
+        _required(_int(r.get("telegram_id")), "telegram_id"),
+        _str(r.get("username"), 30),
+        _str(r.get("name"), 100),
+        _decimal(r.get("balance")),
+        _str(r.get("locale"), 10),
+        _datetime(r.get("created_at")),
+    ),
+    "sublinks": lambda r: (
+        _required(_int(r.get("telegram_id")), "telegram_id"),
+        _required(_str(r.get("link"), 500), "link"),
+        _required(_datetime(r.get("expires_at")), "expires_at"),
+        _str(r.get("username"), 500),
+        _decimal(r.get("limit_gb")),
+        _decimal(r.get("used_gb")),
+        _str(r.get("status"), 50),
+        _datetime(r.get("created_at")),
+    ),
+    "referral_links": lambda r: (
+        _required(_int(r.get("owner_tgid")), "owner_tgid"),
+        _required(_int(r.get("user_tgid")), "user_tgid"),
+        _str(r.get("user_full_name"), 200),
+        _datetime(r.get("created_at")),
+    ),
+}
+
+
+def read_source(path: str, fmt: Optional[str] = None) -> Iterator[dict]:
+    name = path[:-3] if path.endswith(".gz") else path
+    fmt = fmt or ("jsonl" if name.endswith((".jsonl", ".json")) else "csv")
+    raw = gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+    with io.TextIOWrapper(raw, encoding="utf-8", newline="") as stream:
+        if fmt == "csv":
+            yield from csv.DictReader(stream)
+        else:
+            for line in stream:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class Importer:
+    def __init__(self, batch_size: int = 10000, max_errors: int = 100):
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.rejected = 0
+
+    def _batches(self, table: str, rows: Iterator[dict]) -> Iterator[List[tuple]]:
+        convert = CONVERTERS[table]
+        numbered = enumerate(rows, start=1)
+        while True:
+            batch, read = [], 0
+            for line, row in itertools.islice(numbered, self.batch_size):
+                read += 1
+                try:
+                    batch.append((line,) + convert(row))
+                except (ValueError, TypeError) as e:
+                    self.rejected += 1
+                    if self.rejected <= self.max_errors:
+                        logger.warning(f"{table} line {line} rejected: {e}")
+            if not read:
+                return
+            # a slice where every row was rejected is skipped, the file goes on
+            if batch:
+                yield batch
+
+    async def run(
+        self,
+        table: str,
+        rows: Iterator[dict],
+        conflict: str = "skip",
+        dry_run: bool = False,
+        progress: Optional[Callable[[int], None]] = None,
+    ) -> Dict[str, int]:
+        if table not in STAGING:
+            raise ValueError(f"unknown table {table}, expected one of {', '.join(STAGING)}")
+        batches = self._batches(table, rows)
+
+        async def parsed():
+            # the next batch is parsed in a thread while the current one is copied
+            pending = asyncio.ensure_future(asyncio.to_thread(next, batches, None))
+            while True:
+                batch = await pending
+                if batch is None:
+                    return
+                pending = asyncio.ensure_future(asyncio.to_thread(next, batches, None))
+                yield batch
+
+        self.rejected = 0
+        counts = await import_rows(table, parsed(), conflict, dry_run, progress)
+        counts["rejected"] = self.rejected
+        return counts
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import users, sublinks or referral links")
+    parser.add_argument("table", choices=list(STAGING))
+    parser.add_argument("path", help="CSV or JSONL file, optionally .gz")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="default: from the file name")
+    parser.add_argument(
+        "--conflict",
+        choices=("skip", "merge"),
+        default="skip",
+        help="rows that already exist: keep them, or update them (users: balances are added)",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="report what would change, write nothing")
+    parser.add_argument("--batch-size", type=int, default=10000)
+    return parser.parse_args(argv)
+
+
+async def _main(args):
+    from database.db import engine, init_db
+
+    started = time.perf_counter()
+
+    def progress(staged: int):
+        elapsed = time.perf_counter() - started
+        print(f"\rstaged {staged} rows, {staged / elapsed:.0f} rows/s", end="", file=sys.stderr)
+
+    try:
+        await init_db()
+        counts = await Importer(args.batch_size).run(
+            args.table,
+            read_source(args.path, args.format),
+            args.conflict,
+            args.dry_run,
+            progress,
+        )
+    finally:
+        await engine.dispose()
+    print(file=sys.stderr)
+    print(json.dumps(counts))
+    print(f"{'dry run' if args.dry_run else 'import'} took {time.perf_counter() - started:.2f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(parse_args()))
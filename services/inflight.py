@@ -0,0 +1,62 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+
+class InFlight:
+    # Counts requests and updates that are being handled, so shutdown can wait for
+    # them instead of cutting them off. After close() new requests get a 503 and
+    # Telegram / the payment providers redeliver them to the next instance.
+    def __init__(self, routes: Optional[Dict[str, str]] = None):
+        self.routes = routes or {}
+        self.accepting = True
+        self.active: Counter = Counter()
+        self.rejected = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @property
+    def total(self) -> int:
+        return sum(self.active.values())
+
+    @contextmanager
+    def track(self, kind: str):
+        self.active[kind] += 1
+        self._idle.clear()
+        try:
+            yield
+        finally:
+            self.active[kind] -= 1
+            if not self.active[kind]:
+                del self.active[kind]
+            if not self.active:
+                self._idle.set()
+
+    def close(self):
+        self.accepting = False
+
+    async def drain(self, timeout: float) -> bool:
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"shutdown deadline hit with {dict(self.active)} still in flight")
+            return False
+        logger.info(f"in-flight work drained in {time.monotonic() - started:.2f}s")
+        return True
+
+    @web.middleware
+    async def aiohttp_middleware(self, request: web.Request, handler):
+        kind = self.routes.get(request.path, "other")
+        if not self.accepting:
+            self.rejected += 1
+            return web.Response(status=503, headers={"Retry-After": "1"})
+        with self.track(kind):
+            return await handler(request)
@@ -0,0 +1,110 @@
+import logging
+import sys
+import zlib
+from array import array
+from bisect import bisect_left
+from typing import Dict, Optional
+
+from sqlalchemy import select
+
+from database.db import User, get_session
+
+logger = logging.getLogger(__name__)
+
+
+def profile_fingerprint(username: Optional[str], name: Optional[str], locale: Optional[str]) -> int:
+    # same locale fallback as UserRequests.upsert_user
+    raw = f"{username or ''}\x00{name or ''}\x00{locale or 'ru'}"
+    return zlib.crc32(raw.encode("utf-8"))
+
+
+class KnownUsers:
+    # Exact membership: sorted telegram ids with a crc32 of the profile next to
+    # each one, 12 bytes per user. A Bloom filter would be smaller, but any
+    # false positive there silently skips registering a new user. The only
+    # approximation left is a crc collision hiding a profile change.
+    def __init__(self, merge_threshold: int = 4096):
+        self.merge_threshold = merge_threshold
+        self._ids = array("q")
+        self._fingerprints = array("I")
+        self._recent: Dict[int, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def load(self, batch_size: int = 10000) -> int:
+        ids, fingerprints = array("q"), array("I")
+        async with get_session(readonly=True) as session:
+            stmt = (
+                select(User.telegram_id, User.username, User.name, User.locale)
+                .order_by(User.telegram_id)
+                .execution_options(yield_per=batch_size)
+            )
+            result = await session.stream(stmt)
+            async for telegram_id, username, name, locale in result:
+                ids.append(telegram_id)
+                fingerprints.append(profile_fingerprint(username, name, locale))
+        self._ids, self._fingerprints = ids, fingerprints
+        self._recent.clear()
+        return len(ids)
+
+    def _index(self, telegram_id: int) -> int:
+        i = bisect_left(self._ids, telegram_id)
+        if i < len(self._ids) and self._ids[i] == telegram_id:
+            return i
+        return -1
+
+    def _fingerprint(self, telegram_id: int) -> Optional[int]:
+        if telegram_id in self._recent:
+            return self._recent[telegram_id]
+        i = self._index(telegram_id)
+        return self._fingerprints[i] if i >= 0 else None
+
+    def __contains__(self, telegram_id: int) -> bool:
+        return self._fingerprint(telegram_id) is not None
+
+    def __len__(self) -> int:
+        return len(self._ids) + len(self._recent)
+
+    def is_unchanged(self, telegram_id: int, username, name, locale) -> bool:
+        unchanged = self._fingerprint(telegram_id) == profile_fingerprint(username, name, locale)
+        if unchanged:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return unchanged
+
+    def add(self, telegram_id: int, username, name, locale):
+        fingerprint = profile_fingerprint(username, name, locale)
+        i = self._index(telegram_id)
+        if i >= 0:
+            self._fingerprints[i] = fingerprint
+            return
+        self._recent[telegram_id] = fingerprint
+        if len(self._recent) >= self.merge_threshold:
+            self._merge()
+
+    def _merge(self):
+        merged = dict(zip(self._ids, self._fingerprints))
+        merged.update(self._recent)
+        ordered = sorted(merged)
+        self._ids = array("q", ordered)
+        self._fingerprints = array("I", (merged[i] for i in ordered))
+        self._recent.clear()
+
+    @property
+    def memory_bytes(self) -> int:
+        return (
+            self._ids.itemsize * len(self._ids)
+            + self._fingerprints.itemsize * len(self._fingerprints)
+            + sys.getsizeof(self._recent)
+            + 2 * 32 * len(self._recent)
+        )
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "users": len(self),
+            "memory_bytes": self.memory_bytes,
+            "bytes_per_user": round(self.memory_bytes / len(self), 1) if len(self) else 0,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
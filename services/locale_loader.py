@@ -0,0 +1,60 @@
+import asyncio
+import logging
+from typing import Dict, Iterable, List, Optional, Set
+
+import database.req as rq
+
+logger = logging.getLogger(__name__)
+
+
+class LocaleLoader:
+    # Coalesces locale lookups made within `delay` seconds into one query,
+    # so a burst of panel/payment webhooks costs a few selects instead of one per event.
+    def __init__(self, delay: float = 0.005, max_batch: int = 1000, default_lang: str = "ru"):
+        self.delay = delay
+        self.max_batch = max_batch
+        self.default_lang = default_lang
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # the loop only keeps weak references to tasks
+        self._tasks: Set[asyncio.Task] = set()
+        self.queries = 0
+        self.loaded = 0
+
+    async def load(self, telegram_id: int) -> str:
+        telegram_id = int(telegram_id)
+        future = self._pending.get(telegram_id)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._pending[telegram_id] = future
+            if len(self._pending) >= self.max_batch:
+                self._dispatch()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.delay, self._dispatch)
+        return await asyncio.shield(future)
+
+    async def load_many(self, telegram_ids: Iterable[int]) -> List[str]:
+        return list(await asyncio.gather(*(self.load(i) for i in telegram_ids)))
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            task = asyncio.ensure_future(self._resolve(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _resolve(self, batch: Dict[int, asyncio.Future]):
+        locales = {}
+        try:
+            self.queries += 1
+            locales = await rq.UserRequests.get_locales_by_telegram_ids(list(batch))
+            self.loaded += len(batch)
+        except Exception as e:
+            logger.error(f"failed to load locales for {len(batch)} users: {e}")
+        for telegram_id, future in batch.items():
+            if not future.done():
+                future.set_result(locales.get(telegram_id) or self.default_lang)
@@ -0,0 +1,326 @@
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Awaitable, Callable, Dict, Optional
+
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramRetryAfter,
+)
+from aiogram.types import InlineKeyboardMarkup
+
+import database.req as rq
+from api.user_manager import UserManager
+from config.locale import Locale
+from config.templates import templates
+from keyboards.user_keyboards import sub_kb
+from services.analytics import purchase
+from database.db import OutboxMessage, mark_written
+
+logger = logging.getLogger(__name__)
+
+SEND_MESSAGE = "telegram.send_message"
+EDIT_MESSAGE = "telegram.edit_message_text"
+CREATE_SUBSCRIPTION = "panel.create_subscription"
+
+
+class PermanentError(Exception):
+    pass
+
+
+def send_message(chat_id: int, text: str, **kwargs) -> OutboxMessage:
+    return rq.OutboxRequests.build(
+        SEND_MESSAGE, chat_id, {"chat_id": chat_id, "text": text, **kwargs}
+    )
+
+
+def edit_message(chat_id: int, message_id: int, text: str, reply_markup=None) -> OutboxMessage:
+    payload = {"chat_id": chat_id, "message_id": message_id, "text": text}
+    if reply_markup is not None:
+        payload["reply_markup"] = reply_markup.model_dump(mode="json", exclude_none=True)
+    return rq.OutboxRequests.build(EDIT_MESSAGE, chat_id, payload)
+
+
+def create_subscription(
+    user_id: int,
+    telegram_id: int,
+    months: int,
+    limit_bytes: int,
+    amount: Decimal,
+    lang: str,
+    message_id: Optional[int] = None,
+    rate: Optional[int] = None,
+) -> OutboxMessage:
+    return rq.OutboxRequests.build(
+        CREATE_SUBSCRIPTION,
+        telegram_id,
+        {
+            "user_id": user_id,
+            "telegram_id": telegram_id,
+            "months": int(months),
+            "limit_bytes": limit_bytes,
+            "amount": str(amount),
+            "rate": rate,
+            "locale": lang,
+            # message showing the "processing" state, edited with the result
+            "message_id": message_id,
+            # fixed up front so a retry after a lost response finds the panel user
+            "username": UserManager.generate_username(),
+        },
+    )
+
+
+class OutboxWorker:
+    def __init__(
+        self,
+        bot,
+        remnawave,
+        workers: int = 4,
+        batch_size: int = 50,
+        poll_interval: float = 1.0,
+        max_attempts: int = 8,
+        base_delay: float = 2.0,
+        max_delay: float = 600.0,
+        stale_after: float = 300.0,
+    ):
+        self.bot = bot
+        self.remnawave = remnawave
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stale_after = stale_after
+        self.handlers: Dict[str, Callable[[dict, OutboxMessage], Awaitable]] = {
+            SEND_MESSAGE: self._send_message,
+            EDIT_MESSAGE: self._edit_message,
+            CREATE_SUBSCRIPTION: self._create_subscription,
+        }
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._wakeup = asyncio.Event()
+        self._stopping = asyncio.Event()
+        self._tasks = []
+        self._in_flight = 0
+        self._last_purge = 0.0
+        self._last_release = 0.0
+        self.processed = 0
+        self.failed = 0
+
+    def register(self, kind: str, handler: Callable[[dict, OutboxMessage], Awaitable]):
+        self.handlers[kind] = handler
+
+    def wake(self):
+        self._wakeup.set()
+
+    async def start(self):
+        await self._release_stale()
+        self._tasks = [asyncio.create_task(self._dispatch())]
+        self._tasks += [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        logger.info(f"outbox started with {self.workers} workers")
+
+    async def stop(self, timeout: Optional[float] = None):
+        self._stopping.set()
+        self._wakeup.set()
+        await self._tasks[0]
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            # hand the untouched messages back now instead of after stale_after;
+            # the ones a worker already started are left to release_stale
+            queued = []
+            while not self._queue.empty():
+                queued.append(self._queue.get_nowait().id)
+            if queued:
+                await rq.OutboxRequests.release(queued)
+            logger.warning(
+                f"outbox stop timed out, released {len(queued)} queued messages, "
+                f"{self._in_flight - len(queued)} left processing"
+            )
+        for task in self._tasks[1:]:
+            task.cancel()
+        await asyncio.gather(*self._tasks[1:], return_exceptions=True)
+
+    async def _dispatch(self):
+        while not self._stopping.is_set():
+            self._wakeup.clear()
+            messages = []
+            free = self.batch_size - self._in_flight
+            try:
+                # a worker that died mid-message or a stop that timed out leaves rows
+                # in processing, they would hold up that user's queue until a restart
+                if time.monotonic() - self._last_release >= self.stale_after / 2:
+                    await self._release_stale()
+                if free > 0:
+                    messages = await rq.OutboxRequests.claim(free)
+                if not messages:
+                    await self._purge()
+            except Exception as e:
+                logger.error(f"outbox claim failed: {e}")
+            for message in messages:
+                self._in_flight += 1
+                self._queue.put_nowait(message)
+            if len(messages) < free or free <= 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _work(self):
+        while True:
+            message = await self._queue.get()
+            try:
+                await self._process(message)
+            except Exception as e:
+                logger.exception(f"outbox message {message.id} left unresolved: {e}")
+            finally:
+                self._in_flight -= 1
+                self._queue.task_done()
+                # the next message of this user only becomes claimable now
+                self._wakeup.set()
+
+    async def _process(self, message: OutboxMessage):
+        # idempotency checks in the handlers must not read from a lagging replica
+        mark_written()
+        handler = self.handlers.get(message.kind)
+        if handler is None:
+            await self._fail(message, f"no handler for {message.kind}")
+            return
+        try:
+            await handler(message.payload, message)
+        except TelegramRetryAfter as e:
+            await self._retry(message, e, e.retry_after)
+        except (PermanentError, TelegramForbiddenError, TelegramBadRequest) as e:
+            await self._fail(message, e)
+        except Exception as e:
+            if message.attempts + 1 >= self.max_attempts:
+                await self._fail(message, e)
+            else:
+                delay = min(self.max_delay, self.base_delay * 2**message.attempts)
+                await self._retry(message, e, delay * random.uniform(0.5, 1.0))
+        else:
+            await rq.OutboxRequests.complete(message.id)
+            self.processed += 1
+
+    async def _retry(self, message: OutboxMessage, error, delay: float):
+        logger.warning(
+            f"outbox {message.kind} #{message.id} failed (attempt {message.attempts + 1}), "
+            f"retrying in {delay:.1f}s: {error}"
+        )
+        available_at = datetime.now(timezone.utc) + timedelta(seconds=delay)
+        await rq.OutboxRequests.retry(message.id, str(error), available_at)
+
+    async def _fail(self, message: OutboxMessage, error):
+        refund, outbox = None, []
+        if message.kind == CREATE_SUBSCRIPTION:
+            payload = message.payload
+            # the panel user may exist even though a later step kept failing;
+            # then the purchase went through and there is nothing to refund
+            try:
+                sub = await self._find_panel_user(payload)
+            except Exception as e:
+                # no refund until the panel can say the user isn't there
+                await self._retry(message, f"{error}; lookup before refund: {e}", self.max_delay)
+                return
+            if sub is not None:
+                await self._store_sublink(payload, sub)
+                await rq.OutboxRequests.complete(message.id)
+                self.processed += 1
+                logger.warning(
+                    f"outbox {message.kind} #{message.id} recovered after failing: {error}"
+                )
+                return
+            locale = Locale(payload.get("locale") or "ru")
+            refund = (payload["user_id"], Decimal(payload["amount"]))
+            outbox.append(
+                self._result_message(payload, locale.get("sub_provision_failed"))
+            )
+        logger.error(f"outbox {message.kind} #{message.id} failed permanently: {error}")
+        self.failed += 1
+        await rq.OutboxRequests.fail(message.id, str(error), refund=refund, outbox=outbox)
+
+    async def _release_stale(self):
+        self._last_release = time.monotonic()
+        released = await rq.OutboxRequests.release_stale(
+            datetime.now(timezone.utc) - timedelta(seconds=self.stale_after)
+        )
+        if released:
+            logger.warning(f"released {released} stale outbox messages")
+
+    async def _purge(self):
+        if time.monotonic() - self._last_purge < 3600:
+            return
+        self._last_purge = time.monotonic()
+        purged = await rq.OutboxRequests.purge(datetime.now(timezone.utc) - timedelta(days=1))
+        if purged:
+            logger.info(f"purged {purged} delivered outbox messages")
+
+    @staticmethod
+    def _markup(payload: dict) -> dict:
+        payload = dict(payload)
+        if payload.get("reply_markup"):
+            payload["reply_markup"] = InlineKeyboardMarkup.model_validate(payload["reply_markup"])
+        return payload
+
+    async def _send_message(self, payload: dict, message: OutboxMessage):
+        await self.bot.send_message(**self._markup(payload))
+
+    async def _edit_message(self, payload: dict, message: OutboxMessage):
+        await self.bot.edit_message_text(**self._markup(payload))
+
+    @staticmethod
+    def _result_message(payload: dict, text: str, reply_markup=None) -> OutboxMessage:
+        if payload.get("message_id"):
+            return edit_message(
+                payload["telegram_id"], payload["message_id"], text, reply_markup
+            )
+        return send_message(
+            payload["telegram_id"],
+            text,
+            reply_markup=reply_markup.model_dump(mode="json", exclude_none=True)
+            if reply_markup
+            else None,
+        )
+
+    async def _find_panel_user(self, payload: dict):
+        response = await self.remnawave.users.get_users_by_telegram_id(str(payload["telegram_id"]))
+        for user in getattr(response, "root", None) or []:
+            if user.username == payload["username"]:
+                return user
+        return None
+
+    async def _create_subscription(self, payload: dict, message: OutboxMessage):
+        # always looked up first: a released message keeps its attempt count, and
+        # the panel rejects a second create_user with the same username
+        sub = await self._find_panel_user(payload)
+        if sub is None:
+            sub = await UserManager(self.remnawave).create_user(
+                payload["telegram_id"],
+                payload["months"],
+                payload["limit_bytes"],
+                username=payload["username"],
+            )
+        await self._store_sublink(payload, sub)
+
+    async def _store_sublink(self, payload: dict, sub):
+        if await rq.SublinkRequests.get_sublink_by_link(sub.subscription_url) is None:
+            locale = Locale(payload.get("locale") or "ru")
+            user = await rq.UserRequests.get_user_by_id(payload["user_id"])
+            text = templates.render("sub_bought", locale.lang, balance=user.balance)
+            # queued with the sublink so a failed edit can't undo a finished purchase
+            await rq.SublinkRequests.create_sublink(
+                link=sub.subscription_url,
+                expires_at=sub.expire_at,
+                username=sub.username,
+                user_id=payload["user_id"],
+                limit_gb=sub.traffic_limit_bytes / 1024**3,
+                status=getattr(sub.status, "value", sub.status),
+                outbox=[self._result_message(payload, text, sub_kb(locale))],
+                # counted on delivery, a refunded purchase never shows up
+                rollups=[purchase(payload.get("rate"), payload["amount"])],
+            )
+        logger.info(f"sublink created:{sub.subscription_url}")
@@ -0,0 +1,232 @@
+import asyncio
+import heapq
+import logging
+import math
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+import database.req as rq
+from config.templates import templates
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OFFSETS = (72, 24, 1)
+
+
+def expiry_message(lang: Optional[str], hours: int, expire_date: str) -> str:
+    if hours <= 0:
+        return templates.render("sub_expired", lang, expire_date=expire_date)
+    return templates.render("sub_expiring", lang, hours=hours, expire_date=expire_date)
+
+
+def _ts(value: datetime) -> float:
+    # sqlite hands back naive datetimes, everything is stored in UTC
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class ExpiryReminderScheduler:
+    def __init__(
+        self,
+        bot,
+        offsets: Sequence[int] = DEFAULT_OFFSETS,
+        reload_interval: float = 300.0,
+        batch_size: int = 25,
+        batch_interval: float = 1.0,
+        grace: float = 3600.0,
+        retry_delay: float = 60.0,
+    ):
+        self.bot = bot
+        self.offsets = sorted({int(h) for h in offsets}, reverse=True)
+        self.reload_interval = reload_interval
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.grace = grace
+        self.retry_delay = retry_delay
+        # (fire_at, sublink_id, hours, expires_at), stale entries are skipped on pop
+        self._heap: List[Tuple[float, int, int, float]] = []
+        self._current: Dict[int, float] = {}
+        self._recipients: Dict[int, Tuple[int, str]] = {}
+        self._sent: Set[Tuple[int, int, float]] = set()
+        self._loaded_until: Optional[float] = None
+        self._watermark: Optional[datetime] = None
+        self._stop = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.sent_count = 0
+
+    @property
+    def horizon(self) -> float:
+        return max(self.offsets, default=0) * 3600 + 2 * self.reload_interval
+
+    def start(self) -> asyncio.Task:
+        self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        self._stop.set()
+        if self._task:
+            await self._task
+
+    async def run(self):
+        next_reload = 0.0
+        while not self._stop.is_set():
+            try:
+                if time.time() >= next_reload:
+                    await self.reload()
+                    next_reload = time.time() + self.reload_interval
+                due, suppressed = self._pop_due(time.time())
+                if due or suppressed:
+                    await self._deliver(due, suppressed)
+            except Exception as e:
+                logger.exception(f"expiry reminder loop failed: {e}")
+
+            wake_at = next_reload
+            if self._heap:
+                wake_at = min(wake_at, self._heap[0][0])
+            try:
+                await asyncio.wait_for(
+                    self._stop.wait(), timeout=max(0.0, wake_at - time.time())
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    async def reload(self):
+        now = time.time()
+        horizon_end = now + self.horizon
+        changed = []
+        if self._loaded_until is None:
+            # take the watermark first so changes made during the scan are picked up
+            self._watermark = await rq.ReminderRequests.get_last_modified() or datetime(
+                1970, 1, 1, tzinfo=timezone.utc
+            )
+            start = now - self.grace
+        else:
+            start = self._loaded_until
+            changed = await rq.ReminderRequests.get_changed_since(self._watermark)
+        window_start = datetime.fromtimestamp(start, timezone.utc)
+        window_end = datetime.fromtimestamp(horizon_end, timezone.utc)
+
+        for sublink_id, hours, expires_at in await rq.ReminderRequests.get_sent(
+            window_start, window_end
+        ):
+            self._sent.add((sublink_id, hours, _ts(expires_at)))
+        rows = await rq.ReminderRequests.get_expiring(window_start, window_end)
+        for row in rows:
+            self._schedule(*row, horizon_end=horizon_end)
+        for sublink_id, expires_at, telegram_id, locale, modified_at in changed:
+            self._schedule(sublink_id, expires_at, telegram_id, locale, horizon_end)
+            if _ts(modified_at) > _ts(self._watermark):
+                self._watermark = modified_at
+
+        self._loaded_until = horizon_end
+        self._prune(now)
+        logger.debug(
+            f"expiry reminders reloaded: {len(rows)} in window, {len(changed)} changed, "
+            f"{len(self._heap)} queued"
+        )
+
+    def _schedule(self, sublink_id, expires_at, telegram_id, locale, horizon_end):
+        if expires_at is None:
+            return
+        expires_ts = _ts(expires_at)
+        if expires_ts > horizon_end:
+            # renewed past the horizon, the window scan picks it up again later
+            self._current.pop(sublink_id, None)
+            self._recipients.pop(sublink_id, None)
+            return
+        if self._current.get(sublink_id) == expires_ts:
+            return
+        self._current[sublink_id] = expires_ts
+        self._recipients[sublink_id] = (telegram_id, locale)
+        for hours in self.offsets:
+            if (sublink_id, hours, expires_ts) not in self._sent:
+                heapq.heappush(
+                    self._heap, (expires_ts - hours * 3600, sublink_id, hours, expires_ts)
+                )
+
+    def _pop_due(self, now: float):
+        due: Dict[int, Tuple[int, float]] = {}
+        suppressed = []
+        while self._heap and self._heap[0][0] <= now:
+            _, sublink_id, hours, expires_ts = heapq.heappop(self._heap)
+            key = (sublink_id, hours, expires_ts)
+            if self._current.get(sublink_id) != expires_ts or key in self._sent:
+                continue
+            self._sent.add(key)
+            late = (hours > 0 and now >= expires_ts) or now > expires_ts + self.grace
+            if late:
+                suppressed.append(key)
+                continue
+            # several offsets can be due at once after downtime, only the closest one is sent
+            previous = due.get(sublink_id)
+            if previous is None or hours < previous[0]:
+                if previous:
+                    suppressed.append((sublink_id, previous[0], expires_ts))
+                due[sublink_id] = (hours, expires_ts)
+            else:
+                suppressed.append(key)
+        return [(sid, hours, exp) for sid, (hours, exp) in due.items()], suppressed
+
+    def _prune(self, now: float):
+        cutoff = now - self.grace
+        for sublink_id in [s for s, exp in self._current.items() if exp < cutoff]:
+            del self._current[sublink_id]
+            self._recipients.pop(sublink_id, None)
+        self._sent = {key for key in self._sent if key[2] >= cutoff}
+
+    def _retry(self, key: Tuple[int, int, float], delay: float):
+        sublink_id, hours, expires_ts = key
+        self._sent.discard(key)
+        heapq.heappush(self._heap, (time.time() + delay, sublink_id, hours, expires_ts))
+
+    async def _notify(self, sublink_id: int, hours: int, expires_ts: float) -> bool:
+        telegram_id, lang = self._recipients[sublink_id]
+        expire_date = datetime.fromtimestamp(expires_ts, timezone.utc).strftime("%Y-%m-%d")
+        # a late reminder shows what is actually left, not the offset it was due at
+        left = max(1, math.ceil((expires_ts - time.time()) / 3600)) if hours > 0 else 0
+        text = expiry_message(lang or "ru", left, expire_date)
+        try:
+            await self.bot.send_message(telegram_id, text, parse_mode="HTML")
+            return True
+        except TelegramRetryAfter as e:
+            logger.warning(
+                f"expiry reminder to {telegram_id} rate limited, retry in {e.retry_after}s"
+            )
+            self._retry((sublink_id, hours, expires_ts), e.retry_after)
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            # not retried in this process, nor marked sent
+            logger.error(f"failed to send expiry reminder to {telegram_id}: {e}")
+        except Exception as e:
+            logger.error(f"failed to send expiry reminder to {telegram_id}, will retry: {e}")
+            self._retry((sublink_id, hours, expires_ts), self.retry_delay)
+        return False
+
+    async def _deliver(self, due: list, suppressed: list):
+        await rq.ReminderRequests.mark_sent(self._rows(suppressed))
+        sent = 0
+        for i in range(0, len(due), self.batch_size):
+            batch = due[i : i + self.batch_size]
+            results = await asyncio.gather(*(self._notify(*item) for item in batch))
+            delivered = [item for item, ok in zip(batch, results) if ok]
+            await rq.ReminderRequests.mark_sent(self._rows(delivered))
+            sent += len(delivered)
+            if i + self.batch_size < len(due):
+                await asyncio.sleep(self.batch_interval)
+        self.sent_count += sent
+        if due:
+            logger.info(f"sent {sent} of {len(due)} expiry reminders")
+
+    @staticmethod
+    def _rows(keys) -> List[dict]:
+        return [
+            {
+                "sublink_id": sublink_id,
+                "hours": hours,
+                "expires_at": datetime.fromtimestamp(expires_ts, timezone.utc),
+            }
+            for sublink_id, hours, expires_ts in keys
+        ]
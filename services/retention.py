@@ -0,0 +1,56 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import database.req as rq
+
+logger = logging.getLogger(__name__)
+
+
+class InvoiceRetention:
+    # Hourly: makes sure this and next month's invoice partitions exist before
+    # anyone inserts into them, and moves pending invoices older than
+    # archive_after to invoices_archive. Nothing is deleted for good.
+    def __init__(
+        self,
+        archive_after: timedelta = timedelta(hours=24),
+        interval: float = 3600.0,
+        batch_size: int = 5000,
+    ):
+        # a payment can still match its invoice until INVOICE_TTL runs out
+        self.archive_after = max(archive_after, 2 * rq.INVOICE_TTL)
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stop = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> asyncio.Task:
+        self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        self._stop.set()
+        if self._task:
+            await self._task
+
+    async def run(self):
+        while not self._stop.is_set():
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.exception(f"invoice retention failed: {e}")
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run_once(self, now: Optional[datetime] = None) -> int:
+        now = now or datetime.now(timezone.utc)
+        await rq.InvoiceRequests.ensure_partitions(now)
+        archived = await rq.InvoiceRequests.archive_expired(
+            now - self.archive_after, self.batch_size
+        )
+        if archived:
+            logger.info(f"archived {archived} unpaid invoices")
+        return archived
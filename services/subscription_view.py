@@ -0,0 +1,41 @@
+import logging
+from typing import Optional, Tuple
+
+from aiogram.types import InlineKeyboardMarkup
+
+import database.req as rq
+from config.locale import Locale
+from config.templates import templates
+from database.db import Sublink, User
+from keyboards.callbacks import SubInfo
+from keyboards.user_keyboards import subscription_detail_kb
+
+logger = logging.getLogger(__name__)
+
+
+class SubscriptionView:
+    # Everything the detail screen shows, read in one joined query. Traffic and
+    # status come from the button, they were taken from the panel when it was built.
+    def __init__(self, sublink: Sublink, owner: User):
+        self.sublink = sublink
+        self.owner = owner
+
+    @classmethod
+    async def load(cls, sublink_id: int, telegram_id: int) -> Optional["SubscriptionView"]:
+        row = await rq.SublinkRequests.get_owned_sublink(sublink_id, telegram_id)
+        if row is None:
+            logger.warning(f"sublink {sublink_id} not found for tgid={telegram_id}")
+            return None
+        return cls(*row)
+
+    def render(self, locale: Locale, info: SubInfo) -> Tuple[str, InlineKeyboardMarkup]:
+        text = templates.render(
+            "subscription_info",
+            locale.lang,
+            status=templates.render(f"status_{info.status.value}", locale.lang),
+            used_gb=f"{info.used_bytes / 1024**3:.2f}",
+            limit_gb=f"{info.limit_bytes / 1024**3:.2f}" if info.limit_bytes else "∞",
+            expire_date=self.sublink.expires_at.strftime("%d.%m.%Y %H:%M"),
+            link=self.sublink.link,
+        )
+        return text, subscription_detail_kb(locale, self.sublink.link, self.sublink.id)
@@ -0,0 +1,115 @@
+import logging
+import time
+from array import array
+from collections import Counter
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# what a press costs, in tokens; the ones hitting the panel or writing are dearer
+DEFAULT_COSTS = {
+    "message": 1.0,
+    "show_sub": 3.0,
+    "si": 2.0,
+    "su": 2.0,
+    "pr": 3.0,
+    "pay_crypto": 2.0,
+    "back_to_main": 1.0,
+}
+
+
+class TokenBuckets:
+    # One float32 level and one timestamp per user in flat arrays, found through a
+    # dict of slots. A bucket that has refilled is swept out, so a missing user
+    # simply has a full bucket and memory follows the users active recently.
+    def __init__(self, rate: float, burst: float, sweep_interval: float = 60.0):
+        self.rate = rate
+        self.burst = burst
+        self.sweep_interval = sweep_interval
+        self._slots: Dict[int, int] = {}
+        self._levels = array("f")
+        self._stamps = array("d")
+        self._free: List[int] = []
+        self._next_sweep = time.monotonic() + sweep_interval
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def take(self, key: int, cost: float, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        if now >= self._next_sweep:
+            self.sweep(now)
+        slot = self._slots.get(key)
+        if slot is None:
+            level = self.burst
+            if self._free:
+                slot = self._free.pop()
+            else:
+                slot = len(self._levels)
+                self._levels.append(0.0)
+                self._stamps.append(0.0)
+            self._slots[key] = slot
+        else:
+            level = min(self.burst, self._levels[slot] + (now - self._stamps[slot]) * self.rate)
+        allowed = level >= min(cost, self.burst)
+        if allowed:
+            level -= cost
+        self._levels[slot] = level
+        self._stamps[slot] = now
+        return allowed
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        now = time.monotonic() if now is None else now
+        self._next_sweep = now + self.sweep_interval
+        full = [
+            key
+            for key, slot in self._slots.items()
+            if self._levels[slot] + (now - self._stamps[slot]) * self.rate >= self.burst
+        ]
+        for key in full:
+            self._free.append(self._slots.pop(key))
+        return len(full)
+
+    def memory_bytes(self) -> int:
+        return self._levels.itemsize * len(self._levels) + self._stamps.itemsize * len(self._stamps)
+
+
+class Throttle:
+    def __init__(
+        self,
+        rate: float = 1.0,
+        burst: float = 8.0,
+        costs: Optional[Dict[str, float]] = None,
+        default_cost: float = 1.0,
+    ):
+        self.buckets = TokenBuckets(rate, burst)
+        self.costs = {**DEFAULT_COSTS, **(costs or {})}
+        self.default_cost = default_cost
+        self.allowed = 0
+        # keyed by known prefixes only, callback data is user controlled
+        self.throttled: Counter = Counter()
+
+    def kind(self, callback_data: Optional[str]) -> str:
+        if callback_data is None:
+            return "message"
+        prefix = callback_data.split(":", 1)[0]
+        return prefix if prefix in self.costs else "other"
+
+    def allow(self, user_id: int, kind: str) -> bool:
+        if self.buckets.take(user_id, self.costs.get(kind, self.default_cost)):
+            self.allowed += 1
+            return True
+        self.throttled[kind] += 1
+        if sum(self.throttled.values()) % 1000 == 1:
+            logger.info(f"throttle: {self.stats()}")
+        return False
+
+    def stats(self) -> dict:
+        return {
+            "allowed": self.allowed,
+            "throttled": dict(self.throttled),
+            "users": len(self.buckets),
+            "memory_bytes": self.buckets.memory_bytes(),
+            "rate": self.buckets.rate,
+            "burst": self.buckets.burst,
+        }
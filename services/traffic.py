@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional, Sequence, Tuple
+
+import database.req as rq
+from config.templates import templates
+from database.partitions import month_start
+
+logger = logging.getLogger(__name__)
+
+CHART_DAYS = 14
+CHART_WIDTH = 12
+_EIGHTHS = " ▏▎▍▌▋▊▉"
+
+
+def _bar(value: int, peak: int) -> str:
+    eighths = round(value * CHART_WIDTH * 8 / peak) if peak else 0
+    full, rest = divmod(eighths, 8)
+    return ("█" * full + (_EIGHTHS[rest] if rest else "")).ljust(CHART_WIDTH)
+
+
+def usage_chart(
+    lang: Optional[str],
+    rows: Sequence[Tuple[date, int]],
+    today: Optional[date] = None,
+    days: int = CHART_DAYS,
+) -> str:
+    # rows are (day, bytes) from traffic_daily, days without a row had no traffic
+    if not rows:
+        return templates.render("usage_chart_empty", lang)
+    today = today or datetime.now(timezone.utc).date()
+    used = dict(rows)
+    span = [today - timedelta(days=i) for i in range(days - 1, -1, -1)]
+    peak = max(used.get(d, 0) for d in span)
+    lines = [
+        f"{d:%d.%m} {_bar(used.get(d, 0), peak)} {used.get(d, 0) / 1024**3:6.2f}" for d in span
+    ]
+    total = sum(used.get(d, 0) for d in span)
+    return templates.render(
+        "usage_chart",
+        lang,
+        chart="\n".join(lines),
+        total_gb=f"{total / 1024**3:.2f}",
+    )
+
+
+class TrafficSync:
+    # Pages through every panel user and samples the byte counters, so traffic
+    # history no longer depends on someone opening show_sub. Once a day the raw
+    # samples past raw_days are thinned to hourly and months past retention dropped.
+    def __init__(
+        self,
+        remnawave,
+        interval: float = 900.0,
+        page_size: int = 500,
+        raw_days: int = 7,
+        retention_months: int = 13,
+    ):
+        self.remnawave = remnawave
+        self.interval = interval
+        self.page_size = page_size
+        self.raw_days = raw_days
+        self.retention_months = retention_months
+        self._stop = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._next_maintenance = 0.0
+
+    def start(self) -> asyncio.Task:
+        self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        self._stop.set()
+        if self._task:
+            await self._task
+
+    async def run(self):
+        while not self._stop.is_set():
+            try:
+                await self.sync()
+                if time.time() >= self._next_maintenance:
+                    await self.maintain()
+                    self._next_maintenance = time.time() + 86400
+            except Exception as e:
+                logger.exception(f"traffic sync failed: {e}")
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def sync(self) -> int:
+        started = time.perf_counter()
+        at = datetime.now(timezone.utc)
+        start = written = 0
+        while not self._stop.is_set():
+            page = await self.remnawave.users.get_all_users_v2(start=start, size=self.page_size)
+            counters = {u.subscription_url: int(u.used_traffic_bytes) for u in page.users}
+            if counters:
+                written += await rq.TrafficRequests.record(counters, at)
+            start += len(page.users)
+            if not page.users or start >= page.total:
+                break
+        logger.info(
+            f"traffic sync: {start} panel users, {written} samples written "
+            f"in {time.perf_counter() - started:.2f}s"
+        )
+        return written
+
+    async def maintain(self):
+        now = datetime.now(timezone.utc)
+        cutoff = (now - timedelta(days=self.raw_days)).replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+        # a few days back as well, a missed run is caught up the next day
+        thinned = 0
+        for days_back in range(3, 0, -1):
+            day = cutoff - timedelta(days=days_back)
+            thinned += await rq.TrafficRequests.downsample(day, day + timedelta(days=1))
+        keep_from = month_start(now)
+        for _ in range(self.retention_months):
+            keep_from = month_start(keep_from - timedelta(days=1))
+        purged = await rq.TrafficRequests.purge(keep_from)
+        logger.info(
+            f"traffic maintenance: {thinned} samples thinned, "
+            f"{purged} purged before {keep_from:%Y-%m}"
+        )
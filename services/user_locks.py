@@ -0,0 +1,62 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, Hashable, Optional, Set
+
+
+class _Entry:
+    __slots__ = ("lock", "users", "pending")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        # tasks holding or waiting for the lock, the entry goes away at zero
+        self.users = 0
+        # fingerprints of updates running or queued, for dropping repeats
+        self.pending: Set[Hashable] = set()
+
+
+class UserLocks:
+    # One lock per user that exists only while that user has updates in flight,
+    # so idle users cost nothing and different users never wait on each other.
+    def __init__(self):
+        self._entries: Dict[int, _Entry] = {}
+        self.duplicates = 0
+        self.waited = 0
+        self.peak = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def busy(self, user_id: int, fingerprint: Optional[Hashable]) -> bool:
+        entry = self._entries.get(user_id)
+        if entry is None or fingerprint is None or fingerprint not in entry.pending:
+            return False
+        self.duplicates += 1
+        return True
+
+    @asynccontextmanager
+    async def hold(self, user_id: int, fingerprint: Optional[Hashable] = None):
+        entry = self._entries.get(user_id)
+        if entry is None:
+            entry = self._entries[user_id] = _Entry()
+            self.peak = max(self.peak, len(self._entries))
+        entry.users += 1
+        if fingerprint is not None:
+            entry.pending.add(fingerprint)
+        try:
+            if entry.lock.locked():
+                self.waited += 1
+            async with entry.lock:
+                yield
+        finally:
+            entry.pending.discard(fingerprint)
+            entry.users -= 1
+            if not entry.users:
+                del self._entries[user_id]
+
+    def stats(self) -> dict:
+        return {
+            "active_users": len(self._entries),
+            "peak_users": self.peak,
+            "duplicates_dropped": self.duplicates,
+            "waited": self.waited,
+        }
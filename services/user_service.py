@@ -3,27 +3,38 @@ import database.req as rq
 import base58
 from config.dotenv import RateConfig
 from decimal import Decimal
+from sqlalchemy.exc import IntegrityError
+from services.outbox import create_subscription, send_message
 
 logger = logging.getLogger(__name__)
 
 
 class UserService:
-    def __init__(self):
+    def __init__(self, known_users=None):
         self.client = rq.UserRequests()
+        self.known_users = known_users
 
-    async def create_or_get_user(self, name, telegram_id, userlang, username=None):
-
-        usr = await self.client.get_user_by_telegram_id(telegram_id)
-        if usr:
-            logger.info("user found in db,returning...")
-            return False, usr
-        else:
-            logger.info("user not found!creating...")
-            usr = await self.client.create_user(
-                username=username, name=name, telegram_id=telegram_id, locale=userlang
-            )
+    async def create_or_get_user(
+        self, name, telegram_id, userlang, username=None, fetch=True
+    ):
+        known = self.known_users
+        if known is not None and known.is_unchanged(telegram_id, username, name, userlang):
+            # registered and nothing to refresh, no database round trip
+            if not fetch:
+                return False, None
+            return False, await self.client.get_user_by_telegram_id(telegram_id)
+        created, usr = await self.client.upsert_user(
+            telegram_id=telegram_id,
+            username=username,
+            name=name,
+            locale=userlang,
+            fetch=fetch,
+        )
+        if known is not None:
+            known.add(telegram_id, username, name, userlang)
+        if created:
             logger.info(f"user created!tgid={telegram_id}")
-            return True, usr
+        return created, usr
 
 
 class ReferralService:
@@ -31,7 +42,7 @@ class ReferralService:
         self.ref = rq.ReferralLinkRequests()
 
     async def create_or_get_referral(
-        self, cryptid, bot, user_id, user_tgid, full_name, locale, username=None
+        self, cryptid, user_id, user_tgid, full_name, locale, username=None, outbox=None
     ):
 
         owner_tgid = base58.b58decode_int(cryptid)
@@ -42,13 +53,6 @@ class ReferralService:
         if user:
             return user
         else:
-            refuser = await self.ref.create_referral(
-                owner_id=owner_id,
-                user_id=user_id,
-                user_tgid=user_tgid,
-                user_full_name=full_name,
-            )
-
             if username:
                 ans = (
                     f"{locale.get('referral_connected')}\n• {full_name}\n• @{username}"
@@ -56,44 +60,57 @@ class ReferralService:
             else:
                 ans = f"{locale.get('referral_connected')}\n• {full_name}"
 
+            refuser = await self.ref.create_referral(
+                owner_id=owner_id,
+                user_id=user_id,
+                user_tgid=user_tgid,
+                user_full_name=full_name,
+                outbox=[send_message(owner_tgid, ans)],
+            )
+            if outbox:
+                outbox.wake()
+
             logger.info(f"referral created!from:{owner_tgid},ref:{user_tgid}")
-            await bot.send_message(chat_id=owner_tgid, text=f"{ans}")
             return refuser
 
 
+PAY_QUEUED = "queued"
+PAY_BUSY = "busy"
+PAY_NO_FUNDS = "no_funds"
+
+
 class PaymentService:
-    def __init__(self):
+    def __init__(self, outbox=None):
         self.user_requests = rq.UserRequests()
-        self.sublink_requests = rq.SublinkRequests()
         self.rateConfig = RateConfig()
+        self.outbox = outbox
 
-    async def service_pay_rate(
-        self,
-        tgid,
-        callbackdata,
-    ):
-        rate_number = callbackdata.split(":")[1]
-        months = callbackdata.split(":")[2]
+    async def service_pay_rate(self, tgid, rate_number: int, months: int, message_id=None):
         usr = await self.user_requests.get_user_by_telegram_id(tgid)
         rate_data = self.rateConfig.get_rate_by_number(rate_number)
         value = Decimal(str(rate_data["value"]))
         limit = int(rate_data["limit"])
         limit_bytes = limit * 1024**3
-        if usr.balance >= value:
-            await self.user_requests.update_user(
-                user_id=usr.id, balance=usr.balance - value
-            )
-            sub = await self.sublink_requests.create_user(tgid, months, limit_bytes)
-            await self.sublink_requests.create_sublink(
-                link=sub.subscription_url,
-                expires_at=sub.expire_at,
-                username=sub.username,
-                user_id=usr.id,
-                limit_gb=sub.traffic_limit_bytes / 1024**3,
-                status=sub.status,
-            )
-            logger.info(f"sublink created:{sub.subscription_url}")
-            return True, usr.balance - value
-
-        else:
-            return False, usr.balance
+        # the panel user and sublink are created by the outbox worker, a failed
+        # provisioning refunds the balance in the same transaction that gives up
+        job = create_subscription(
+            usr.id,
+            tgid,
+            months,
+            limit_bytes,
+            value,
+            usr.locale,
+            message_id=message_id,
+            rate=rate_number,
+        )
+        try:
+            balance = await self.user_requests.debit_balance(usr.id, value, outbox=[job])
+        except IntegrityError:
+            # uq_outbox_active_provisioning: a previous purchase is still in flight
+            return PAY_BUSY, usr.balance
+        if balance is None:
+            return PAY_NO_FUNDS, usr.balance
+        if self.outbox:
+            self.outbox.wake()
+        logger.info(f"subscription queued for tgid={tgid}, rate={rate_number}")
+        return PAY_QUEUED, balance
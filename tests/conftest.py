@@ -0,0 +1,8 @@
+import os
+import tempfile
+
+# database.db builds its engine from the environment at import time
+os.environ.setdefault(
+    "DATABASE_URL",
+    f"sqlite+aiosqlite:///{os.path.join(tempfile.gettempdir(), 'shop_tests.sqlite3')}",
+)
@@ -0,0 +1,42 @@
+import pytest
+import pytest_asyncio
+from sqlalchemy import select
+
+import benchmarks.harness  # noqa: F401  sets the rest of the environment
+from database.db import Base, User, engine, get_session
+from services.importer import Importer
+
+
+def _rows(bad: int, good: int):
+    for i in range(bad):
+        yield {"telegram_id": "", "username": f"bad{i}"}
+    for i in range(good):
+        yield {"telegram_id": str(20_000_000 + i), "username": f"good{i}", "balance": "1.50"}
+
+
+def test_fully_rejected_slice_does_not_end_batches():
+    importer = Importer(batch_size=3)
+    batches = list(importer._batches("users", _rows(bad=6, good=4)))
+    assert [len(b) for b in batches] == [3, 1]
+    assert batches[0][0][0] == 7
+    assert importer.rejected == 6
+
+
+@pytest_asyncio.fixture
+async def database():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    try:
+        yield
+    finally:
+        await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_import_continues_after_rejected_slice(database):
+    counts = await Importer(batch_size=5).run("users", _rows(bad=10, good=7))
+    assert counts["rejected"] == 10
+    async with get_session() as session:
+        imported = (await session.execute(select(User.username))).scalars().all()
+    assert sorted(imported) == sorted(f"good{i}" for i in range(7))
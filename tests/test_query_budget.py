@@ -0,0 +1,48 @@
+import pytest
+import pytest_asyncio
+
+from benchmarks.fakes import StubRemnawave, fake_bot
+from benchmarks.harness import SUBS_PER_USER, UpdateFactory, build_dispatcher, prepare_database
+from database.db import engine
+from database.profiler import QueryBudgetExceeded, QueryProfiler
+
+TELEGRAM_ID = 10_000_000
+
+
+@pytest.fixture(scope="module")
+def profiled():
+    # user_router can only be attached once per process
+    profiler = QueryProfiler()
+    profiler.install(engine)
+    remnawave = StubRemnawave()
+    yield build_dispatcher(None, remnawave, None, profiler=profiler), remnawave, profiler
+    profiler.uninstall()
+
+
+@pytest_asyncio.fixture
+async def shop(profiled):
+    dp, remnawave, profiler = profiled
+    bot = fake_bot()
+    dp.workflow_data["bot"] = bot
+    try:
+        await prepare_database(1, remnawave)
+        yield dp, bot, UpdateFactory(bot.id), profiler
+    finally:
+        await bot.session.close()
+        await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_show_sub_within_budget(shop):
+    dp, bot, updates, profiler = shop
+    with profiler.budget(max_queries=10, max_repeats=SUBS_PER_USER, label="show_sub") as stats:
+        await dp.feed_update(bot, updates.callback(TELEGRAM_ID, "show_sub"))
+    assert stats.count > 0
+
+
+@pytest.mark.asyncio
+async def test_show_sub_over_budget_raises(shop):
+    dp, bot, updates, profiler = shop
+    with pytest.raises(QueryBudgetExceeded, match="show_sub"):
+        with profiler.budget(max_queries=2, label="show_sub"):
+            await dp.feed_update(bot, updates.callback(TELEGRAM_ID, "show_sub"))